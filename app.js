@@ -82,6 +82,39 @@ async function apiCall(endpoint, method = "GET", data = null) {
   }
 }
 
+// Live updates: reload on change feed events, fall back to 2-second polling when the feed is unavailable
+function startRequestUpdates(onChange) {
+  let pollTimer = null
+  const startPolling = () => {
+    if (!pollTimer) pollTimer = setInterval(onChange, 2000)
+  }
+
+  if (typeof EventSource === "undefined") {
+    startPolling()
+    return
+  }
+
+  // The feed runs on its own server; the API says where, or gives no url when it is off
+  apiCall("/requests/feed").then((feed) => {
+    if (!feed.url) {
+      startPolling()
+      return
+    }
+
+    const source = new EventSource(feed.url, { withCredentials: true })
+    source.addEventListener("request", () => onChange())
+    source.onopen = () => {
+      if (pollTimer) {
+        clearInterval(pollTimer)
+        pollTimer = null
+      }
+      // Catch up on anything missed while disconnected
+      onChange()
+    }
+    source.onerror = () => startPolling()
+  })
+}
+
 // Offline fallback operations
 function handleOfflineOperation(endpoint, method, data) {
   switch (endpoint) {
@@ -311,7 +344,7 @@ function initParentDashboard() {
   loadParentRequests()
 
   // Set up auto-refresh
-  setInterval(loadParentRequests, 2000)
+  startRequestUpdates(loadParentRequests)
 }
 
 function renderChildren() {
@@ -500,7 +533,7 @@ function initAdminDashboard() {
   loadAdminRequests()
 
   // Set up auto-refresh
-  setInterval(loadAdminRequests, 2000)
+  startRequestUpdates(loadAdminRequests)
 }
 
 async function loadAdminRequests() {
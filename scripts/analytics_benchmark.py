@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+KidCheck Analytics Benchmark
+Times and memory-profiles each data_analytics.py stage on synthetic databases of increasing size
+
+    python scripts/analytics_benchmark.py --scales 10k,1m,10m --save reports/benchmark.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+import columnar_export
+import data_analytics as analytics
+from synthetic_data import format_scale, generate, parse_scale
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# The in-memory pipeline main() runs by default, then the bounded-memory alternatives
+PANDAS_STAGES = ['get_data', 'generate_summary_stats', 'aggregates_from_frame', 'create_visualizations',
+                 'export_raw_data']
+DATABASE_STAGES = ['stream_aggregates', 'sql_aggregates', 'export_raw_data_chunked', 'export_columnar_data']
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemory:
+    """Samples RSS on a background thread while a stage runs; peak is relative to the start"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+        return False
+
+    @property
+    def peak_mb(self) -> float:
+        return round((self.peak - self.start) / 2 ** 20, 1)
+
+
+def measure(results: Dict, name, fn: Callable, *args):
+    """Run one stage with its output silenced; records seconds and peak extra RSS"""
+    with PeakMemory() as memory, contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        try:
+            value = fn(*args)
+            error = None
+        except Exception as e:
+            value, error = None, f'{type(e).__name__}: {e}'
+        elapsed = time.perf_counter() - started
+    results[name] = {'seconds': round(elapsed, 3), 'peak_mb': memory.peak_mb, 'rss_mb': round(rss_bytes() / 2 ** 20, 1)}
+    if error:
+        results[name]['error'] = error
+    return value
+
+
+def run_stages(database, reports_dir, rows, pandas_limit, workers, chunksize) -> Dict:
+    """Every stage against one database, in this (fresh) process"""
+    analytics.DATABASE = str(database)
+    analytics.REPORTS_DIR = Path(reports_dir)
+    analytics.REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    results: Dict[str, Dict] = {}
+
+    if rows <= pandas_limit:
+        frames = measure(results, 'get_data', analytics.get_data)
+        if frames is not None:
+            measure(results, 'generate_summary_stats', analytics.generate_summary_stats, *frames)
+            aggregates = measure(results, 'aggregates_from_frame', analytics.RequestAggregates.from_frame, frames[0])
+            if aggregates is not None:
+                measure(results, 'create_visualizations', analytics.create_visualizations, aggregates, 'png',
+                        analytics.dashboard.DEFAULT_DPI, workers)
+            measure(results, 'export_raw_data', analytics.export_raw_data, *frames)
+            del frames, aggregates
+    else:
+        for name in PANDAS_STAGES:
+            results[name] = {'skipped': f'more than --pandas-limit {pandas_limit} rows'}
+
+    conn = analytics.connect(str(database))
+    try:
+        measure(results, 'stream_aggregates', analytics.stream_aggregates, conn, chunksize)
+        measure(results, 'sql_aggregates', analytics.sql_aggregates, conn)
+        measure(results, 'export_raw_data_chunked', analytics.export_raw_data_chunked, conn, chunksize)
+    finally:
+        conn.close()
+    if columnar_export.available():
+        measure(results, 'export_columnar_data', analytics.export_columnar_data, 'parquet', chunksize)
+    else:
+        results['export_columnar_data'] = {'skipped': 'pyarrow is not installed'}
+    return results
+
+
+def _stage_worker(queue, *args):
+    try:
+        queue.put(run_stages(*args))
+    except BaseException as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def benchmark_scale(database, reports_dir, rows, pandas_limit, workers, chunksize) -> Dict:
+    """run_stages in a spawned process, so each scale starts from a clean heap"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_stage_worker,
+                              args=(queue, str(database), str(reports_dir), rows, pandas_limit, workers, chunksize))
+    process.start()
+    try:
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except Exception:
+                if not process.is_alive():
+                    # Usually the kernel's OOM killer
+                    return {'error': f'benchmark process exited with {process.exitcode}'}
+    finally:
+        process.join()
+
+
+def format_cell(result) -> str:
+    if not result:
+        return ''
+    if 'skipped' in result:
+        return 'skipped'
+    if 'error' in result:
+        return 'failed'
+    return f"{result['seconds']:.2f}s / {result['peak_mb']:.0f} MB"
+
+
+def print_table(report: Dict):
+    scales = list(report['scales'])
+    stages = ['generate'] + PANDAS_STAGES + DATABASE_STAGES
+    width = max(len(stage) for stage in stages) + 2
+    print(f"{'stage':<{width}}" + ''.join(f'{scale:>22}' for scale in scales))
+    print('-' * (width + 22 * len(scales)))
+    for stage in stages:
+        cells = [format_cell(report['scales'][scale]['stages'].get(stage)) for scale in scales]
+        if any(cells):
+            print(f'{stage:<{width}}' + ''.join(f'{cell:>22}' for cell in cells))
+    print("(seconds / peak RSS above the stage's starting RSS; chart worker processes are not included)")
+    for scale in scales:
+        for stage, result in report['scales'][scale]['stages'].items():
+            if 'error' in result:
+                print(f"❌ {scale} {stage}: {result['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the analytics pipeline')
+    parser.add_argument('--scales', default='10k,1m,10m', help='comma-separated request counts, e.g. 10k,1m,10m')
+    parser.add_argument('--data-dir', type=Path, default=Path('benchmark_data'),
+                        help='where generated databases are kept and reused between runs')
+    parser.add_argument('--reports-dir', type=Path, default=Path('reports') / 'benchmark',
+                        help='where the benchmarked stages write their reports')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild databases even if they exist')
+    parser.add_argument('--days', type=int, default=180, help='days of synthetic history')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--pandas-limit', type=int, default=2000000,
+                        help='skip the whole-table pandas stages above this many requests')
+    parser.add_argument('--chunksize', type=int, default=analytics.DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, default=None, help='chart rendering processes')
+    parser.add_argument('--save', type=Path, help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+    report = {'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'cpu_count': os.cpu_count(), 'scales': {}}
+    for rows in [parse_scale(scale) for scale in args.scales.split(',')]:
+        label = format_scale(rows)
+        database = args.data_dir / f'kidcheck-{label}-days{args.days}-seed{args.seed}.db'
+        stages: Dict[str, Dict] = {}
+        if args.regenerate and database.exists():
+            database.unlink()
+        if not database.exists():
+            print(f"🌱 Generating {label} requests in {database}...")
+            with PeakMemory() as memory:
+                counts = generate(database, rows, days=args.days, seed=args.seed)
+            stages['generate'] = {'seconds': counts['seconds'], 'peak_mb': memory.peak_mb}
+
+        print(f"⏱️  Benchmarking {label}...")
+        measured = benchmark_scale(database, args.reports_dir / label, rows, args.pandas_limit, args.workers,
+                                   args.chunksize)
+        if 'error' in measured and len(measured) == 1:
+            stages['run'] = measured
+        else:
+            stages.update(measured)
+        report['scales'][label] = {'rows': rows, 'database_mb': round(database.stat().st_size / 2 ** 20, 1),
+                                   'stages': stages}
+
+    print_table(report)
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
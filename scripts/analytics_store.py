@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+KidCheck Analytics Store
+Side database of per-day request aggregates and the change-version watermark for incremental analytics
+"""
+
+import json
+import sqlite3
+from typing import Dict, Iterable, Optional, Set
+
+# Bump when the serialized day format changes; a mismatch forces a full rebuild
+STORE_FORMAT = 1
+
+
+class AnalyticsStore:
+    """Per-day aggregates keyed by request creation date, plus the request id -> day map
+
+    The id map lets an update or delete be traced back to the day whose
+    aggregate has to be recomputed, even after the row itself is gone.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS analytics_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS analytics_days (
+                day TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS analytics_request_days (
+                request_id INTEGER PRIMARY KEY,
+                day TEXT NOT NULL
+            );
+        ''')
+        if self.get_state('format') != str(STORE_FORMAT):
+            self.reset()
+
+    def get_state(self, key) -> Optional[str]:
+        row = self.conn.execute('SELECT value FROM analytics_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        self.conn.execute('''
+            INSERT INTO analytics_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (key, None if value is None else str(value)))
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """Highest requests.version already folded into the store; None before the first build"""
+        value = self.get_state('watermark')
+        return int(value) if value is not None else None
+
+    def reset(self):
+        """Forget everything so the next run rebuilds from scratch"""
+        self.conn.execute('DELETE FROM analytics_days')
+        self.conn.execute('DELETE FROM analytics_request_days')
+        self.conn.execute('DELETE FROM analytics_state')
+        self.set_state('format', STORE_FORMAT)
+        self.conn.commit()
+
+    def load_days(self) -> Dict[str, Dict]:
+        cursor = self.conn.execute('SELECT day, data FROM analytics_days ORDER BY day')
+        return {day: json.loads(data) for day, data in cursor}
+
+    def save_day(self, day, data):
+        self.conn.execute('''
+            INSERT INTO analytics_days (day, data) VALUES (?, ?)
+            ON CONFLICT(day) DO UPDATE SET data = excluded.data
+        ''', (day, json.dumps(data)))
+
+    def delete_day(self, day):
+        self.conn.execute('DELETE FROM analytics_days WHERE day = ?', (day,))
+
+    def days_for(self, request_ids: Iterable[int]) -> Set[str]:
+        """Days the store last filed these requests under"""
+        days = set()
+        ids = list(request_ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            cursor = self.conn.execute(
+                f'SELECT DISTINCT day FROM analytics_request_days WHERE request_id IN ({placeholders})', batch)
+            days.update(day for (day,) in cursor)
+        return days
+
+    def track(self, rows):
+        """Record (request_id, day) pairs for requests seen in this run"""
+        self.conn.executemany('''
+            INSERT INTO analytics_request_days (request_id, day) VALUES (?, ?)
+            ON CONFLICT(request_id) DO UPDATE SET day = excluded.day
+        ''', rows)
+
+    def forget(self, request_ids: Iterable[int]):
+        self.conn.executemany('DELETE FROM analytics_request_days WHERE request_id = ?',
+                              [(request_id,) for request_id in request_ids])
+
+    def commit(self, watermark):
+        """Persist the day aggregates together with the version they are current to"""
+        self.set_state('watermark', watermark)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+KidCheck Request Archive
+Moves resolved requests out of the live table into request_archive on a schedule
+
+    python scripts/archive.py [sqlite PATH | postgres DSN] [--after-days 90] [--batch-size 500]
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+# Default age, by last update, at which resolved requests leave the live table
+DEFAULT_AFTER_DAYS = 90
+
+
+def include_archive(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Make `requests` on a SQLite connection read the live and archived requests together
+
+    A TEMP view named requests shadows main.requests for unqualified names,
+    so reporting queries see both tiers without changes. Only for reads:
+    writes through the view fail. A no-op before the archive migration.
+    """
+    archived = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'request_archive'"
+    ).fetchone()
+    if archived:
+        columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(requests)'))
+        conn.execute(f'''
+            CREATE TEMP VIEW IF NOT EXISTS requests AS
+            SELECT {columns} FROM main.requests
+            UNION ALL
+            SELECT {columns} FROM main.request_archive
+        ''')
+    return conn
+
+
+class Archiver:
+    """Background thread archiving every storage's resolved requests once per interval
+
+    Each gunicorn worker runs its own; batches are serialized by the SQLite
+    write lock or a PostgreSQL advisory lock, so a worker that finds nothing
+    left to move costs one indexed query. The first run is jittered so
+    workers started together do not all archive at once.
+    """
+
+    def __init__(self, storages: Callable[[], Iterable], after_days=DEFAULT_AFTER_DAYS, batch_size=500,
+                 interval=3600.0, max_batches=None):
+        self.storages = storages
+        self.after_days = float(after_days)
+        self.batch_size = int(batch_size)
+        self.interval = float(interval)
+        self.max_batches = max_batches
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'runs': 0, 'archived': 0, 'errors': 0, 'last_run': None, 'last_error': None}
+
+    def run_once(self) -> int:
+        """Archive everything that is due in every storage; returns the number of requests moved"""
+        moved = 0
+        for storage in self.storages():
+            try:
+                count = storage.archive_requests(self.after_days, self.batch_size, self.max_batches)
+            except Exception as e:
+                self._stats['errors'] += 1
+                self._stats['last_error'] = str(e)
+                print(f"⚠️  Archiving failed: {e}")
+                continue
+            if count:
+                print(f"🧊 Archived {count} resolved requests ({getattr(storage, 'database', storage.backend)})")
+            moved += count
+        self._stats['runs'] += 1
+        self._stats['archived'] += moved
+        self._stats['last_run'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        return moved
+
+    def _run(self):
+        delay = random.uniform(0, min(self.interval, 60.0))
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='kidcheck-archiver', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        snapshot = dict(self._stats)
+        snapshot['after_days'] = self.after_days
+        snapshot['running'] = self._thread is not None and self._thread.is_alive()
+        return snapshot
+
+
+def archiver_from_env(storages: Callable[[], Iterable]) -> Optional[Archiver]:
+    """Archiver unless ARCHIVE_AFTER_DAYS=0"""
+    after_days = float(os.environ.get('ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS))
+    if after_days <= 0:
+        return None
+    return Archiver(
+        storages,
+        after_days=after_days,
+        batch_size=int(os.environ.get('ARCHIVE_BATCH_SIZE', 500)),
+        interval=float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600)),
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from storage import PostgresStorage, sqlite_storage
+
+    parser = argparse.ArgumentParser(description='Archive resolved requests out of the live table')
+    parser.add_argument('backend', nargs='?', default='sqlite', choices=['sqlite', 'postgres'])
+    parser.add_argument('target', nargs='?', default='kidcheck.db', help='SQLite file or PostgreSQL DSN')
+    parser.add_argument('--after-days', type=float,
+                        default=float(os.environ.get('ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)))
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('ARCHIVE_BATCH_SIZE', 500)))
+    args = parser.parse_args()
+
+    storage = PostgresStorage(args.target) if args.backend == 'postgres' else sqlite_storage(args.target)
+    try:
+        storage.migrate()
+        started = time.perf_counter()
+        moved = storage.archive_requests(args.after_days, args.batch_size)
+        stats = storage.archive_stats()
+    finally:
+        storage.close()
+    print(f"🧊 Archived {moved} requests resolved over {args.after_days:g} days ago "
+          f"in {time.perf_counter() - started:.1f}s: {stats['live']} live, {stats['archived']} archived")
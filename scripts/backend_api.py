@@ -4,111 +4,270 @@ KidCheck Backend API Server
 A Python Flask server to handle authentication and request management
 """
 
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, g, has_request_context, stream_with_context
 from flask_cors import CORS
 import json
 import os
 from datetime import datetime, timedelta
 import hashlib
 import secrets
+import binascii
 from typing import Dict, List, Optional
-import sqlite3
+import threading
 from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from db_pool import pool_stats
+from storage import (ARCHIVE_MODES, INSERT_REQUEST_SQL, PARENT_COLUMNS, REQUEST_COLUMNS, Storage,
+                     decode_page_cursor, sqlite_storage, storage_from_env)
+from sessions import session_interface_from_env
+from ttl_cache import TTLCache
+from passwords import HasherBusy, hasher_from_env
+from write_queue import InsertQueue
+from change_feed import AllowedOrigins, ChangeBus, STREAM_PATH, start_stream_server
+from sharding import UnknownSchool, normalize_school, router_from_env
+from metrics import metrics_from_env, phase
+from json_stream import json_backend, stream_object
+from compression import compressor_from_env
+from archive import archiver_from_env
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
 CORS(app)
 
+# Per-route and per-query latency histograms served at /api/metrics; with
+# METRICS_ENABLED=false no hooks are installed and connections are not wrapped
+api_metrics = metrics_from_env()
+if api_metrics is not None:
+    api_metrics.install(app)
+    Storage.query_observer = api_metrics
+# Bearer token a scraper sends to /api/metrics; without one only admin sessions can read it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# brotli/gzip for clients that accept it, on responses of COMPRESSION_MIN_SIZE bytes or more.
+# Installed after metrics so the response size histogram sees the compressed size.
+response_compressor = compressor_from_env()
+if response_compressor is not None:
+    response_compressor.install(app)
+
 # Database setup
 DATABASE = 'kidcheck.db'
 
+# Sessions live server-side (SESSION_STORE=sqlite or redis) so restarts and extra worker
+# processes keep users logged in; SESSION_STORE=cookie keeps Flask's signed cookies.
+# SQLite sessions sit next to the main database.
+session_interface = session_interface_from_env(os.path.join(os.path.dirname(DATABASE), 'kidcheck_sessions.db'))
+if session_interface is not None:
+    app.session_interface = session_interface
+
+# Optional per-school sharding: SHARDS_DIR holds one database per school plus the
+# account directory. Sessions carry their school; DEFAULT_SCHOOL covers clients
+# that never send one.
+shard_router = router_from_env()
+DEFAULT_SCHOOL = os.environ.get('DEFAULT_SCHOOL')
+
+# STORAGE_BACKEND=postgres keeps everything in one PostgreSQL database at DATABASE_URL;
+# otherwise each SQLite file (the single database or a school's shard) has its own storage
+shared_storage = storage_from_env()
+if shared_storage is not None and shard_router is not None:
+    raise RuntimeError('SHARDS_DIR is only supported with STORAGE_BACKEND=sqlite')
+
+# Deletes stay visible to ?since= pollers for this long; older cursors get a full resync
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 7))
+
+# Upper bound for ?limit= on the request listing
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+# Unpaged listings are streamed from the cursor in batches of this many rows, encoded
+# with orjson when it is installed (JSON_BACKEND=json forces the standard library)
+STREAM_BATCH_ROWS = int(os.environ.get('STREAM_BATCH_ROWS', 500))
+JSON_BACKEND = json_backend()
+
+# KDF work runs on a bounded pool; KDF_TARGET_MS calibrates the cost on this host
+password_hasher = hasher_from_env()
+
+# Stored for unknown accounts so a failed login costs the same as a wrong password
+DUMMY_PASSWORD_HASH = password_hasher.hash(secrets.token_hex(16))
+
+# Upper bound on items in one bulk create/update call
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 500))
+
+# Optional write-behind mode: POST /api/requests inserts are group-committed by one writer
+# thread. Only SQLite needs it; PostgreSQL writers do not share a database-wide lock.
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'False').lower() == 'true'
+# One writer per database file, since each shard has its own write lock
+request_insert_queues: Dict[str, InsertQueue] = {}
+request_insert_queues_lock = threading.Lock()
+
+# Dashboard aggregates are cached briefly and dropped on every request write
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 10))
+analytics_cache = TTLCache(ttl=ANALYTICS_CACHE_TTL, max_entries=1024)
+
+# Change feed: routes publish here, the asyncio SSE server fans out to open streams
+change_bus = ChangeBus()
+STREAM_PORT = int(os.environ.get('STREAM_PORT', int(os.environ.get('PORT', 5000)) + 1))
+# The feed URL handed to browsers, e.g. /api/requests/stream when a proxy serves it on the page's origin;
+# default: STREAM_PORT on the host the API was reached at
+STREAM_PUBLIC_URL = os.environ.get('STREAM_PUBLIC_URL', '')
+# Pages allowed to open the stream with the user's cookie, comma-separated; default: the API's own origin
+STREAM_ALLOWED_ORIGINS = AllowedOrigins(os.environ.get('STREAM_ALLOWED_ORIGINS', '').split(','),
+                                        app_port=int(os.environ.get('PORT', 5000)))
+
+def all_storages():
+    """Every storage this process serves: the shared one, the single database, or each school's shard"""
+    if shared_storage is not None:
+        return [shared_storage]
+    if shard_router is None:
+        return [sqlite_storage(DATABASE)]
+    return [sqlite_storage(database) for _, database in sorted(shard_router.schools().items())]
+
+# Resolved requests older than ARCHIVE_AFTER_DAYS (0 disables) move to request_archive every
+# ARCHIVE_INTERVAL_SECONDS; listings read the archive only with ?archive=include or only
+archiver = archiver_from_env(all_storages)
+
 def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            password_hash TEXT NOT NULL,
-            user_type TEXT DEFAULT 'parent',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Children table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS children (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            parent_id INTEGER,
-            name TEXT NOT NULL,
-            grade TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (parent_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Requests table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            parent_id INTEGER,
-            child_name TEXT NOT NULL,
-            child_grade TEXT NOT NULL,
-            request_type TEXT NOT NULL,
-            request_message TEXT,
-            status TEXT DEFAULT 'pending',
-            feedback TEXT,
-            response_time TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (parent_id) REFERENCES users (id)
-        )
-    ''')
+    """Initialize the configured storage, or every school's shard when sharding is on"""
+    if shared_storage is not None:
+        init_storage(shared_storage)
+        return
+    if shard_router is None:
+        init_storage(sqlite_storage(DATABASE))
+        return
     
-    # Admin users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    if DEFAULT_SCHOOL:
+        shard_router.add_school(DEFAULT_SCHOOL)
+    for school, database in sorted(shard_router.schools().items()):
+        print(f"🏫 Initializing {school} ({database})")
+        init_storage(sqlite_storage(database))
+
+def init_storage(store):
+    """Bring the schema up to date, seed the default admin and prune old tombstones"""
+    for name in store.migrate():
+        print(f"🗄️  Applied migration {name}")
     
     # Insert default admin if not exists
-    cursor.execute('SELECT COUNT(*) FROM admins WHERE name = ?', ('admin',))
-    if cursor.fetchone()[0] == 0:
-        admin_password_hash = hashlib.sha256('123456'.encode()).hexdigest()
-        cursor.execute('''
-            INSERT INTO admins (name, password_hash) VALUES (?, ?)
-        ''', ('admin', admin_password_hash))
+    if store.find_admin('admin') is None:
+        store.create_admin('admin', hash_password('123456'))
     
-    conn.commit()
-    conn.close()
+    store.prune_tombstones(TOMBSTONE_RETENTION_DAYS)
 
 def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with the configured KDF on the hashing pool"""
+    return password_hasher.hash(password)
+
+def check_password(table, row, password):
+    """Verify a stored hash, transparently upgrading legacy or under-cost hashes"""
+    matches, needs_rehash = password_hasher.verify(password, row['password_hash'])
+    if matches and needs_rehash:
+        new_hash = hash_password(password)
+        get_storage().update_password_hash(table, row['id'], new_hash)
+        password_hasher.record_rehash()
+    return matches
+
+def current_school():
+    """School the request belongs to in sharded mode; None when unsharded"""
+    if shard_router is None:
+        return None
+    school = g.get('school') or session.get('school') or DEFAULT_SCHOOL
+    if not school:
+        raise UnknownSchool('No school selected')
+    return normalize_school(school)
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+def current_database():
+    """Database file for this request: the school's shard, or the single database"""
+    if shard_router is None:
+        return DATABASE
+    return shard_router.database_for(current_school())
+
+def get_storage():
+    """Storage for this request: PostgreSQL, the school's shard, or the single database"""
+    if shared_storage is not None:
+        return shared_storage
+    return sqlite_storage(current_database())
+
+def select_school(data, kind=None, login=None):
+    """Pin a login or registration to a school; returns an error response or None
+
+    An explicit "school" in the body wins, then the account directory, then
+    DEFAULT_SCHOOL.
+    """
+    if shard_router is None:
+        return None
+    school = data.get('school')
+    if not school and kind:
+        school = shard_router.school_for(kind, login)
+    school = school or DEFAULT_SCHOOL
+    if not school:
+        return jsonify({'error': 'Missing school'}), 400
+    try:
+        g.school = normalize_school(school)
+        shard_router.database_for(g.school)
+    except UnknownSchool as e:
+        return jsonify({'error': str(e)}), 400
+    return None
+
+def insert_queue_for(store, school=None):
+    """Write-behind queue for one SQLite database file, created on first use"""
+    queue = request_insert_queues.get(store.database)
+    if queue is None:
+        with request_insert_queues_lock:
+            queue = request_insert_queues.get(store.database)
+            if queue is None:
+                queue = InsertQueue(
+                    connect=store.pool.connect,
+                    sql=INSERT_REQUEST_SQL,
+                    max_batch=int(os.environ.get('WRITE_BEHIND_MAX_BATCH', 64)),
+                    max_delay_ms=float(os.environ.get('WRITE_BEHIND_MAX_DELAY_MS', 5)),
+                    on_commit=lambda conn, request_ids: notify_request_changes(store, 'created', request_ids, school),
+                )
+                request_insert_queues[store.database] = queue
+    return queue
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(exc):
+    """Shed login load instead of queueing unbounded KDF work"""
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    try:
+        current_schema = get_storage().schema_version()
+    except UnknownSchool:
+        # Sharded without a default school: there is no single database to report on
+        current_schema = None
+    
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'schema_version': current_schema,
+        'storage': shared_storage.backend if shared_storage is not None else 'sqlite',
+        'db_pool': get_storage().stats() if shard_router is None else pool_stats(),
+        'schools': len(shard_router.schools()) if shard_router is not None else None,
+        'change_feed': change_bus.stats(),
+        'analytics_cache': analytics_cache.stats(),
+        'sessions': session_interface.stats() if session_interface is not None else None,
+        'password_hasher': password_hasher.stats(),
+        'write_queue': {database: queue.stats() for database, queue in request_insert_queues.items()} if WRITE_BEHIND else None,
+        'archiver': archiver.stats() if archiver is not None else None
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request and query metrics in the Prometheus text format, for METRICS_TOKEN holders or admins"""
+    if api_metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    supplied = request.headers.get('Authorization', '')
+    scraper = bool(METRICS_TOKEN) and secrets.compare_digest(supplied.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+    if not scraper and session.get('user_type') != 'admin':
+        return jsonify({'error': 'Not authorized'}), 401
+    
+    return app.response_class(api_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register a new parent user"""
@@ -126,37 +285,41 @@ def register():
         if len(password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
         
-        conn = get_db_connection()
+        error = select_school(data)
+        if error:
+            return error
+        
+        store = get_storage()
         
         # Check if user already exists
-        existing_user = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
-        if existing_user:
-            conn.close()
+        if store.find_user(email):
             return jsonify({'error': 'User already exists'}), 409
         
-        # Create new user
+        # Hash without holding a pooled connection; the KDF is the slow part
         password_hash = hash_password(password)
-        cursor = conn.execute('''
-            INSERT INTO users (email, name, password_hash, user_type)
-            VALUES (?, ?, ?, ?)
-        ''', (email, name, password_hash, 'parent'))
         
-        user_id = cursor.lastrowid
+        # Emails are unique across the district, not just within one shard
+        if shard_router is not None and not shard_router.claim('parent', email, g.school):
+            return jsonify({'error': 'User already exists'}), 409
         
-        # Add child if provided
-        if child_name:
-            conn.execute('''
-                INSERT INTO children (parent_id, name, grade)
-                VALUES (?, ?, ?)
-            ''', (user_id, child_name, 'Not specified'))
+        try:
+            # Create new user, with their child if provided
+            user_id = store.create_parent(email, name, password_hash, child_name)
+        except Exception:
+            if shard_router is not None:
+                shard_router.release('parent', email)
+            raise
         
-        conn.commit()
-        conn.close()
+        # Parent count changed
+        analytics_cache.invalidate(('analytics', current_school()))
         
-        # Set session
+        # Set session, under a new id
+        regenerate_session()
         session['user_id'] = user_id
         session['user_type'] = 'parent'
         session['user_email'] = email
+        if shard_router is not None:
+            session['school'] = g.school
         
         return jsonify({
             'success': True,
@@ -169,6 +332,8 @@ def register():
             }
         })
         
+    except HasherBusy:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -184,21 +349,27 @@ def login():
         email = data['email'].lower().strip()
         password = data['password']
         
-        conn = get_db_connection()
-        user = conn.execute('''
-            SELECT id, email, name, password_hash, user_type
-            FROM users WHERE email = ?
-        ''', (email,)).fetchone()
+        error = select_school(data, 'parent', email)
+        if error:
+            return error
+        
+        user = get_storage().find_user(email)
         
-        conn.close()
+        # The KDF runs without holding a pooled connection
+        if not user:
+            password_hasher.verify(password, DUMMY_PASSWORD_HASH)
+            return jsonify({'error': 'Invalid email or password'}), 401
         
-        if not user or user['password_hash'] != hash_password(password):
+        if not check_password('users', user, password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Set session
+        # Set session, under a new id
+        regenerate_session()
         session['user_id'] = user['id']
         session['user_type'] = user['user_type']
         session['user_email'] = user['email']
+        if shard_router is not None:
+            session['school'] = g.school
         
         return jsonify({
             'success': True,
@@ -211,6 +382,8 @@ def login():
             }
         })
         
+    except HasherBusy:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -226,21 +399,27 @@ def admin_login():
         name = data['name'].strip()
         password = data['password']
         
-        conn = get_db_connection()
-        admin = conn.execute('''
-            SELECT id, name, password_hash
-            FROM admins WHERE name = ?
-        ''', (name,)).fetchone()
+        error = select_school(data, 'admin', name)
+        if error:
+            return error
+        
+        admin = get_storage().find_admin(name)
         
-        conn.close()
+        # The KDF runs without holding a pooled connection
+        if not admin:
+            password_hasher.verify(password, DUMMY_PASSWORD_HASH)
+            return jsonify({'error': 'Invalid admin credentials'}), 401
         
-        if not admin or admin['password_hash'] != hash_password(password):
+        if not check_password('admins', admin, password):
             return jsonify({'error': 'Invalid admin credentials'}), 401
         
-        # Set session
+        # Set session, under a new id
+        regenerate_session()
         session['admin_id'] = admin['id']
         session['admin_name'] = admin['name']
         session['user_type'] = 'admin'
+        if shard_router is not None:
+            session['school'] = g.school
         
         return jsonify({
             'success': True,
@@ -252,58 +431,249 @@ def admin_login():
             }
         })
         
+    except HasherBusy:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def regenerate_session():
+    """Give the session a fresh id before it gains an identity (no-op for cookie sessions)
+
+    Otherwise a session id planted in a browser before sign-in would be
+    upgraded to the user who signs in with it.
+    """
+    regenerate = getattr(session, 'regenerate', None)
+    if regenerate is not None:
+        regenerate()
+
 @app.route('/api/logout', methods=['POST'])
 def logout():
     """Logout current user"""
     session.clear()
     return jsonify({'success': True, 'message': 'Logged out successfully'})
 
+def rows_to_requests(rows):
+    """Convert request rows to dicts with the legacy timestamp key"""
+    requests_list = []
+    with phase('convert'):
+        for req in rows:
+            req_dict = dict(req)
+            req_dict['timestamp'] = req_dict['created_at']
+            requests_list.append(req_dict)
+    return requests_list
+
+def parse_timestamp_arg(value):
+    """Normalize an ISO date/datetime query argument to SQLite's timestamp format"""
+    timestamp = value.replace('T', ' ').rstrip('Z')
+    datetime.fromisoformat(timestamp)
+    return timestamp
+
+def request_filters(args):
+    """Listing filters from query arguments; parent_id only applies to admins"""
+    filters = {}
+    if args.get('parent_id'):
+        filters['parent_id'] = int(args['parent_id'])
+    for arg in ('status', 'request_type', 'child_grade'):
+        if args.get(arg):
+            filters[arg] = args[arg]
+    for arg in ('created_from', 'created_to'):
+        if args.get(arg):
+            filters[arg] = parse_timestamp_arg(args[arg])
+    return filters
+
+def request_fields(args, user_type):
+    """Output keys named by ?fields=, always with id, or None for every column"""
+    if not args.get('fields'):
+        return None
+    fields = {field.strip() for field in args['fields'].split(',') if field.strip()}
+    allowed = set(REQUEST_COLUMNS) | {'timestamp'}
+    if user_type == 'admin':
+        allowed |= set(PARENT_COLUMNS)
+    if not fields or not fields <= allowed:
+        raise ValueError(f"fields must be a comma-separated subset of {', '.join(sorted(allowed))}")
+    return fields | {'id'}
+
 @app.route('/api/requests', methods=['GET'])
 def get_requests():
-    """Get all requests (admin) or user's requests (parent)"""
+    """Get all requests (admin) or user's requests (parent)
+
+    Supports If-None-Match (304 when the caller's view is unchanged),
+    ?since=<version or updated_at> for delta responses with deleted ids, and
+    keyset pagination (limit, cursor) with filters on status, request_type,
+    child_grade, parent_id (admin only), created_from and created_to.
+    ?fields=status,feedback narrows each request to those keys (plus id) in
+    the SELECT itself. Archived requests are left out unless ?archive=include
+    (live and archived) or ?archive=only is given, on full listings only.
+    """
     try:
         if 'user_type' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        conn = get_db_connection()
-        
-        if session['user_type'] == 'admin':
-            # Admin sees all requests
-            requests = conn.execute('''
-                SELECT r.*, u.name as parent_name, u.email as parent_email
-                FROM requests r
-                JOIN users u ON r.parent_id = u.id
-                ORDER BY r.created_at DESC
-            ''').fetchall()
+        user_type = session['user_type']
+        user_id = session.get('user_id')
+        
+        try:
+            filters = request_filters(request.args)
+            fields = request_fields(request.args, user_type)
+            limit = request.args.get('limit', type=int)
+            if 'limit' in request.args and (limit is None or limit < 1):
+                raise ValueError('limit must be a positive integer')
+            if limit is not None:
+                limit = min(limit, MAX_PAGE_SIZE)
+            page_cursor = request.args.get('cursor')
+            if page_cursor:
+                decode_page_cursor(page_cursor)
+            archive = request.args.get('archive') or None
+            if archive is not None and (archive not in ARCHIVE_MODES or request.args.get('since')):
+                raise ValueError('archive must be include or only, and cannot be combined with since')
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return jsonify({'error': 'Invalid query parameters'}), 400
+        
+        store = get_storage()
+        
+        # Read the version first: a change racing the listing is re-sent next poll
+        version = store.view_version(user_type, user_id)
+        scope = 'admin' if user_type == 'admin' else f'parent-{user_id}'
+        if shard_router is not None:
+            scope = f'{current_school()}-{scope}'
+        etag = f'{scope}-{version}'
+        if request.query_string:
+            etag += '-' + hashlib.sha1(request.query_string).hexdigest()[:12]
+        
+        # Weak comparison: compressed responses carry the same tag marked weak
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        since = request.args.get('since')
+        try:
+            cursor = store.parse_since(since, TOMBSTONE_RETENTION_DAYS) if since else None
+        except ValueError:
+            return jsonify({'error': 'since must be a version or an ISO 8601 time'}), 400
+        
+        tail = None
+        if cursor:
+            sql, params = store.changes_query(user_type, user_id, filters, *cursor, fields=fields)
+            batches = store.stream_rows(sql, params, STREAM_BATCH_ROWS)
+            head = {'success': True, 'full': False, 'version': version}
+            tail = lambda: {'deleted': store.deleted_since(user_type, user_id, *cursor)}
+        elif limit is None:
+            sql, params = store.listing_query(user_type, user_id, filters, page_cursor, fields, archive)
+            batches = store.stream_rows(sql, params, STREAM_BATCH_ROWS)
+            head = {'success': True, 'full': True, 'version': version}
         else:
-            # Parent sees only their requests
-            user_id = session.get('user_id')
-            requests = conn.execute('''
-                SELECT * FROM requests
-                WHERE parent_id = ?
-                ORDER BY created_at DESC
-            ''', (user_id,)).fetchall()
-        
-        conn.close()
-        
-        # Convert to list of dictionaries
-        requests_list = []
-        for req in requests:
-            req_dict = dict(req)
-            req_dict['timestamp'] = req_dict['created_at']
-            requests_list.append(req_dict)
+            rows, next_cursor = store.list_requests(user_type, user_id, filters, page_cursor, limit, fields,
+                                                    archive)
+            batches = iter([rows])
+            head = {'success': True, 'full': True, 'version': version}
+            tail = lambda: {'next_cursor': next_cursor}
         
-        return jsonify({
-            'success': True,
-            'requests': requests_list
-        })
+        response = stream_requests_response(head, batches, tail, fields)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def stream_requests_response(head, batches, tail=None, fields=None):
+    """Chunked JSON response with the rows under 'requests', encoded batch by batch as they are read
+
+    The first batch is read here, so a query that fails outright still gets
+    the usual 500; the rest are read while the response is being sent.
+    """
+    first = next(batches, None)
+    
+    def all_batches():
+        if first is not None:
+            yield first
+            yield from batches
+    
+    body = stream_object(head, 'requests', all_batches(), tail, aliases={'timestamp': 'created_at'},
+                         backend=JSON_BACKEND, fields=fields)
+    return app.response_class(stream_with_context(body), mimetype='application/json')
+
+def notify_request_change(store, change, request_id):
+    """Invalidate cached aggregates and publish a committed create/update/delete"""
+    notify_request_changes(store, change, [request_id])
+
+def notify_request_changes(store, change, request_ids, school=None):
+    """Batch form of notify_request_change for bulk writes"""
+    if school is None and has_request_context():
+        school = current_school()
+    analytics_cache.invalidate(('analytics', school))
+    publish_request_changes(store, change, request_ids, school)
+
+def publish_request_changes(store, change, request_ids, school=None):
+    """Publish committed changes to change feed subscribers, one lookup per batch"""
+    if not request_ids or not change_bus.has_subscribers:
+        return
+    
+    if change == 'deleted':
+        for row in store.tombstones_by_ids(request_ids):
+            change_bus.publish({
+                'type': change,
+                'school': school,
+                'request_id': row['request_id'],
+                'parent_id': row['parent_id'],
+                'version': row['version']
+            })
+        return
+    
+    rows = store.requests_by_ids(request_ids)
+    for row, req_dict in zip(rows, rows_to_requests(rows)):
+        change_bus.publish({
+            'type': change,
+            'school': school,
+            'request_id': row['id'],
+            'parent_id': row['parent_id'],
+            'version': row['version'],
+            'request': req_dict
+        })
+
+def authenticate_stream(headers):
+    """Resolve the Flask session cookie sent to the SSE server into (user_type, user_id, school)"""
+    cookie = SimpleCookie()
+    try:
+        cookie.load(headers.get('cookie', ''))
+    except Exception:
+        return None
+    morsel = cookie.get(app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    
+    if session_interface is not None:
+        loaded = session_interface.load_data(morsel.value)
+        if loaded is None:
+            return None
+        data = loaded[0]
+    else:
+        serializer = app.session_interface.get_signing_serializer(app)
+        try:
+            data = serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return None
+    
+    school = data.get('school', DEFAULT_SCHOOL) if shard_router is not None else None
+    if data.get('user_type') == 'admin':
+        return ('admin', None, school)
+    if data.get('user_type') == 'parent' and data.get('user_id') is not None:
+        return ('parent', data['user_id'], school)
+    return None
+
+@app.route('/api/requests/feed', methods=['GET'])
+def request_feed():
+    """Where browsers open the change feed; url is null when it is not running and clients should poll"""
+    if STREAM_PUBLIC_URL:
+        url = STREAM_PUBLIC_URL
+    elif STREAM_PORT:
+        host = request.host.rsplit(':', 1)[0]
+        url = f'{request.scheme}://{host}:{STREAM_PORT}{STREAM_PATH}'
+    else:
+        url = None
+    return jsonify({'success': True, 'url': url})
+
 @app.route('/api/requests', methods=['POST'])
 def create_request():
     """Create a new check-in request"""
@@ -321,20 +691,19 @@ def create_request():
         child_name = data['childName']
         child_grade = data['childGrade']
         request_message = data.get('requestMessage', '')
-        
-        conn = get_db_connection()
-        
-        # Get parent info
-        parent = conn.execute('SELECT name, email FROM users WHERE id = ?', (user_id,)).fetchone()
-        
-        cursor = conn.execute('''
-            INSERT INTO requests (parent_id, child_name, child_grade, request_type, request_message)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, child_name, child_grade, request_type, request_message))
-        
-        request_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        row = (user_id, child_name, child_grade, request_type, request_message)
+        
+        store = get_storage()
+        if WRITE_BEHIND and store.single_writer:
+            # Group-committed by the writer thread; we still wait for the id
+            try:
+                request_id = insert_queue_for(store, current_school()).insert(row)
+            except TimeoutError:
+                # Withdrawn before it was written, so a retry cannot duplicate it
+                return jsonify({'error': 'Request not created: the database is busy, please retry'}), 503
+        else:
+            request_id = store.create_request(row)
+            notify_request_change(store, 'created', request_id)
         
         return jsonify({
             'success': True,
@@ -360,16 +729,12 @@ def update_request(request_id):
         status = data['status']
         feedback = data.get('feedback', '')
         
-        conn = get_db_connection()
-        
-        conn.execute('''
-            UPDATE requests
-            SET status = ?, feedback = ?, response_time = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (status, feedback, request_id))
-        
-        conn.commit()
-        conn.close()
+        store = get_storage()
+        if not store.update_request(request_id, status, feedback):
+            if store.archived_ids([request_id]):
+                return jsonify({'error': 'Request is archived and can no longer be changed'}), 409
+            return jsonify({'error': 'Request not found'}), 404
+        notify_request_change(store, 'updated', request_id)
         
         return jsonify({
             'success': True,
@@ -379,6 +744,101 @@ def update_request(request_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def read_batch(data, key):
+    """Validate a bulk request body; returns (items, error_response)"""
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': f'Expected a non-empty "{key}" array'}), 400)
+    if len(items) > MAX_BATCH_SIZE:
+        return None, (jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 413)
+    return items, None
+
+@app.route('/api/requests/batch', methods=['POST'])
+def create_requests_batch():
+    """Create several check-in requests in one transaction"""
+    try:
+        if 'user_id' not in session or session.get('user_type') != 'parent':
+            return jsonify({'error': 'Not authenticated as parent'}), 401
+        
+        items, error = read_batch(request.get_json(silent=True), 'requests')
+        if error:
+            return error
+        
+        user_id = session['user_id']
+        results = [None] * len(items)
+        rows, row_indexes = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not all(item.get(k) for k in ['type', 'childName', 'childGrade']):
+                results[index] = {'index': index, 'success': False, 'error': 'Missing required fields'}
+                continue
+            rows.append((user_id, item['childName'], item['childGrade'], item['type'], item.get('requestMessage', '')))
+            row_indexes.append(index)
+        
+        request_ids = []
+        if rows:
+            store = get_storage()
+            request_ids = store.create_requests(rows)
+            notify_request_changes(store, 'created', request_ids)
+        
+        for index, request_id in zip(row_indexes, request_ids):
+            results[index] = {'index': index, 'success': True, 'request_id': request_id}
+        
+        failed = len(items) - len(request_ids)
+        return jsonify({
+            'success': failed == 0,
+            'message': f'Created {len(request_ids)} of {len(items)} requests',
+            'created': len(request_ids),
+            'failed': failed,
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/requests/batch', methods=['PUT'])
+def update_requests_batch():
+    """Respond to several requests in one transaction (admin only)"""
+    try:
+        if 'user_type' not in session or session['user_type'] != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        items, error = read_batch(request.get_json(silent=True), 'updates')
+        if error:
+            return error
+        
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int) or not item.get('status'):
+                results[index] = {'index': index, 'success': False, 'error': 'Missing id or status field'}
+                continue
+            valid.append((index, item))
+        
+        if valid:
+            store = get_storage()
+            existing = store.update_requests([(item['id'], item['status'], item.get('feedback', '')) for _, item in valid])
+            archived = store.archived_ids([item['id'] for _, item in valid if item['id'] not in existing])
+            for index, item in valid:
+                if item['id'] in archived:
+                    results[index] = {'index': index, 'id': item['id'], 'success': False, 'error': 'Request is archived'}
+                elif item['id'] not in existing:
+                    results[index] = {'index': index, 'id': item['id'], 'success': False, 'error': 'Request not found'}
+                else:
+                    results[index] = {'index': index, 'id': item['id'], 'success': True}
+            notify_request_changes(store, 'updated', sorted(existing))
+        
+        failed = sum(1 for result in results if not result['success'])
+        return jsonify({
+            'success': failed == 0,
+            'message': f'Updated {len(items) - failed} of {len(items)} requests',
+            'updated': len(items) - failed,
+            'failed': failed,
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/requests/<int:request_id>', methods=['DELETE'])
 def delete_request(request_id):
     """Delete a request"""
@@ -386,17 +846,14 @@ def delete_request(request_id):
         if 'user_type' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        conn = get_db_connection()
+        store = get_storage()
         
         # Check if user owns the request or is admin
-        if session['user_type'] == 'admin':
-            conn.execute('DELETE FROM requests WHERE id = ?', (request_id,))
-        else:
-            user_id = session['user_id']
-            conn.execute('DELETE FROM requests WHERE id = ? AND parent_id = ?', (request_id, user_id))
-        
-        conn.commit()
-        conn.close()
+        parent_id = None if session['user_type'] == 'admin' else session['user_id']
+        if store.delete_request(request_id, parent_id):
+            notify_request_change(store, 'deleted', request_id)
+        elif store.archived_ids([request_id], parent_id):
+            return jsonify({'error': 'Request is archived and can no longer be changed'}), 409
         
         return jsonify({
             'success': True,
@@ -413,44 +870,17 @@ def get_analytics():
         if 'user_type' not in session or session['user_type'] != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        conn = get_db_connection()
-        
-        # Total counts
-        total_requests = conn.execute('SELECT COUNT(*) FROM requests').fetchone()[0]
-        total_parents = conn.execute('SELECT COUNT(*) FROM users WHERE user_type = "parent"').fetchone()[0]
-        pending_requests = conn.execute('SELECT COUNT(*) FROM requests WHERE status = "pending"').fetchone()[0]
-        approved_requests = conn.execute('SELECT COUNT(*) FROM requests WHERE status = "approved"').fetchone()[0]
-        
-        # Requests by type
-        checkin_requests = conn.execute('SELECT COUNT(*) FROM requests WHERE request_type = "checkin"').fetchone()[0]
-        checkout_requests = conn.execute('SELECT COUNT(*) FROM requests WHERE request_type = "checkout"').fetchone()[0]
-        
-        # Recent activity (last 7 days)
-        recent_requests = conn.execute('''
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM requests
-            WHERE created_at >= date('now', '-7 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        ''').fetchall()
-        
-        conn.close()
+        cache_key = ('analytics', current_school())
+        analytics = analytics_cache.get(cache_key)
+        if analytics is None:
+            # A write that invalidates while this computes must not be papered over
+            generation = analytics_cache.generation
+            analytics = get_storage().analytics()
+            analytics_cache.set(cache_key, analytics, generation)
         
         return jsonify({
             'success': True,
-            'analytics': {
-                'totals': {
-                    'requests': total_requests,
-                    'parents': total_parents,
-                    'pending': pending_requests,
-                    'approved': approved_requests
-                },
-                'by_type': {
-                    'checkin': checkin_requests,
-                    'checkout': checkout_requests
-                },
-                'recent_activity': [dict(row) for row in recent_requests]
-            }
+            'analytics': analytics
         })
         
     except Exception as e:
@@ -464,13 +894,7 @@ def get_children():
             return jsonify({'error': 'Not authenticated as parent'}), 401
         
         user_id = session['user_id']
-        conn = get_db_connection()
-        
-        children = conn.execute('''
-            SELECT id, name, grade FROM children WHERE parent_id = ?
-        ''', (user_id,)).fetchall()
-        
-        conn.close()
+        children = get_storage().list_children(user_id)
         
         return jsonify({
             'success': True,
@@ -496,16 +920,7 @@ def add_child():
         name = data['name'].strip()
         grade = data['grade'].strip()
         
-        conn = get_db_connection()
-        
-        cursor = conn.execute('''
-            INSERT INTO children (parent_id, name, grade)
-            VALUES (?, ?, ?)
-        ''', (user_id, name, grade))
-        
-        child_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        child_id = get_storage().add_child(user_id, name, grade)
         
         return jsonify({
             'success': True,
@@ -525,8 +940,22 @@ if __name__ == '__main__':
     debug = os.environ.get('DEBUG', 'False').lower() == 'true'
     
     print(f"🚀 KidCheck API Server starting on port {port}")
-    print(f"📊 Database: {DATABASE}")
+    if shared_storage is not None:
+        print(f"📊 Database: {shared_storage.backend}")
+    elif shard_router is None:
+        print(f"📊 Database: {DATABASE}")
+    else:
+        print(f"📊 Databases: {len(shard_router.schools())} school shards in {shard_router.shards_dir}")
     print(f"🔧 Debug mode: {debug}")
     print(f"🌐 Access the API at: http://localhost:{port}/api/health")
     
+    # Debug mode's reloader forks a child; only the serving process owns the stream port
+    if STREAM_PORT and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_stream_server(change_bus, authenticate_stream, port=STREAM_PORT,
+                            allowed_origins=STREAM_ALLOWED_ORIGINS)
+        print(f"📡 Change feed at: http://localhost:{STREAM_PORT}{STREAM_PATH}")
+    if archiver is not None and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        archiver.start()
+        print(f"🧊 Archiving requests resolved over {archiver.after_days:g} days ago")
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+KidCheck Change Feed
+In-process pub/sub bus for request changes and an asyncio Server-Sent Events server
+"""
+
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+STREAM_PATH = '/api/requests/stream'
+HEARTBEAT_SECONDS = 15
+MAX_HEADER_BYTES = 16384
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Sentinel queued to every subscriber by the shared heartbeat task
+_HEARTBEAT = object()
+
+
+class Subscriber:
+    """One open stream: who is listening and the queue of events waiting to be written"""
+
+    def __init__(self, user_type, user_id, school=None):
+        self.user_type = user_type
+        self.user_id = user_id
+        self.school = school
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def can_see(self, event):
+        """Admins see every event in their school, parents only events for their own requests"""
+        if event.get('school') != self.school:
+            return False
+        return self.user_type == 'admin' or event.get('parent_id') == self.user_id
+
+
+class ChangeBus:
+    """Thread-safe publisher that fans events out to subscribers on one event loop"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers = set()
+        self._stats = {'published': 0, 'delivered': 0, 'dropped_subscribers': 0}
+        # publish() counts from request threads; the other stats only change on the loop
+        self._stats_lock = threading.Lock()
+
+    def attach(self, loop):
+        """Bind the bus to the event loop that owns the subscribers"""
+        self._loop = loop
+
+    def publish(self, event: Dict):
+        """Publish from any thread; a no-op when no stream server is running"""
+        with self._stats_lock:
+            self._stats['published'] += 1
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._dispatch, event)
+
+    def subscribe(self, user_type, user_id, school=None) -> Subscriber:
+        subscriber = Subscriber(user_type, user_id, school)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def _dispatch(self, event):
+        for subscriber in list(self._subscribers):
+            if not subscriber.can_see(event):
+                continue
+            self._offer(subscriber, event)
+
+    def _offer(self, subscriber, item):
+        try:
+            subscriber.queue.put_nowait(item)
+            if item is not _HEARTBEAT:
+                self._stats['delivered'] += 1
+        except asyncio.QueueFull:
+            # A stalled client is cut loose; it resyncs with ?since= on reconnect
+            subscriber.overflowed = True
+            self._subscribers.discard(subscriber)
+            self._stats['dropped_subscribers'] += 1
+
+    def heartbeat(self):
+        for subscriber in list(self._subscribers):
+            self._offer(subscriber, _HEARTBEAT)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['subscribers'] = len(self._subscribers)
+        return snapshot
+
+
+def format_event(event) -> bytes:
+    """Encode one bus event as an SSE frame, using the change version as the event id"""
+    lines = []
+    if event.get('version') is not None:
+        lines.append(f"id: {event['version']}")
+    lines.append('event: request')
+    lines.append(f"data: {json.dumps(event, default=str, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+async def _read_request_head(reader) -> Tuple[str, str, Dict[str, str]]:
+    head = await reader.readuntil(b'\r\n\r\n')
+    if len(head) > MAX_HEADER_BYTES:
+        raise ValueError('Request header too large')
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def _response_head(status, headers) -> bytes:
+    lines = [f'HTTP/1.1 {status}'] + [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+class AllowedOrigins:
+    """Which page origins may read a stream with the user's session cookie
+
+    With no origins configured only the API's own origin is allowed: the host
+    the client connected to, on the port the API serves. Anything else gets no
+    CORS headers, so the browser keeps the events from the page.
+    """
+
+    DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+    def __init__(self, origins: Iterable[str] = (), app_port=None):
+        self.origins = frozenset(origin.strip().rstrip('/') for origin in origins if origin.strip())
+        self.app_port = app_port
+
+    def allows(self, origin, request_headers) -> bool:
+        if self.origins:
+            return origin.rstrip('/') in self.origins
+        try:
+            parts = urlsplit(origin)
+            port = parts.port or self.DEFAULT_PORTS.get(parts.scheme)
+        except ValueError:
+            return False
+        host = urlsplit('//' + request_headers.get('host', '')).hostname
+        return (parts.scheme in self.DEFAULT_PORTS and parts.hostname is not None and parts.hostname == host
+                and port == self.app_port)
+
+
+def _cors_headers(request_headers, allowed_origins: Optional[AllowedOrigins]):
+    origin = request_headers.get('origin')
+    if not origin or allowed_origins is None or not allowed_origins.allows(origin, request_headers):
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Credentials': 'true',
+        'Vary': 'Origin',
+    }
+
+
+async def _handle_connection(bus, authenticate, allowed_origins, reader, writer):
+    subscriber = None
+    try:
+        try:
+            method, target, headers = await asyncio.wait_for(_read_request_head(reader), timeout=10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            return
+
+        path = target.split('?', 1)[0]
+        if method != 'GET' or path != STREAM_PATH:
+            writer.write(_response_head('404 Not Found', {'Content-Length': '0', 'Connection': 'close'}))
+            return
+
+        # Session lookups may hit the session store, so keep them off the event loop
+        identity = await asyncio.get_running_loop().run_in_executor(None, authenticate, headers)
+        if identity is None:
+            body = b'{"error": "Not authenticated"}'
+            writer.write(_response_head('401 Unauthorized', {
+                'Content-Type': 'application/json',
+                'Content-Length': str(len(body)),
+                'Connection': 'close',
+                **_cors_headers(headers, allowed_origins),
+            }) + body)
+            return
+
+        subscriber = bus.subscribe(*identity)
+        writer.write(_response_head('200 OK', {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'X-Accel-Buffering': 'no',
+            **_cors_headers(headers, allowed_origins),
+        }))
+        # Tell EventSource how long to wait before reconnecting
+        writer.write(b'retry: 3000\n\n')
+        await writer.drain()
+
+        while True:
+            item = await subscriber.queue.get()
+            if subscriber.overflowed:
+                break
+            writer.write(b': ping\n\n' if item is _HEARTBEAT else format_event(item))
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        if subscriber is not None:
+            bus.unsubscribe(subscriber)
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+async def serve(bus, authenticate, host, port, ready=None, reuse_port=False, allowed_origins=None):
+    """Run the SSE server on the current event loop until cancelled"""
+    bus.attach(asyncio.get_running_loop())
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_connection(bus, authenticate, allowed_origins, reader, writer),
+        host, port, limit=MAX_HEADER_BYTES, backlog=1024, reuse_port=reuse_port or None,
+    )
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            bus.heartbeat()
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        heartbeat_task.cancel()
+
+
+def start_stream_server(bus, authenticate: Callable, host='0.0.0.0', port=5001, reuse_port=False,
+                        allowed_origins: Optional[AllowedOrigins] = None) -> threading.Thread:
+    """Start the SSE server on its own event loop in a daemon thread
+
+    reuse_port lets a replacement process bind while the one it replaces is
+    still draining, as happens on a graceful server reload. Without
+    allowed_origins no cross-origin page can read the stream.
+    """
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=lambda: asyncio.run(serve(bus, authenticate, host, port, ready, reuse_port, allowed_origins)),
+        name='kidcheck-change-feed',
+        daemon=True,
+    )
+    thread.start()
+    ready.wait(timeout=5)
+    return thread
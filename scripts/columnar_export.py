@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+KidCheck Columnar Export
+Month-partitioned Parquet / Arrow IPC exports written batch by batch from a SQL cursor
+"""
+
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Dict, List
+
+from archive import include_archive
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only the columnar export formats need it
+    pa = None
+    pq = None
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+MANIFEST = '_manifest.json'
+UNKNOWN_MONTH = 'unknown'
+
+REQUESTS_QUERY = '''
+    SELECT r.*, u.name as parent_name, u.email as parent_email
+    FROM requests r
+    LEFT JOIN users u ON r.parent_id = u.id
+'''
+USERS_QUERY = 'SELECT id, email, name, user_type, created_at FROM users'
+CHILDREN_QUERY = 'SELECT * FROM children'
+
+# Low-cardinality text stored as dictionary columns so readers get categoricals back.
+# Parquet only: the Arrow IPC file format cannot change dictionaries between batches.
+DICTIONARY_COLUMNS = {'status', 'request_type', 'child_grade', 'user_type', 'grade'}
+
+
+class ColumnarUnavailable(Exception):
+    """Raised when a columnar format is requested but pyarrow is not installed"""
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _arrow_type(declared, fmt, name):
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if 'TIMESTAMP' in declared or 'DATE' in declared:
+        return pa.timestamp('s')
+    if 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+        return pa.float64()
+    if fmt == 'parquet' and name in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def query_schema(conn, table, columns, fmt):
+    """Arrow schema for a query's columns, typed from the base table's declared column types"""
+    declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({table})')}
+    return pa.schema([pa.field(name, _arrow_type(declared.get(name), fmt, name)) for name in columns])
+
+
+def _to_array(values, field):
+    if pa.types.is_timestamp(field.type):
+        # SQLite stores timestamps as text; Arrow parses the ISO form directly
+        return pa.array(values, pa.string()).cast(field.type)
+    if pa.types.is_dictionary(field.type):
+        return pa.array(values, pa.string()).dictionary_encode()
+    return pa.array(values, field.type)
+
+
+def write_query(conn, sql, params, table, path, fmt, chunksize):
+    """Stream a query into one file, one row group / record batch per fetchmany() chunk"""
+    cursor = conn.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+    schema = query_schema(conn, table, columns, fmt)
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    rows_written = 0
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+    else:
+        # Uncompressed IPC so readers can memory-map the columns without copying
+        writer = pa.ipc.new_file(str(tmp_path), schema)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            arrays = [_to_array(list(values), field) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows_written += len(rows)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return rows_written
+
+
+def _month_bounds(month):
+    start = datetime.date.fromisoformat(f'{month}-01')
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.isoformat(), end.isoformat()
+
+
+def month_signatures(conn) -> Dict[str, List]:
+    """Per-month fingerprint of requests; a month is re-exported only when its fingerprint moves"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(requests)')}
+    # The change-tracking version catches updates; fall back to updated_at on older schemas
+    changed = 'MAX(version)' if 'version' in columns else 'MAX(updated_at)'
+    cursor = conn.execute(f'''
+        SELECT IFNULL(strftime('%Y-%m', created_at), '{UNKNOWN_MONTH}') AS month, COUNT(*), MAX(id), {changed}
+        FROM requests
+        GROUP BY month
+    ''')
+    return {row[0]: list(row[1:]) for row in cursor}
+
+
+def _load_manifest(out_dir) -> Dict:
+    try:
+        with open(out_dir / MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def export_columnar(conn, out_dir, fmt='parquet', chunksize=50000) -> Dict:
+    """Export requests partitioned by created_at month, plus users and children
+
+    Months whose row count, highest id and latest change are unchanged since
+    the previous export are left in place, so re-exports only add or replace
+    the partitions that moved (normally just the current month).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown columnar format {fmt}')
+    if not available():
+        raise ColumnarUnavailable('pyarrow is required for Parquet/Arrow export (pip install pyarrow)')
+
+    out_dir = Path(out_dir)
+    extension = FORMATS[fmt]
+    requests_dir = out_dir / 'requests'
+    requests_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = _load_manifest(out_dir)
+    if manifest.get('format') != fmt:
+        manifest = {'format': fmt, 'months': {}}
+    previous = manifest['months']
+    current = month_signatures(conn)
+    summary = {'written': [], 'unchanged': [], 'removed': [], 'rows': 0}
+
+    for month, signature in sorted(current.items()):
+        partition = requests_dir / f'month={month}'
+        path = partition / f'part-0{extension}'
+        if previous.get(month) == signature and path.exists():
+            summary['unchanged'].append(month)
+            continue
+
+        partition.mkdir(exist_ok=True)
+        if month == UNKNOWN_MONTH:
+            sql, params = REQUESTS_QUERY + ' WHERE r.created_at IS NULL ORDER BY r.id', ()
+        else:
+            # Range on created_at so the (created_at, id) index drives the scan
+            sql = REQUESTS_QUERY + ' WHERE r.created_at >= ? AND r.created_at < ? ORDER BY r.created_at, r.id'
+            params = _month_bounds(month)
+        summary['rows'] += write_query(conn, sql, params, 'requests', path, fmt, chunksize)
+        summary['written'].append(month)
+
+    for month in sorted(set(previous) - set(current)):
+        shutil.rmtree(requests_dir / f'month={month}', ignore_errors=True)
+        summary['removed'].append(month)
+
+    # Small reference tables are rewritten whole each time
+    write_query(conn, USERS_QUERY, (), 'users', out_dir / f'users{extension}', fmt, chunksize)
+    write_query(conn, CHILDREN_QUERY, (), 'children', out_dir / f'children{extension}', fmt, chunksize)
+
+    manifest['months'] = current
+    manifest['exported_at'] = datetime.datetime.now().isoformat()
+    with open(out_dir / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return summary
+
+
+def read_requests(out_dir, fmt='parquet', memory_map=True):
+    """Read the partitioned requests export back as one Arrow table"""
+    if not available():
+        raise ColumnarUnavailable('pyarrow is required for Parquet/Arrow export (pip install pyarrow)')
+    paths = sorted(Path(out_dir, 'requests').glob(f'month=*/part-0{FORMATS[fmt]}'))
+    if fmt == 'parquet':
+        tables = [pq.read_table(path, memory_map=memory_map) for path in paths]
+    else:
+        # Zero-copy: the returned columns point straight into the mapped files
+        tables = [pa.ipc.open_file(pa.memory_map(str(path)) if memory_map else str(path)).read_all()
+                  for path in paths]
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+
+if __name__ == '__main__':
+    import sys
+
+    database = sys.argv[1] if len(sys.argv) > 1 else 'kidcheck.db'
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'parquet'
+    out_dir = Path(sys.argv[3]) if len(sys.argv) > 3 else Path('reports') / fmt
+    conn = include_archive(sqlite3.connect(database))
+    try:
+        result = export_columnar(conn, out_dir, fmt)
+    finally:
+        conn.close()
+    print(f"📦 {fmt} export in {out_dir}: wrote {len(result['written'])} month(s) ({result['rows']} rows), "
+          f"kept {len(result['unchanged'])}, removed {len(result['removed'])}")
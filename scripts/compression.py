@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+KidCheck Response Compression
+Negotiated brotli/gzip encoding of API responses above a size threshold
+"""
+
+import os
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer rather than a raw zlib stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data) -> bytes:
+        # A sync flush per chunk lets the client decode each piece of a stream as it arrives
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def chunk(self, data) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ResponseCompressor:
+    """after_request hook compressing text responses for clients that accept it
+
+    Buffered bodies smaller than min_size are sent as they are, since the
+    headers and CPU cost more than they save. Streamed bodies are read up to
+    min_size before deciding, then compressed chunk by chunk as they are
+    produced, so a streamed listing still starts arriving immediately.
+    Compressed responses get a weak ETag: the bytes differ from the identity
+    encoding, but the content is the same for If-None-Match.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = int(min_size)
+        self.gzip_level = int(gzip_level)
+        self.brotli_quality = int(brotli_quality)
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def install(self, app):
+        app.after_request(self.compress)
+
+    def negotiate(self, accept_encodings) -> Optional[str]:
+        """Best supported encoding the client accepts, preferring brotli"""
+        for encoding in self.encodings:
+            if accept_encodings[encoding] > 0:
+                return encoding
+        return None
+
+    def _stream(self, encoding):
+        if encoding == 'br':
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+    def compress(self, response):
+        if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers
+                or response.direct_passthrough):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            head, rest = _peek(response.response, self.min_size)
+            if rest is not None:
+                response.response = _compressed(self._stream(encoding), head, rest)
+                return self._mark(response, encoding)
+            # The whole stream turned out to be short; carry on with it buffered
+            response.set_data(b''.join(head))
+
+        if response.content_length is None or response.content_length < self.min_size:
+            return response
+        stream = self._stream(encoding)
+        response.set_data(stream.chunk(response.get_data()) + stream.finish())
+        return self._mark(response, encoding)
+
+    def _mark(self, response, encoding):
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def _peek(body: Iterable[bytes], size) -> tuple:
+    """Read chunks from a streamed body until size bytes; returns (chunks, rest or None if exhausted)"""
+    iterator = iter(body)
+    head: List[bytes] = []
+    total = 0
+    for chunk in iterator:
+        head.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            return head, _closing(iterator, body)
+    if hasattr(body, 'close'):
+        body.close()
+    return head, None
+
+
+def _closing(iterator, body) -> Iterator[bytes]:
+    try:
+        yield from iterator
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def _compressed(stream, head: List[bytes], rest: Iterator[bytes]) -> Iterator[bytes]:
+    try:
+        data = stream.chunk(b''.join(head))
+        if data:
+            yield data
+        for chunk in rest:
+            data = stream.chunk(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        rest.close()
+
+
+def compressor_from_env() -> Optional[ResponseCompressor]:
+    """ResponseCompressor unless COMPRESSION_ENABLED=false"""
+    if os.environ.get('COMPRESSION_ENABLED', 'True').lower() != 'true':
+        return None
+    return ResponseCompressor(
+        min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+        gzip_level=int(os.environ.get('GZIP_LEVEL', 6)),
+        brotli_quality=int(os.environ.get('BROTLI_QUALITY', 4)),
+    )
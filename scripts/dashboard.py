@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+KidCheck Dashboard Rendering
+Headless (Agg) chart rendering from pre-aggregated data, one chart per worker process
+"""
+
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+# Set up matplotlib for better plots
+plt.style.use('seaborn-v0_8')
+sns.set_palette("husl")
+
+FORMATS = ('png', 'svg')
+DEFAULT_DPI = int(os.environ.get('ANALYTICS_DPI', 120))
+CHARTS = ['status', 'types', 'daily', 'response_times', 'hourly', 'parents']
+
+
+def chart_data(aggregates) -> Dict:
+    """Reduce RequestAggregates to the small, picklable series the charts plot"""
+    values, weights = aggregates.response_sketch.points() if aggregates.response_count else ([], [])
+    return {
+        'status': aggregates.by_status.most_common(),
+        'types': aggregates.by_type.most_common(),
+        'daily': sorted(aggregates.by_date.items()),
+        'response_times': (values, weights),
+        'hourly': sorted(aggregates.by_hour.items()),
+        'parents': aggregates.by_parent.most_common(10),
+    }
+
+
+def draw_status(ax, status_counts):
+    ax.pie([n for _, n in status_counts], labels=[s for s, _ in status_counts], autopct='%1.1f%%', startangle=90)
+    ax.set_title('Request Status Distribution')
+
+
+def draw_types(ax, type_counts):
+    ax.bar([t for t, _ in type_counts], [n for _, n in type_counts], color=['skyblue', 'lightcoral'])
+    ax.set_title('Check-in vs Check-out Requests')
+    ax.set_ylabel('Number of Requests')
+
+
+def draw_daily(ax, daily_requests):
+    days = [datetime.date.fromisoformat(day) for day, _ in daily_requests]
+    ax.plot(days, [n for _, n in daily_requests], marker='o', linewidth=2, markersize=6)
+    ax.set_title('Daily Request Volume')
+    ax.set_ylabel('Number of Requests')
+    ax.tick_params(axis='x', rotation=45)
+
+
+def draw_response_times(ax, points):
+    values, weights = points
+    ax.set_title('Response Time Distribution')
+    if values:
+        ax.hist(values, weights=weights, bins=20, color='lightgreen', alpha=0.7, edgecolor='black')
+        ax.set_xlabel('Response Time (minutes)')
+        ax.set_ylabel('Frequency')
+    else:
+        ax.text(0.5, 0.5, 'No response time data', ha='center', va='center', transform=ax.transAxes)
+
+
+def draw_hourly(ax, hourly_requests):
+    ax.bar([h for h, _ in hourly_requests], [n for _, n in hourly_requests], color='orange', alpha=0.7)
+    ax.set_title('Hourly Request Pattern')
+    ax.set_xlabel('Hour of Day')
+    ax.set_ylabel('Number of Requests')
+
+
+def draw_parents(ax, parent_activity):
+    if parent_activity:
+        ax.barh([p for p, _ in parent_activity], [n for _, n in parent_activity], color='purple', alpha=0.7)
+        ax.set_title('Most Active Parents (Top 10)')
+        ax.set_xlabel('Number of Requests')
+    else:
+        ax.text(0.5, 0.5, 'No parent data', ha='center', va='center', transform=ax.transAxes)
+        ax.set_title('Most Active Parents')
+
+
+DRAW = {
+    'status': draw_status,
+    'types': draw_types,
+    'daily': draw_daily,
+    'response_times': draw_response_times,
+    'hourly': draw_hourly,
+    'parents': draw_parents,
+}
+
+
+def render_chart(name, data, path, dpi=DEFAULT_DPI):
+    """Draw one chart into its own figure and save it; runs inside a worker process"""
+    fig, ax = plt.subplots(figsize=(6, 6))
+    try:
+        DRAW[name](ax, data)
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return str(path)
+
+
+def render_dashboard(data, path, dpi=DEFAULT_DPI, title='KidCheck Analytics Dashboard'):
+    """Draw all six charts into one figure, laid out as the original 2x3 dashboard"""
+    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
+    fig.suptitle(title, fontsize=16, fontweight='bold')
+    try:
+        for ax, name in zip(axes.flat, CHARTS):
+            DRAW[name](ax, data[name])
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return str(path)
+
+
+def render_all(data, out_dir, fmt='png', dpi=DEFAULT_DPI, workers=None, title='KidCheck Analytics Dashboard') -> List[str]:
+    """Render the dashboard and each chart as separate tasks on a process pool"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown chart format {fmt}')
+    out_dir = Path(out_dir)
+    charts_dir = out_dir / 'charts'
+    charts_dir.mkdir(parents=True, exist_ok=True)
+
+    if workers == 1:
+        paths = [render_dashboard(data, out_dir / f'analytics_dashboard.{fmt}', dpi, title)]
+        paths += [render_chart(name, data[name], charts_dir / f'{name}.{fmt}', dpi) for name in CHARTS]
+        return paths
+
+    with ProcessPoolExecutor(max_workers=workers or min(len(CHARTS) + 1, os.cpu_count() or 1)) as pool:
+        # The composite is the slowest task, so it goes first
+        futures = [pool.submit(render_dashboard, data, out_dir / f'analytics_dashboard.{fmt}', dpi, title)]
+        futures += [pool.submit(render_chart, name, data[name], charts_dir / f'{name}.{fmt}', dpi) for name in CHARTS]
+        return [future.result() for future in futures]
@@ -6,20 +6,38 @@ Generate comprehensive reports and visualizations for the child check-in system
 
 import sqlite3
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import json
 import datetime
+import math
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import numpy as np
 
-# Set up matplotlib for better plots
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
+import columnar_export
+import dashboard
+from analytics_store import AnalyticsStore
+from archive import include_archive
+from sketches import QuantileSketch
 
 DATABASE = 'kidcheck.db'
 REPORTS_DIR = Path('reports')
 
+# Compact dtypes applied at load time; low-cardinality text columns become categoricals
+REQUEST_DTYPES = {
+    'status': 'category',
+    'request_type': 'category',
+    'child_grade': 'category',
+}
+CHUNK_DTYPES = {'status': 'category', 'request_type': 'category'}
+REQUEST_DATE_COLUMNS = ['created_at', 'response_time', 'updated_at']
+DEFAULT_CHUNKSIZE = 50000
+
+def connect(database=None):
+    """Reporting connection on which `requests` covers both the live and the archived requests"""
+    return include_archive(sqlite3.connect(database or DATABASE))
+
 def ensure_reports_dir():
     """Create reports directory if it doesn't exist"""
     REPORTS_DIR.mkdir(exist_ok=True)
@@ -27,38 +45,411 @@ def ensure_reports_dir():
 def get_data():
     """Load data from database"""
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = connect()
         
         # Load requests data
         requests_df = pd.read_sql_query('''
             SELECT r.*, u.name as parent_name, u.email as parent_email
             FROM requests r
             LEFT JOIN users u ON r.parent_id = u.id
-        ''', conn)
+        ''', conn, dtype=REQUEST_DTYPES, parse_dates=REQUEST_DATE_COLUMNS)
         
         # Load users data
-        users_df = pd.read_sql_query('SELECT * FROM users', conn)
+        users_df = pd.read_sql_query('SELECT * FROM users', conn, parse_dates=['created_at'])
         
         # Load children data
         children_df = pd.read_sql_query('SELECT * FROM children', conn)
         
         conn.close()
         
-        # Convert datetime columns
-        if not requests_df.empty:
-            requests_df['created_at'] = pd.to_datetime(requests_df['created_at'])
-            requests_df['response_time'] = pd.to_datetime(requests_df['response_time'])
-            requests_df['updated_at'] = pd.to_datetime(requests_df['updated_at'])
-        
-        if not users_df.empty:
-            users_df['created_at'] = pd.to_datetime(users_df['created_at'])
-        
         return requests_df, users_df, children_df
-        
+    
     except Exception as e:
         print(f"Error loading data: {e}")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
+def iter_request_chunks(conn, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream the columns the reports need from requests in fixed-size DataFrame chunks"""
+    return pd.read_sql_query('''
+        SELECT r.status, r.request_type, r.created_at, r.response_time, u.name as parent_name
+        FROM requests r
+        LEFT JOIN users u ON r.parent_id = u.id
+    ''', conn, chunksize=chunksize, dtype=CHUNK_DTYPES, parse_dates=['created_at', 'response_time'])
+
+class RequestAggregates:
+    """Mergeable request aggregates that reports and charts are built from
+
+    Counts are exact; the response-time median comes from a QuantileSketch, so
+    memory depends on distinct days, hours and parents rather than on rows.
+    """
+    
+    def __init__(self, recent_cutoff=None):
+        self.recent_cutoff = recent_cutoff or datetime.datetime.now() - datetime.timedelta(days=7)
+        self.total = 0
+        self.by_status = Counter()
+        self.by_type = Counter()
+        self.by_date = Counter()
+        self.by_hour = Counter()
+        self.by_parent = Counter()
+        self.recent_by_date = Counter()
+        self.response_count = 0
+        self.response_sum = 0.0
+        self.response_min = None
+        self.response_max = None
+        self.response_median = None
+        self.response_sketch = QuantileSketch()
+    
+    @staticmethod
+    def _counts(series):
+        counts = series.value_counts(dropna=True)
+        return {key: int(value) for key, value in counts.items() if value}
+    
+    def add_frame(self, df, parent_column='parent_name'):
+        """Fold one DataFrame (a chunk or a whole table) into the running aggregates"""
+        if df.empty:
+            return self
+        
+        self.total += len(df)
+        self.by_status.update(self._counts(df['status']))
+        self.by_type.update(self._counts(df['request_type']))
+        self.by_parent.update(self._counts(df[parent_column]))
+        
+        created = df['created_at']
+        self.by_date.update({str(day): n for day, n in self._counts(created.dt.date).items()})
+        self.by_hour.update({int(hour): n for hour, n in self._counts(created.dt.hour).items()})
+        recent = created[created >= self.recent_cutoff]
+        self.recent_by_date.update({str(day): n for day, n in self._counts(recent.dt.date).items()})
+        
+        responded = df['response_time'].notna()
+        if responded.any():
+            minutes = ((df.loc[responded, 'response_time'] - created[responded]).dt.total_seconds() / 60).to_numpy()
+            self.add_response_minutes(minutes)
+        return self
+    
+    def add_response_minutes(self, minutes, counts=None):
+        minutes = np.asarray(minutes, dtype='float64')
+        if minutes.size == 0:
+            return
+        counts = np.ones(minutes.size, dtype='int64') if counts is None else np.asarray(counts, dtype='int64')
+        self.response_count += int(counts.sum())
+        self.response_sum += float((minutes * counts).sum())
+        low, high = float(minutes.min()), float(minutes.max())
+        self.response_min = low if self.response_min is None else min(self.response_min, low)
+        self.response_max = high if self.response_max is None else max(self.response_max, high)
+        self.response_median = None
+        self.response_sketch.add_many(minutes, counts)
+    
+    def merge(self, other):
+        """Combine partial aggregates, e.g. from separate chunks or shards"""
+        self.total += other.total
+        for name in ('by_status', 'by_type', 'by_date', 'by_hour', 'by_parent', 'recent_by_date'):
+            getattr(self, name).update(getattr(other, name))
+        if other.response_count:
+            self.response_count += other.response_count
+            self.response_sum += other.response_sum
+            self.response_min = other.response_min if self.response_min is None else min(self.response_min, other.response_min)
+            self.response_max = other.response_max if self.response_max is None else max(self.response_max, other.response_max)
+            self.response_median = None
+            self.response_sketch.merge(other.response_sketch)
+        return self
+    
+    @classmethod
+    def from_frame(cls, requests_df):
+        return cls().add_frame(requests_df)
+    
+    def to_dict(self):
+        """JSON-safe form for the incremental store; recent activity is always recomputed live"""
+        return {
+            'total': self.total,
+            'by_status': dict(self.by_status),
+            'by_type': dict(self.by_type),
+            'by_date': dict(self.by_date),
+            'by_hour': {str(hour): n for hour, n in self.by_hour.items()},
+            'by_parent': {str(parent): n for parent, n in self.by_parent.items()},
+            'response_count': self.response_count,
+            'response_sum': self.response_sum,
+            'response_min': self.response_min,
+            'response_max': self.response_max,
+            'response_sketch': self.response_sketch.to_dict(),
+        }
+    
+    @classmethod
+    def from_dict(cls, data, recent_cutoff=None):
+        aggregates = cls(recent_cutoff)
+        aggregates.total = data['total']
+        aggregates.by_status.update(data['by_status'])
+        aggregates.by_type.update(data['by_type'])
+        aggregates.by_date.update(data['by_date'])
+        aggregates.by_hour.update({int(hour): n for hour, n in data['by_hour'].items()})
+        aggregates.by_parent.update(data['by_parent'])
+        aggregates.response_count = data['response_count']
+        aggregates.response_sum = data['response_sum']
+        aggregates.response_min = data['response_min']
+        aggregates.response_max = data['response_max']
+        aggregates.response_sketch = QuantileSketch.from_dict(data['response_sketch'])
+        return aggregates
+    
+    def summary_stats(self, total_parents, total_children):
+        """Same keys and meaning as generate_summary_stats()"""
+        stats = {
+            'total_requests': self.total,
+            'total_parents': total_parents,
+            'total_children': total_children,
+            'pending_requests': self.by_status['pending'],
+            'approved_requests': self.by_status['approved'],
+            'rejected_requests': self.by_status['rejected'],
+            'checkin_requests': self.by_type['checkin'],
+            'checkout_requests': self.by_type['checkout'],
+        }
+        
+        if self.total:
+            if self.response_count:
+                stats['avg_response_time_minutes'] = self.response_sum / self.response_count
+                if self.response_median is not None:
+                    stats['median_response_time_minutes'] = self.response_median
+                else:
+                    stats['median_response_time_minutes'] = self.response_sketch.quantile(0.5)
+                stats['max_response_time_minutes'] = self.response_max
+                stats['min_response_time_minutes'] = self.response_min
+            
+            if self.by_date:
+                stats['avg_daily_requests'] = sum(self.by_date.values()) / len(self.by_date)
+                stats['max_daily_requests'] = max(self.by_date.values())
+            
+            if self.by_parent:
+                parent, count = self.by_parent.most_common(1)[0]
+                stats['most_active_parent'] = parent
+                stats['most_active_parent_requests'] = count
+        
+        return stats
+    
+    def request_breakdown(self):
+        return {
+            'by_status': dict(self.by_status.most_common()),
+            'by_type': dict(self.by_type.most_common()),
+            'by_date': dict(sorted(self.by_date.items()))
+        }
+
+def stream_aggregates(conn, chunksize=DEFAULT_CHUNKSIZE):
+    """Build RequestAggregates chunk by chunk with bounded peak memory"""
+    aggregates = RequestAggregates()
+    for chunk in iter_request_chunks(conn, chunksize):
+        aggregates.merge(RequestAggregates(aggregates.recent_cutoff).add_frame(chunk))
+    return aggregates
+
+def sql_aggregates(conn, recent_cutoff=None):
+    """Build RequestAggregates with GROUP BY queries run inside SQLite
+
+    Only the grouped result sets reach Python. Response times are grouped by
+    whole seconds, which is exact for CURRENT_TIMESTAMP values, so the median
+    here is exact rather than sketched.
+    """
+    aggregates = RequestAggregates(recent_cutoff)
+    cursor = conn.cursor()
+    
+    aggregates.total = cursor.execute('SELECT COUNT(*) FROM requests').fetchone()[0]
+    if not aggregates.total:
+        return aggregates
+    
+    cursor.execute('SELECT status, COUNT(*) FROM requests WHERE status IS NOT NULL GROUP BY status')
+    aggregates.by_status.update(dict(cursor.fetchall()))
+    cursor.execute('SELECT request_type, COUNT(*) FROM requests WHERE request_type IS NOT NULL GROUP BY request_type')
+    aggregates.by_type.update(dict(cursor.fetchall()))
+    
+    cursor.execute('''
+        SELECT date(created_at) AS day, COUNT(*)
+        FROM requests
+        WHERE created_at IS NOT NULL
+        GROUP BY day
+    ''')
+    aggregates.by_date.update(dict(cursor.fetchall()))
+    cursor.execute('''
+        SELECT CAST(strftime('%H', created_at) AS INTEGER) AS hour, COUNT(*)
+        FROM requests
+        WHERE created_at IS NOT NULL
+        GROUP BY hour
+    ''')
+    aggregates.by_hour.update(dict(cursor.fetchall()))
+    aggregates.recent_by_date.update(recent_counts(conn, aggregates.recent_cutoff))
+    
+    # Ties are broken by first request, matching value_counts() over rows in id order
+    cursor.execute('''
+        SELECT u.name, COUNT(*) AS requests
+        FROM requests r
+        JOIN users u ON r.parent_id = u.id
+        WHERE u.name IS NOT NULL
+        GROUP BY u.name
+        ORDER BY requests DESC, MIN(r.id)
+    ''')
+    aggregates.by_parent.update(dict(cursor.fetchall()))
+    
+    cursor.execute('''
+        SELECT CAST(strftime('%s', response_time) AS INTEGER) - CAST(strftime('%s', created_at) AS INTEGER) AS seconds,
+               COUNT(*)
+        FROM requests
+        WHERE response_time IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY seconds
+        ORDER BY seconds
+    ''')
+    histogram = cursor.fetchall()
+    if histogram:
+        seconds = np.array([row[0] for row in histogram], dtype='float64')
+        counts = np.array([row[1] for row in histogram], dtype='int64')
+        aggregates.add_response_minutes(seconds / 60, counts)
+        aggregates.response_median = histogram_median(seconds, counts) / 60
+    
+    return aggregates
+
+def recent_counts(conn, recent_cutoff):
+    """Requests per day created since the cutoff"""
+    cursor = conn.execute('''
+        SELECT date(created_at) AS day, COUNT(*)
+        FROM requests
+        WHERE created_at >= ?
+        GROUP BY day
+    ''', (str(recent_cutoff),))
+    return dict(cursor.fetchall())
+
+def histogram_median(values, counts):
+    """Exact median of sorted values each repeated counts[i] times"""
+    cumulative = np.cumsum(counts)
+    total = int(cumulative[-1])
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulative, total // 2, side='right')]
+    return (lower + upper) / 2
+
+def compare_engines(conn):
+    """Run the pandas and SQL engines on the same data; return a list of differences"""
+    recent_cutoff = datetime.datetime.now() - datetime.timedelta(days=7)
+    requests_df, users_df, children_df = get_data()
+    pandas_aggregates = RequestAggregates(recent_cutoff).add_frame(requests_df)
+    pandas_stats = generate_summary_stats(requests_df, users_df, children_df)
+    
+    counts = table_counts(conn)
+    sql = sql_aggregates(conn, recent_cutoff)
+    sql_stats = sql.summary_stats(counts['parents'], counts['children'])
+    
+    differences = []
+    for key in sorted(set(pandas_stats) | set(sql_stats)):
+        left, right = pandas_stats.get(key), sql_stats.get(key)
+        if key == 'most_active_parent':
+            # Either name is correct when several parents share the top count
+            left, right = sql.by_parent.get(left), sql.by_parent.get(right)
+        if isinstance(left, (int, float, np.number)) and isinstance(right, (int, float, np.number)):
+            same = math.isclose(float(left), float(right), rel_tol=1e-9, abs_tol=1e-9)
+        else:
+            same = left == right
+        if not same:
+            differences.append(f"summary_stats.{key}: pandas={left!r} sql={right!r}")
+    
+    for name in ('by_status', 'by_type', 'by_date', 'by_hour', 'by_parent', 'recent_by_date'):
+        left, right = dict(getattr(pandas_aggregates, name)), dict(getattr(sql, name))
+        if left != right:
+            differences.append(f"{name}: pandas={left} sql={right}")
+    return differences
+
+def day_aggregates(frame):
+    """Split a requests frame into one RequestAggregates per creation day, counting parents by id"""
+    days = {}
+    if frame.empty:
+        return days
+    for day, rows in frame.groupby(frame['created_at'].dt.date, sort=False):
+        days[str(day)] = RequestAggregates().add_frame(rows, parent_column='parent_id')
+    return days
+
+def read_store_rows(conn, where='', params=(), chunksize=None):
+    return pd.read_sql_query(f'''
+        SELECT id, parent_id, status, request_type, created_at, response_time
+        FROM requests
+        {where}
+    ''', conn, params=params, chunksize=chunksize, dtype=CHUNK_DTYPES, parse_dates=['created_at', 'response_time'])
+
+def rebuild_store(conn, store, chunksize=DEFAULT_CHUNKSIZE):
+    """Recompute every day from scratch; used on the first run or when deletes were pruned unseen"""
+    store.reset()
+    days = {}
+    for chunk in read_store_rows(conn, chunksize=chunksize):
+        for day, aggregates in day_aggregates(chunk).items():
+            if day in days:
+                days[day].merge(aggregates)
+            else:
+                days[day] = aggregates
+        store.track(zip(chunk['id'].tolist(), chunk['created_at'].dt.strftime('%Y-%m-%d').tolist()))
+    for day, aggregates in days.items():
+        store.save_day(day, aggregates.to_dict())
+    return len(days)
+
+def update_store(conn, store, watermark):
+    """Recompute only the days holding requests inserted, updated or deleted after the watermark"""
+    changed = conn.execute('''
+        SELECT id, date(created_at) FROM requests WHERE version > ?
+    ''', (watermark,)).fetchall()
+    deleted = [row[0] for row in conn.execute('''
+        SELECT request_id FROM request_tombstones WHERE version > ?
+    ''', (watermark,))]
+    
+    days = {day for _, day in changed if day}
+    days |= store.days_for(request_id for request_id, _ in changed)
+    days |= store.days_for(deleted)
+    
+    for day in sorted(days):
+        next_day = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+        frame = read_store_rows(conn, 'WHERE created_at >= ? AND created_at < ?', (day, next_day))
+        aggregates = day_aggregates(frame).get(day)
+        if aggregates is None:
+            store.delete_day(day)
+        else:
+            store.save_day(day, aggregates.to_dict())
+    
+    store.forget(deleted)
+    store.track([row for row in changed if row[1]])
+    return len(days)
+
+def refresh_store(conn, store, chunksize=DEFAULT_CHUNKSIZE):
+    """Bring the store up to the database's current change version; returns days recomputed"""
+    # One read transaction, so the version and the rows come from the same snapshot
+    conn.execute('BEGIN')
+    try:
+        version, pruned_version = conn.execute('''
+            SELECT version, pruned_version FROM change_counter WHERE id = 1
+        ''').fetchone()
+        watermark = store.watermark
+        if watermark is None or pruned_version > watermark or version < watermark:
+            refreshed = rebuild_store(conn, store, chunksize)
+        else:
+            refreshed = update_store(conn, store, watermark)
+    finally:
+        conn.rollback()
+    store.commit(version)
+    return refreshed
+
+def stored_aggregates(conn, store, recent_cutoff=None):
+    """Merge the stored days into one RequestAggregates for the reports"""
+    aggregates = RequestAggregates(recent_cutoff)
+    for data in store.load_days().values():
+        aggregates.merge(RequestAggregates.from_dict(data))
+    
+    # Days count parents by id so renames show up without recomputing history
+    names = dict(conn.execute('SELECT id, name FROM users WHERE name IS NOT NULL').fetchall())
+    by_parent = Counter()
+    for parent_id, count in aggregates.by_parent.most_common():
+        if int(parent_id) in names:
+            by_parent[names[int(parent_id)]] += count
+    aggregates.by_parent = by_parent
+    aggregates.recent_by_date.update(recent_counts(conn, aggregates.recent_cutoff))
+    return aggregates
+
+def table_counts(conn):
+    """Row counts used by the reports, without loading the tables"""
+    row = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM requests),
+            (SELECT COUNT(*) FROM users),
+            (SELECT COUNT(*) FROM users WHERE user_type = 'parent'),
+            (SELECT COUNT(*) FROM children)
+    ''').fetchone()
+    return {'requests': row[0], 'users': row[1], 'parents': row[2], 'children': row[3]}
+
 def generate_summary_stats(requests_df, users_df, children_df):
     """Generate summary statistics"""
     stats = {
@@ -95,71 +486,19 @@ def generate_summary_stats(requests_df, users_df, children_df):
     
     return stats
 
-def create_visualizations(requests_df, users_df):
+def create_visualizations(aggregates, fmt='png', dpi=dashboard.DEFAULT_DPI, workers=None):
     """Create data visualizations"""
-    if requests_df.empty:
+    if not aggregates.total:
         print("No data available for visualizations")
         return
     
-    # Set up the plotting area
-    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
-    fig.suptitle('KidCheck Analytics Dashboard', fontsize=16, fontweight='bold')
-    
-    # 1. Request Status Distribution
-    status_counts = requests_df['status'].value_counts()
-    axes[0, 0].pie(status_counts.values, labels=status_counts.index, autopct='%1.1f%%', startangle=90)
-    axes[0, 0].set_title('Request Status Distribution')
-    
-    # 2. Request Type Distribution
-    type_counts = requests_df['request_type'].value_counts()
-    axes[0, 1].bar(type_counts.index, type_counts.values, color=['skyblue', 'lightcoral'])
-    axes[0, 1].set_title('Check-in vs Check-out Requests')
-    axes[0, 1].set_ylabel('Number of Requests')
-    
-    # 3. Daily Request Volume
-    daily_requests = requests_df.groupby(requests_df['created_at'].dt.date).size()
-    axes[0, 2].plot(daily_requests.index, daily_requests.values, marker='o', linewidth=2, markersize=6)
-    axes[0, 2].set_title('Daily Request Volume')
-    axes[0, 2].set_ylabel('Number of Requests')
-    axes[0, 2].tick_params(axis='x', rotation=45)
-    
-    # 4. Response Time Analysis
-    responded_requests = requests_df[requests_df['response_time'].notna()]
-    if not responded_requests.empty:
-        response_times = (responded_requests['response_time'] - responded_requests['created_at']).dt.total_seconds() / 60
-        axes[1, 0].hist(response_times, bins=20, color='lightgreen', alpha=0.7, edgecolor='black')
-        axes[1, 0].set_title('Response Time Distribution')
-        axes[1, 0].set_xlabel('Response Time (minutes)')
-        axes[1, 0].set_ylabel('Frequency')
-    else:
-        axes[1, 0].text(0.5, 0.5, 'No response time data', ha='center', va='center', transform=axes[1, 0].transAxes)
-        axes[1, 0].set_title('Response Time Distribution')
-    
-    # 5. Hourly Request Pattern
-    requests_df['hour'] = requests_df['created_at'].dt.hour
-    hourly_requests = requests_df['hour'].value_counts().sort_index()
-    axes[1, 1].bar(hourly_requests.index, hourly_requests.values, color='orange', alpha=0.7)
-    axes[1, 1].set_title('Hourly Request Pattern')
-    axes[1, 1].set_xlabel('Hour of Day')
-    axes[1, 1].set_ylabel('Number of Requests')
-    
-    # 6. Top Active Parents
-    parent_activity = requests_df['parent_name'].value_counts().head(10)
-    if not parent_activity.empty:
-        axes[1, 2].barh(parent_activity.index, parent_activity.values, color='purple', alpha=0.7)
-        axes[1, 2].set_title('Most Active Parents (Top 10)')
-        axes[1, 2].set_xlabel('Number of Requests')
-    else:
-        axes[1, 2].text(0.5, 0.5, 'No parent data', ha='center', va='center', transform=axes[1, 2].transAxes)
-        axes[1, 2].set_title('Most Active Parents')
+    # Each chart is drawn from the aggregates in its own worker process, headless
+    paths = dashboard.render_all(dashboard.chart_data(aggregates), REPORTS_DIR, fmt, dpi, workers)
     
-    plt.tight_layout()
-    plt.savefig(REPORTS_DIR / 'analytics_dashboard.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    print(f"📊 Analytics dashboard saved to {REPORTS_DIR / 'analytics_dashboard.png'}")
+    print(f"📊 Analytics dashboard saved to {paths[0]}")
+    print(f"📊 {len(paths) - 1} individual charts saved to {REPORTS_DIR / 'charts'}")
 
-def create_detailed_reports(requests_df, users_df, children_df, stats):
+def create_detailed_reports(aggregates, stats, data_counts):
     """Create detailed text and JSON reports"""
     
     # Generate detailed text report
@@ -209,17 +548,14 @@ Most Active Parent: {stats['most_active_parent']} ({stats['most_active_parent_re
 """
     
     # Add recent activity if available
-    if not requests_df.empty:
-        recent_requests = requests_df[requests_df['created_at'] >= datetime.datetime.now() - datetime.timedelta(days=7)]
+    if aggregates.total:
         report_text += f"""
 === RECENT ACTIVITY (Last 7 Days) ===
-Recent Requests: {len(recent_requests)}
+Recent Requests: {sum(aggregates.recent_by_date.values())}
 """
         
-        if not recent_requests.empty:
-            daily_breakdown = recent_requests.groupby(recent_requests['created_at'].dt.date).size()
-            for date, count in daily_breakdown.items():
-                report_text += f"- {date}: {count} requests\n"
+        for date, count in sorted(aggregates.recent_by_date.items()):
+            report_text += f"- {date}: {count} requests\n"
     
     # Save text report
     with open(REPORTS_DIR / 'analytics_report.txt', 'w') as f:
@@ -230,24 +566,15 @@ Recent Requests: {len(recent_requests)}
         'generated_at': datetime.datetime.now().isoformat(),
         'summary_stats': stats,
         'data_counts': {
-            'requests': len(requests_df),
-            'users': len(users_df),
-            'children': len(children_df)
+            'requests': data_counts['requests'],
+            'users': data_counts['users'],
+            'children': data_counts['children']
         }
     }
     
     # Add detailed breakdowns if data exists
-    if not requests_df.empty:
-        json_report['request_breakdown'] = {
-            'by_status': requests_df['status'].value_counts().to_dict(),
-            'by_type': requests_df['request_type'].value_counts().to_dict(),
-            'by_date': requests_df.groupby(requests_df['created_at'].dt.date).size().to_dict()
-        }
-        
-        # Convert date keys to strings for JSON serialization
-        json_report['request_breakdown']['by_date'] = {
-            str(k): v for k, v in json_report['request_breakdown']['by_date'].items()
-        }
+    if aggregates.total:
+        json_report['request_breakdown'] = aggregates.request_breakdown()
     
     with open(REPORTS_DIR / 'analytics_data.json', 'w') as f:
         json.dump(json_report, f, indent=2, default=str)
@@ -271,49 +598,249 @@ def export_raw_data(requests_df, users_df, children_df):
         children_df.to_csv(REPORTS_DIR / 'children_data.csv', index=False)
         print(f"👶 Children data exported to {REPORTS_DIR / 'children_data.csv'}")
 
-def main():
+def export_raw_data_chunked(conn, chunksize=DEFAULT_CHUNKSIZE):
+    """Export raw data to CSV one chunk at a time"""
+    exports = [
+        ('requests_data.csv', '''
+            SELECT r.*, u.name as parent_name, u.email as parent_email
+            FROM requests r
+            LEFT JOIN users u ON r.parent_id = u.id
+        ''', "📊 Requests"),
+        ('users_data.csv', 'SELECT id, email, name, user_type, created_at FROM users', "👥 Users"),
+        ('children_data.csv', 'SELECT * FROM children', "👶 Children"),
+    ]
+    for filename, sql, label in exports:
+        path = REPORTS_DIR / filename
+        rows = 0
+        for index, chunk in enumerate(pd.read_sql_query(sql, conn, chunksize=chunksize)):
+            chunk.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+            rows += len(chunk)
+        if rows:
+            print(f"{label} data exported to {path}")
+
+def export_columnar_data(fmt, chunksize=DEFAULT_CHUNKSIZE):
+    """Export month-partitioned Parquet or Arrow files, rewriting only partitions that changed"""
+    out_dir = REPORTS_DIR / fmt
+    conn = connect()
+    try:
+        result = columnar_export.export_columnar(conn, out_dir, fmt, chunksize)
+    finally:
+        conn.close()
+    print(f"📦 {fmt} export in {out_dir}: wrote {len(result['written'])} month(s) ({result['rows']} rows), "
+          f"kept {len(result['unchanged'])} unchanged, removed {len(result['removed'])}")
+
+def write_school_report(out_dir, aggregates, counts, fmt='png', dpi=dashboard.DEFAULT_DPI):
+    """Dashboard and JSON for one school, or for the merged district"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stats = aggregates.summary_stats(counts['parents'], counts['children'])
+    if aggregates.total:
+        dashboard.render_dashboard(dashboard.chart_data(aggregates), out_dir / f'analytics_dashboard.{fmt}', dpi,
+                                   title=f'KidCheck Analytics Dashboard - {out_dir.name}')
+    
+    with open(out_dir / 'analytics_data.json', 'w') as f:
+        json.dump({
+            'generated_at': datetime.datetime.now().isoformat(),
+            'summary_stats': stats,
+            'data_counts': counts,
+            'request_breakdown': aggregates.request_breakdown(),
+        }, f, indent=2, default=str)
+    return stats
+
+def analyze_school(database, out_dir, fmt='png', dpi=dashboard.DEFAULT_DPI):
+    """Aggregate one school's database in SQL and render its report; runs in a worker process
+
+    Returns the school's stats plus its mergeable aggregates, with parents
+    labelled by school so same-named parents stay distinct district-wide.
+    """
+    conn = connect(database)
+    try:
+        counts = table_counts(conn)
+        aggregates = sql_aggregates(conn)
+    finally:
+        conn.close()
+    
+    stats = write_school_report(out_dir, aggregates, counts, fmt, dpi)
+    partial = aggregates.to_dict()
+    partial['by_parent'] = {f'{parent} ({out_dir.name})': n for parent, n in aggregates.by_parent.items()}
+    partial['recent_by_date'] = dict(aggregates.recent_by_date)
+    return stats, partial, counts
+
+def run_per_school(schools_dir, fmt='png', dpi=dashboard.DEFAULT_DPI, workers=None):
+    """Fan the report out over every school database (*.db) in a directory"""
+    databases = sorted(Path(schools_dir).glob('*.db'))
+    if not databases:
+        print(f"⚠️  No school databases (*.db) found in {schools_dir}")
+        return {}
+    
+    print(f"🏫 Generating reports for {len(databases)} schools...")
+    results = {}
+    district = RequestAggregates()
+    district_counts = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(analyze_school, database, REPORTS_DIR / 'schools' / database.stem, fmt, dpi): database.stem
+            for database in databases
+        }
+        for future in as_completed(futures):
+            school = futures[future]
+            try:
+                stats, partial, counts = future.result()
+            except Exception as e:
+                print(f"❌ {school}: {e}")
+                continue
+            results[school] = stats
+            # Shards are disjoint, so merging their partial aggregates gives exact district counts
+            school_aggregates = RequestAggregates.from_dict(partial)
+            school_aggregates.recent_by_date.update(partial['recent_by_date'])
+            district.merge(school_aggregates)
+            district_counts.update(counts)
+    
+    district_stats = write_school_report(REPORTS_DIR / 'schools' / 'district', district, district_counts, fmt, dpi)
+    with open(REPORTS_DIR / 'schools' / 'summary.json', 'w') as f:
+        json.dump({
+            'district': district_stats,
+            'schools': {school: results[school] for school in sorted(results)},
+        }, f, indent=2, default=str)
+    print(f"✅ {len(results)}/{len(databases)} school reports saved to {REPORTS_DIR / 'schools'}")
+    print(f"🏫 District totals: {district_stats['total_requests']} requests across {len(results)} schools")
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='KidCheck data analytics')
+    parser.add_argument('--engine', choices=['pandas', 'sql'], default='pandas',
+                        help='compute aggregates in pandas, or push them down into SQLite GROUP BY queries')
+    parser.add_argument('--stream', action='store_true',
+                        help='read requests in chunks with bounded memory instead of loading whole tables')
+    parser.add_argument('--incremental', action='store_true',
+                        help='fold only requests changed since the last run into stored per-day aggregates')
+    parser.add_argument('--state', type=Path, default=REPORTS_DIR / 'analytics_state.db',
+                        help='side database for incremental aggregates')
+    parser.add_argument('--check-engines', action='store_true',
+                        help='run both engines against the database and report any differences')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='rows per chunk in streaming mode')
+    parser.add_argument('--format', choices=dashboard.FORMATS, default='png',
+                        help='chart output format')
+    parser.add_argument('--dpi', type=int, default=dashboard.DEFAULT_DPI,
+                        help='chart resolution for raster formats')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for chart rendering and per-school reports (default: CPU count)')
+    parser.add_argument('--schools', type=Path, default=None,
+                        help='directory of per-school shards (SHARDS_DIR); one report per school in parallel, plus the district')
+    parser.add_argument('--export', choices=['parquet', 'arrow', 'csv'],
+                        default='parquet' if columnar_export.available() else 'csv',
+                        help='raw data format: month-partitioned Parquet, Arrow IPC for memory-mapped reads, or CSV')
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main analytics function"""
+    args = parse_args(argv)
+    
     print("🔍 KidCheck Data Analytics")
     print("=" * 50)
     
     # Ensure reports directory exists
     ensure_reports_dir()
     
-    # Load data
-    print("📊 Loading data from database...")
-    requests_df, users_df, children_df = get_data()
-    
-    if requests_df.empty and users_df.empty:
-        print("⚠️  No data found in database. Make sure the app has been used and data exists.")
+    if args.schools is not None:
+        run_per_school(args.schools, args.format, args.dpi, args.workers)
         return
     
-    print(f"✅ Loaded {len(requests_df)} requests, {len(users_df)} users, {len(children_df)} children")
+    if args.check_engines:
+        print("🔬 Comparing pandas and SQL engines...")
+        conn = connect()
+        differences = compare_engines(conn)
+        conn.close()
+        for difference in differences:
+            print(f"❌ {difference}")
+        if differences:
+            raise SystemExit(1)
+        print("✅ Engines agree")
+        return
     
-    # Generate statistics
-    print("📈 Generating summary statistics...")
-    stats = generate_summary_stats(requests_df, users_df, children_df)
+    # Load data
+    from_database = args.stream or args.incremental or args.engine == 'sql'
+    if from_database:
+        conn = connect()
+        counts = table_counts(conn)
+        if counts['requests'] == 0 and counts['users'] == 0:
+            conn.close()
+            print("⚠️  No data found in database. Make sure the app has been used and data exists.")
+            return
+        
+        if args.incremental:
+            print(f"📊 Updating incremental aggregates in {args.state}...")
+            store = AnalyticsStore(args.state)
+            try:
+                refreshed_days = refresh_store(conn, store, args.chunksize)
+                aggregates = stored_aggregates(conn, store)
+            except sqlite3.OperationalError as e:
+                conn.close()
+                print(f"⚠️  Incremental mode needs the change-tracking schema; start the API once to migrate ({e})")
+                return
+            finally:
+                store.close()
+            print(f"🔁 Recomputed {refreshed_days} day(s) changed since the last run")
+        elif args.engine == 'sql':
+            print("📊 Aggregating inside the database...")
+            aggregates = sql_aggregates(conn)
+        else:
+            print(f"📊 Streaming data from database in chunks of {args.chunksize}...")
+            aggregates = stream_aggregates(conn, args.chunksize)
+        print(f"✅ Aggregated {counts['requests']} requests, {counts['users']} users, {counts['children']} children")
+        
+        print("📈 Generating summary statistics...")
+        stats = aggregates.summary_stats(counts['parents'], counts['children'])
+    else:
+        print("📊 Loading data from database...")
+        requests_df, users_df, children_df = get_data()
+        
+        if requests_df.empty and users_df.empty:
+            print("⚠️  No data found in database. Make sure the app has been used and data exists.")
+            return
+        
+        print(f"✅ Loaded {len(requests_df)} requests, {len(users_df)} users, {len(children_df)} children")
+        counts = {'requests': len(requests_df), 'users': len(users_df), 'children': len(children_df)}
+        
+        # Generate statistics
+        print("📈 Generating summary statistics...")
+        stats = generate_summary_stats(requests_df, users_df, children_df)
+        aggregates = RequestAggregates.from_frame(requests_df)
     
     # Create visualizations
     print("📊 Creating visualizations...")
-    create_visualizations(requests_df, users_df)
+    create_visualizations(aggregates, args.format, args.dpi, args.workers)
     
     # Create detailed reports
     print("📄 Generating detailed reports...")
-    create_detailed_reports(requests_df, users_df, children_df, stats)
+    create_detailed_reports(aggregates, stats, counts)
     
     # Export raw data
     print("💾 Exporting raw data...")
-    export_raw_data(requests_df, users_df, children_df)
+    if args.export != 'csv':
+        export_columnar_data(args.export, args.chunksize)
+    elif from_database:
+        export_raw_data_chunked(conn, args.chunksize)
+    else:
+        export_raw_data(requests_df, users_df, children_df)
+    if from_database:
+        conn.close()
     
     print("\n🎉 Analytics complete!")
     print(f"📁 All reports saved to: {REPORTS_DIR.absolute()}")
     print("\nGenerated files:")
-    print("- analytics_dashboard.png (Visual dashboard)")
+    print(f"- analytics_dashboard.{args.format} (Visual dashboard)")
+    print(f"- charts/*.{args.format} (Individual charts)")
     print("- analytics_report.txt (Detailed text report)")
     print("- analytics_data.json (Machine-readable data)")
-    print("- requests_data.csv (Raw requests data)")
-    print("- users_data.csv (Raw users data)")
-    print("- children_data.csv (Raw children data)")
+    if args.export == 'csv':
+        print("- requests_data.csv (Raw requests data)")
+        print("- users_data.csv (Raw users data)")
+        print("- children_data.csv (Raw children data)")
+    else:
+        print(f"- {args.export}/requests/month=YYYY-MM/ (Raw requests data, one partition per month)")
+        print(f"- {args.export}/users{columnar_export.FORMATS[args.export]} (Raw users data)")
+        print(f"- {args.export}/children{columnar_export.FORMATS[args.export]} (Raw children data)")
 
 if __name__ == '__main__':
     main()
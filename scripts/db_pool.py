@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+KidCheck Database Connection Pool
+Bounded pool of long-lived SQLite connections tuned for many readers and one writer
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Per-connection pragmas applied whenever the pool opens a new connection.
+# WAL lets the 2-second pollers keep reading while a request is being written,
+# and synchronous=NORMAL is durable across application crashes in WAL mode.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': -int(os.environ.get('DB_CACHE_SIZE_KB', 16384)),
+    'mmap_size': int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class PooledConnection:
+    """Thin proxy around a sqlite3 connection whose close() returns it to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection')
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def released(self):
+        return self._conn is None
+
+    def close(self):
+        """Hand the connection back to the pool instead of closing it"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of SQLite connections shared across request threads"""
+
+    def __init__(self, database, max_size=8, timeout=5.0, busy_timeout_ms=5000, pragmas=None):
+        self.database = database
+        self.max_size = max(1, int(max_size))
+        self.timeout = float(timeout)
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+        # LIFO keeps the most recently used (warmest page cache) connection in play
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'in_use': 0,
+            'wait_time_ms': 0.0,
+        }
+
+    def connect(self) -> sqlite3.Connection:
+        """Open an unpooled connection with the pool's pragmas, e.g. for a dedicated writer"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout_ms}')
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection, opening a new one while under max_size"""
+        if self._closed:
+            raise PoolTimeout('Connection pool is closed')
+
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._stats['created'] < self.max_size
+                if can_create:
+                    self._stats['created'] += 1
+            if can_create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._stats['created'] -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                finally:
+                    with self._lock:
+                        self._stats['wait_time_ms'] += (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a raw connection to the idle set, discarding any open transaction"""
+        with self._lock:
+            self._stats['in_use'] -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped so the next checkout opens a fresh one
+            with self._lock:
+                self._stats['created'] -= 1
+            conn.close()
+            return
+
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def reset_after_fork(self):
+        """Start empty in a forked child; connections opened by the parent must not be reused"""
+        _inherited.extend(self._idle.queue)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stats['created'] = 0
+        self._stats['in_use'] = 0
+
+    def close_all(self):
+        """Close every idle connection and refuse further checkouts"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._stats['created'] -= 1
+
+    def stats(self) -> Dict:
+        """Snapshot of pool counters for the health endpoint"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['size'] = snapshot['created']
+        snapshot['idle'] = self._idle.qsize()
+        snapshot['max_size'] = self.max_size
+        snapshot['wait_time_ms'] = round(snapshot['wait_time_ms'], 3)
+        return snapshot
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+# Connections inherited across fork() stay referenced so they are never closed from the child
+_inherited = []
+
+
+def get_pool(database, **options) -> ConnectionPool:
+    """Return the process-wide pool for a database file, creating it on first use"""
+    pool: Optional[ConnectionPool] = _pools.get(database)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(database)
+            if pool is None:
+                options.setdefault('max_size', int(os.environ.get('DB_POOL_SIZE', 8)))
+                options.setdefault('timeout', float(os.environ.get('DB_POOL_TIMEOUT', 5.0)))
+                options.setdefault('busy_timeout_ms', int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)))
+                pool = ConnectionPool(database, **options)
+                _pools[database] = pool
+    return pool
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """Stats for every pool opened in this process, keyed by database file"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {database: pool.stats() for database, pool in pools.items()}
+
+
+def close_pools():
+    """Close every pool created in this process"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def _reset_pools_after_fork():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool.reset_after_fork()
+
+
+# Pre-forking servers (gunicorn --preload) import the app, and open pools, in the master
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
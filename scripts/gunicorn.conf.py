@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+KidCheck Gunicorn Settings
+Production server: the app preloaded once, N worker processes x M threads, bounded queues
+
+    gunicorn -c scripts/gunicorn.conf.py
+
+Reloads: `kill -HUP <master>` replaces workers gracefully with this config
+re-read (code is not re-imported, since the app is preloaded); `kill -USR2`
+then `kill -QUIT` on the old master upgrades to new code with no dropped
+connections, re-running the idempotent migrations once in the new master.
+"""
+
+import os
+
+# Put scripts/ on sys.path without changing the working directory, so the
+# SQLite files resolve exactly as with `python scripts/backend_api.py`
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'wsgi:application'
+bind = [f"0.0.0.0:{os.environ.get('PORT', 5000)}"]
+
+# Import the app and run init_db() once in the master, then fork
+preload_app = True
+
+# Threads share a process's connection pool and caches. SQLite allows one writer
+# at a time across all processes: writers wait up to DB_BUSY_TIMEOUT_MS for the
+# lock, so keep workers x threads moderate (or use WRITE_BEHIND=true to
+# group-commit inserts per process).
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_WORKERS', min(4, (os.cpu_count() or 1) * 2)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# A login's thread waits while its password hash runs on the hasher's pool. Let
+# hashing hold at most half of each worker's threads, so polls keep the rest,
+# and split the CPUs between the workers' hash pools.
+os.environ.setdefault('KDF_MAX_PENDING', str(max(1, threads // 2)))
+os.environ.setdefault('KDF_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+# Bounded queues: the kernel accept backlog, then at most worker_connections open
+# connections per worker waiting on its threads. Beyond that clients get refused
+# quickly instead of timing out in an unbounded queue.
+backlog = int(os.environ.get('WEB_BACKLOG', 256))
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', threads * 8))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Recycle workers periodically; jitter keeps them from restarting together
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# WEB_ACCESS_LOG= (empty) turns the access log off
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Start each worker's archiver, and the change feed when there is a single worker
+
+    Events are published in-process, so with several workers a stream would
+    only see the writes its own worker handled. Clients fall back to
+    ?since= polling when the stream port is closed.
+    """
+    from backend_api import STREAM_ALLOWED_ORIGINS, STREAM_PORT, archiver, authenticate_stream, change_bus
+    from change_feed import start_stream_server
+
+    if archiver is not None:
+        archiver.start()
+    if server.cfg.workers != 1:
+        return
+
+    if STREAM_PORT:
+        # The worker being replaced on a reload may still hold the port while it drains
+        start_stream_server(change_bus, authenticate_stream, port=STREAM_PORT, reuse_port=True,
+                            allowed_origins=STREAM_ALLOWED_ORIGINS)
+        server.log.info('Change feed on port %s', STREAM_PORT)
+
+
+def when_ready(server):
+    server.log.info('KidCheck API: %s worker(s) x %s thread(s), backlog %s',
+                    server.cfg.workers, server.cfg.threads, server.cfg.backlog)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+KidCheck JSON Streaming
+Incremental JSON encoding of database rows, for chunked API responses
+"""
+
+import json
+import os
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from metrics import phase
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used without it
+    orjson = None
+
+# JSON_BACKEND=auto uses orjson when it is installed; json forces the standard library
+JSON_BACKENDS = ('auto', 'orjson', 'json')
+
+_std_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, check_circular=False, default=str)
+
+
+def _dumps_std(value) -> bytes:
+    return _std_encoder.encode(value).encode('utf-8')
+
+
+def _dumps_orjson(value) -> bytes:
+    return orjson.dumps(value, default=str)
+
+
+def json_backend(name=None) -> str:
+    """Resolve JSON_BACKEND (or name) to the encoder that will be used: 'orjson' or 'json'"""
+    name = (name or os.environ.get('JSON_BACKEND', 'auto')).lower()
+    if name not in JSON_BACKENDS:
+        raise ValueError(f'Unknown JSON_BACKEND {name!r}; expected one of {", ".join(JSON_BACKENDS)}')
+    if name == 'orjson' and orjson is None:
+        raise ValueError('JSON_BACKEND=orjson needs orjson (pip install orjson)')
+    if name == 'auto':
+        return 'json' if orjson is None else 'orjson'
+    return name
+
+
+def dumps_function(backend=None) -> Callable[[object], bytes]:
+    """Compact UTF-8 encoder for a backend name, as bytes"""
+    return _dumps_orjson if json_backend(backend) == 'orjson' else _dumps_std
+
+
+class RowEncoder:
+    """Encodes batches of rows that share one column layout as comma-separated JSON objects
+
+    The layout is compiled once from the first row's columns: the output keys
+    (columns, then aliases copying another column) and a C-level getter that
+    pulls the values out in that order. Each batch is then one getter call
+    per row and a single encoder call for the whole batch.
+
+    Rows may be sqlite3.Row (read by position) or dicts (read by name), and
+    fields, when given, keeps only those output keys.
+    """
+
+    def __init__(self, columns: Sequence[str], aliases: Optional[Dict[str, str]] = None, by_name=False,
+                 backend=None, fields=None):
+        columns = list(columns)
+        aliases = aliases or {}
+        layout = list(zip(columns, columns)) + list(aliases.items())
+        if fields is not None:
+            layout = [(key, source) for key, source in layout if key in fields]
+        self.keys = tuple(key for key, _ in layout)
+        sources = [source for _, source in layout]
+        if not by_name:
+            position = {column: index for index, column in enumerate(columns)}
+            sources = [position[source] for source in sources]
+        getter = itemgetter(*sources)
+        self._values = getter if len(sources) > 1 else (lambda row: (getter(row),))
+        self._dumps = dumps_function(backend)
+
+    @classmethod
+    def for_row(cls, row, aliases=None, backend=None, fields=None) -> 'RowEncoder':
+        return cls(row.keys(), aliases, by_name=isinstance(row, dict), backend=backend, fields=fields)
+
+    def encode(self, rows: List) -> bytes:
+        """One batch as b'{...},{...}', ready to sit between other batches in a JSON array"""
+        keys, values = self.keys, self._values
+        return self._dumps([dict(zip(keys, values(row))) for row in rows])[1:-1]
+
+
+def stream_object(head: Dict, array_key, batches: Iterable[List], tail: Callable[[], Dict] = None,
+                  aliases: Optional[Dict[str, str]] = None, backend=None, fields=None) -> Iterator[bytes]:
+    """Yield one JSON object in pieces: head's members, array_key streamed from row batches, then tail()'s members
+
+    tail is called after the last batch, so it can report something learned
+    while streaming or run a query of its own. Memory is bounded by one batch.
+    """
+    dumps = dumps_function(backend)
+    opening = dumps(head)[:-1]
+    yield opening + (b',' if head else b'') + dumps(array_key) + b':['
+
+    encoder = None
+    separator = b''
+    for rows in batches:
+        if not rows:
+            continue
+        with phase('encode'):
+            if encoder is None:
+                encoder = RowEncoder.for_row(rows[0], aliases, backend, fields)
+            chunk = separator + encoder.encode(rows)
+        yield chunk
+        separator = b','
+
+    members = tail() if tail is not None else None
+    yield b']' + (b',' + dumps(members)[1:] if members else b'}')
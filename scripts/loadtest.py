@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+KidCheck Load Test
+Seeds a database, starts the API and replays the drop-off/dismissal spike from simulated parents and admins
+
+    python scripts/loadtest.py --parents 300 --admins 3 --duration 60 --save baseline.json
+    python scripts/loadtest.py --parents 300 --admins 3 --duration 60 --compare baseline.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from migrations import run_migrations  # noqa: E402
+from passwords import hasher_from_env  # noqa: E402
+
+# app.js polls /api/requests on this cadence whenever the change feed is not connected
+POLL_INTERVAL = 2.0
+GRADES = ['K', '1', '2', '3', '4', '5', '6', '7', '8']
+PASSWORD = 'loadtest-password'
+ADMIN_NAME = 'admin'
+ADMIN_PASSWORD = '123456'
+
+# Error kinds counted separately from plain failures
+LOCK_MARKERS = ('database is locked', 'database table is locked', 'No database connection available')
+
+
+def parent_email(index) -> str:
+    return f'loadtest-parent-{index}@example.com'
+
+
+def utc(moment) -> str:
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def seed_database(database, parents, children_per_parent=2, history_per_parent=20, history_days=30, seed=1) -> Dict:
+    """Create parents (all with PASSWORD), their children and a backlog of resolved requests
+
+    Rows go straight into SQLite in one transaction; the change-tracking and
+    rollup triggers run as they would for API writes.
+    """
+    rng = random.Random(seed)
+    password_hash = hasher_from_env().hash(PASSWORD)
+    now = datetime.now(timezone.utc)
+
+    conn = sqlite3.connect(database)
+    try:
+        run_migrations(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany('''
+            INSERT INTO users (email, name, password_hash, user_type) VALUES (?, ?, ?, 'parent')
+        ''', [(parent_email(i), f'Parent {i}', password_hash) for i in range(parents)])
+        user_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM users WHERE email LIKE 'loadtest-parent-%' ORDER BY id")]
+
+        children = []
+        for user_id in user_ids:
+            for n in range(children_per_parent):
+                children.append((user_id, f'Child {user_id}-{n}', rng.choice(GRADES)))
+        conn.executemany('INSERT INTO children (parent_id, name, grade) VALUES (?, ?, ?)', children)
+
+        history = []
+        for parent_id, child_name, grade in children:
+            for _ in range(history_per_parent // max(1, children_per_parent)):
+                created = now - timedelta(days=rng.uniform(1, history_days))
+                responded = created + timedelta(seconds=rng.lognormvariate(4, 1))
+                history.append((parent_id, child_name, grade, rng.choice(('checkin', 'checkout')), '',
+                                rng.choice(('approved', 'approved', 'approved', 'denied')), 'ok',
+                                utc(responded), utc(created), utc(responded)))
+        conn.executemany('''
+            INSERT INTO requests (parent_id, child_name, child_grade, request_type, request_message,
+                                  status, feedback, response_time, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', history)
+        conn.commit()
+    finally:
+        conn.close()
+    return {'parents': len(user_ids), 'children': len(children), 'requests': len(history)}
+
+
+class Results:
+    """Latency samples and outcomes per route, shared by every client thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route, seconds, outcome):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            counts = self.outcomes.setdefault(route, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def summary(self, elapsed) -> Dict:
+        with self._lock:
+            samples = {route: sorted(values) for route, values in self.samples.items()}
+            outcomes = {route: dict(counts) for route, counts in self.outcomes.items()}
+
+        routes = {}
+        for route, values in sorted(samples.items()):
+            counts = outcomes[route]
+            failed = sum(count for outcome, count in counts.items() if outcome not in ('ok', 'not_modified'))
+            routes[route] = {
+                'count': len(values),
+                'rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+                'error_rate': round(failed / len(values), 4),
+                'lock_rate': round(counts.get('lock', 0) / len(values), 4),
+                'outcomes': counts,
+            }
+        total = sum(route['count'] for route in routes.values())
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'requests': total,
+            'rps': round(total / elapsed, 2) if elapsed else 0,
+            'routes': routes,
+        }
+
+
+def percentile(sorted_values, pct) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Client:
+    """One browser: a keep-alive connection, the session cookie and the last listing ETag"""
+
+    def __init__(self, base_url, results: Results, timeout=10.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.results = results
+        self.cookie = None
+        self.etag = None
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def call(self, method, path, route, body=None, headers=None):
+        """Send one request and record it under route; returns (status, parsed JSON or None)"""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            self.results.record(route, time.perf_counter() - started, 'timeout' if 'timed out' in str(e) else 'connection')
+            return None, None
+        elapsed = time.perf_counter() - started
+
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('ETag'):
+            self.etag = response.getheader('ETag')
+
+        data = None
+        if raw and response.getheader('Content-Type', '').startswith('application/json'):
+            data = json.loads(raw)
+        self.results.record(route, elapsed, classify(response.status, data))
+        return response.status, data
+
+    def close(self):
+        self.conn.close()
+
+
+def classify(status, data) -> str:
+    if status == 304:
+        return 'not_modified'
+    if status < 400:
+        return 'ok'
+    error = (data or {}).get('error', '') if isinstance(data, dict) else ''
+    if any(marker in error for marker in LOCK_MARKERS):
+        return 'lock'
+    if status == 503:
+        return 'busy'
+    return f'http_{status}'
+
+
+def poll(client, route='GET /api/requests', path='/api/requests'):
+    """Poll the listing the way a browser revalidates it: If-None-Match with the last ETag"""
+    headers = {'If-None-Match': client.etag} if client.etag else {}
+    return client.call('GET', path, route, headers=headers)
+
+
+def run_parent(index, base_url, results, stop_at, ramp_up, spike_start, spike_end, requests_per_parent, rng):
+    client = Client(base_url, results)
+    try:
+        time.sleep(rng.uniform(0, ramp_up))
+        status, _ = client.call('POST', '/api/login', 'POST /api/login',
+                                {'email': parent_email(index), 'password': PASSWORD})
+        if status != 200:
+            return
+
+        # Each parent sends its check-in/out requests at random moments inside the spike
+        sends = sorted(rng.uniform(spike_start, spike_end) for _ in range(requests_per_parent))
+        next_poll = time.monotonic() + rng.uniform(0, POLL_INTERVAL)
+        while time.monotonic() < stop_at:
+            now = time.monotonic()
+            if sends and sends[0] <= now:
+                sends.pop(0)
+                client.call('POST', '/api/requests', 'POST /api/requests', {
+                    'type': rng.choice(('checkin', 'checkout')),
+                    'childName': f'Child of {index}',
+                    'childGrade': rng.choice(GRADES),
+                    'requestMessage': 'Has my child arrived?',
+                })
+                continue
+            if now >= next_poll:
+                poll(client)
+                next_poll += POLL_INTERVAL
+                continue
+            time.sleep(max(0.0, min(next_poll, sends[0] if sends else next_poll, stop_at) - now))
+    finally:
+        client.close()
+
+
+def run_admin(base_url, results, stop_at, responses_per_poll, rng):
+    client = Client(base_url, results)
+    pending: List[int] = []
+    try:
+        status, _ = client.call('POST', '/api/admin/login', 'POST /api/admin/login',
+                                {'name': ADMIN_NAME, 'password': ADMIN_PASSWORD})
+        if status != 200:
+            return
+
+        next_poll = time.monotonic()
+        while time.monotonic() < stop_at:
+            status, data = poll(client)
+            if status == 200 and data:
+                pending = [row['id'] for row in data.get('requests', []) if row.get('status') == 'pending']
+                rng.shuffle(pending)
+            # Answer a few pending requests between polls, as a staff member would
+            for request_id in pending[:responses_per_poll]:
+                client.call('PUT', f'/api/requests/{request_id}', 'PUT /api/requests/<id>', {
+                    'status': rng.choice(('approved', 'approved', 'denied')),
+                    'feedback': 'Confirmed by office',
+                })
+            pending = pending[responses_per_poll:]
+            next_poll += POLL_INTERVAL
+            time.sleep(max(0.0, min(next_poll, stop_at) - time.monotonic()))
+    finally:
+        client.close()
+
+
+def start_server(workdir, port, server='flask', workers=2, threads=4, extra_env=None) -> subprocess.Popen:
+    """Start the API in workdir (where kidcheck.db lives) and wait for /api/health"""
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'STREAM_PORT': '0',  # clients poll, as they do whenever the feed is unavailable
+        'SECRET_KEY': env.get('SECRET_KEY', 'loadtest'),
+        'DEBUG': 'False',
+    })
+    env.update(extra_env or {})
+    if server == 'gunicorn':
+        env.update({'WEB_WORKERS': str(workers), 'WEB_THREADS': str(threads), 'WEB_ACCESS_LOG': ''})
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(SCRIPTS_DIR, 'gunicorn.conf.py')]
+    else:
+        command = [sys.executable, os.path.join(SCRIPTS_DIR, 'backend_api.py')]
+
+    log_path = os.path.join(workdir, 'server.log')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as log:
+                tail = ''.join(log.readlines()[-10:])
+            raise RuntimeError(f'Server exited with {process.returncode}:\n{tail}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'Server did not become healthy within 60s; see {log_path}')
+
+
+def register_parents(base_url, parents):
+    """Create the load-test parents through the API on a server we did not seed (409s are fine)"""
+    client = Client(base_url, Results())
+    try:
+        for index in range(parents):
+            client.call('POST', '/api/register', 'POST /api/register', {
+                'email': parent_email(index), 'password': PASSWORD, 'name': f'Parent {index}',
+                'childName': f'Child of {index}',
+            })
+            client.cookie = None
+    finally:
+        client.close()
+
+
+def run_load(base_url, parents, admins, duration, ramp_up, spike_start, spike_length,
+             requests_per_parent, responses_per_poll, seed=1) -> Dict:
+    """Drive the spike against base_url and return the summary"""
+    results = Results()
+    rng = random.Random(seed)
+    started = time.monotonic()
+    stop_at = started + duration
+    spike_from = started + spike_start
+    spike_to = min(stop_at, spike_from + spike_length)
+
+    threads = [
+        threading.Thread(target=run_parent, daemon=True, args=(
+            index, base_url, results, stop_at, ramp_up, spike_from, spike_to, requests_per_parent,
+            random.Random(rng.random())))
+        for index in range(parents)
+    ] + [
+        threading.Thread(target=run_admin, daemon=True, args=(
+            base_url, results, stop_at, responses_per_poll, random.Random(rng.random())))
+        for _ in range(admins)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=max(0.0, stop_at - time.monotonic()) + 30)
+    return results.summary(time.monotonic() - started)
+
+
+def print_report(summary, baseline=None):
+    print(f"📈 {summary['requests']} requests in {summary['elapsed_s']}s ({summary['rps']} req/s)")
+    header = f"{'route':<28}{'count':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'locks':>8}"
+    print(header)
+    print('-' * len(header))
+    for route, stats in summary['routes'].items():
+        print(f"{route:<28}{stats['count']:>8}{stats['rps']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['error_rate']:>9.2%}{stats['lock_rate']:>8.2%}")
+        before = (baseline or {}).get('routes', {}).get(route)
+        if before:
+            print(f"{'  vs baseline':<28}{'':>8}{'':>9}{delta(before['p50_ms'], stats['p50_ms']):>10}"
+                  f"{delta(before['p95_ms'], stats['p95_ms']):>10}{delta(before['p99_ms'], stats['p99_ms']):>10}"
+                  f"{stats['error_rate'] - before['error_rate']:>+9.2%}{stats['lock_rate'] - before['lock_rate']:>+8.2%}")
+
+
+def delta(before, after) -> str:
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before:+.0%}'
+
+
+def regressions(summary, baseline, tolerance, min_samples=20) -> List[str]:
+    """Routes whose p95 grew by more than tolerance, or whose error rate rose, against baseline
+
+    Routes with fewer than min_samples requests in either run (logins, usually)
+    are too noisy to judge and are skipped.
+    """
+    found = []
+    for route, stats in summary['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before or min(before['count'], stats['count']) < min_samples:
+            continue
+        if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append(f"{route}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+        if stats['error_rate'] > before['error_rate'] + 0.001:
+            found.append(f"{route}: error rate {before['error_rate']:.2%} -> {stats['error_rate']:.2%}")
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='KidCheck drop-off/dismissal load test')
+    parser.add_argument('--url', help='test an already running server instead of seeding and starting one')
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask', help='server to start locally')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--workdir', help='directory for the seeded database and server log (default: a temp dir)')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for the server, e.g. --env WRITE_BEHIND=true')
+    parser.add_argument('--parents', type=int, default=200, help='simulated parents (one client each)')
+    parser.add_argument('--admins', type=int, default=2, help='simulated admin dashboards')
+    parser.add_argument('--children-per-parent', type=int, default=2)
+    parser.add_argument('--history-per-parent', type=int, default=20, help='resolved requests seeded per parent')
+    parser.add_argument('--history-days', type=int, default=30)
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+    parser.add_argument('--ramp-up', type=float, default=10, help='seconds over which parents log in')
+    parser.add_argument('--spike-start', type=float, default=15, help='seconds into the run the spike begins')
+    parser.add_argument('--spike-length', type=float, default=30, help='seconds the POST burst lasts')
+    parser.add_argument('--requests-per-parent', type=int, default=1, help='requests each parent sends in the spike')
+    parser.add_argument('--responses-per-poll', type=int, default=5, help='requests each admin answers per poll')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the results as JSON, e.g. to keep as a baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth over the baseline')
+    parser.add_argument('--min-samples', type=int, default=20, help='ignore routes with fewer requests when comparing')
+    args = parser.parse_args(argv)
+
+    process = None
+    workdir = args.workdir
+    cleanup = False
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            register_parents(base_url, args.parents)
+        else:
+            if workdir:
+                os.makedirs(workdir, exist_ok=True)
+            else:
+                workdir = tempfile.mkdtemp(prefix='kidcheck-loadtest-')
+                cleanup = True
+            for name in ('kidcheck.db', 'kidcheck.db-wal', 'kidcheck.db-shm', 'kidcheck_sessions.db'):
+                if os.path.exists(os.path.join(workdir, name)):
+                    os.remove(os.path.join(workdir, name))
+            seeded = seed_database(os.path.join(workdir, 'kidcheck.db'), args.parents, args.children_per_parent,
+                                   args.history_per_parent, args.history_days, args.seed)
+            print(f"🌱 Seeded {seeded['parents']} parents, {seeded['children']} children, "
+                  f"{seeded['requests']} historical requests in {workdir}")
+            extra_env = dict(item.split('=', 1) for item in args.env)
+            process = start_server(workdir, args.port, args.server, args.workers, args.threads, extra_env)
+            base_url = f'http://127.0.0.1:{args.port}'
+            print(f"🚀 {args.server} server on {base_url}")
+
+        summary = run_load(base_url, args.parents, args.admins, args.duration, args.ramp_up, args.spike_start,
+                           args.spike_length, args.requests_per_parent, args.responses_per_poll, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary['config'] = {key: value for key, value in vars(args).items()
+                         if key not in ('save', 'compare', 'tolerance', 'min_samples')}
+    summary['recorded_at'] = datetime.now(timezone.utc).isoformat()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Results saved to {args.save}")
+
+    if baseline is not None:
+        found = regressions(summary, baseline, args.tolerance, args.min_samples)
+        for line in found:
+            print(f"⚠️  Regression: {line}")
+        if found:
+            return 1
+        print("✅ No regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
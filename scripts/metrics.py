@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+KidCheck Metrics
+Per-route and per-query latency histograms for the API, served in the Prometheus text format
+"""
+
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+# Upper bounds in seconds, rows and bytes; every histogram also has +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# "verb table" statement labels, e.g. "select requests"; the SQL text itself would
+# give a series per IN-list length
+_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)', re.IGNORECASE)
+_MAX_STATEMENT_LABELS = 1024
+
+_active = threading.local()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+                for labels, value in sorted(values.items())]
+
+
+class Histogram:
+    """Fixed-bucket histogram per label set; buckets are stored un-cumulated and summed on render"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels: Tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [per-bucket counts (last one is +Inf), sum, count]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = []
+        bounds = [_format_number(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Named metrics of one process, rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class _RequestTimes:
+    """Time and rows accumulated by the request running on this thread"""
+
+    __slots__ = ('started', 'sql', 'convert', 'encode', 'rows', 'status', 'size')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql = self.convert = self.encode = 0.0
+        self.rows = 0
+        self.status = None
+        self.size = None
+
+
+class phase:
+    """Attribute the time spent in a block to one phase of the current request
+
+        with phase('convert'):
+            payload = [dict(row) for row in rows]
+
+    A no-op outside an instrumented request, so library code can use it freely.
+    """
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        times = getattr(_active, 'request', None)
+        if times is not None:
+            setattr(times, self.name, getattr(times, self.name) + time.perf_counter() - self.started)
+        return False
+
+
+def statement_label(sql) -> str:
+    match = _STATEMENT_TABLE.search(sql)
+    verb = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else 'empty'
+    return f'{verb} {match.group(1).lower()}' if match else verb
+
+
+class _TimedCursor:
+    """Cursor proxy that records a query once its rows have been fetched
+
+    fetchmany() adds up its batches and records when they run out or the
+    cursor is closed, so a streamed result is still one timed statement.
+    """
+
+    def __init__(self, cursor, timer, sql, params, elapsed, conn, backend):
+        self._cursor = cursor
+        self._record = (timer, sql, params, conn, backend)
+        self._elapsed = elapsed
+        self._fetched = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _finish(self, fetched, started):
+        # Recorded on the first fetch; later fetchone() calls are not counted again
+        if self._record is None:
+            return
+        timer, sql, params, conn, backend = self._record
+        self._record = None
+        elapsed = self._elapsed + time.perf_counter() - started
+        timer.record(sql, params, elapsed, self._fetched + fetched, conn, backend)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._finish(int(row is not None), started)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._finish(len(rows), started)
+        return rows
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        if rows:
+            self._elapsed += time.perf_counter() - started
+            self._fetched += len(rows)
+        else:
+            self._finish(0, started)
+        return rows
+
+    def close(self):
+        self._finish(0, time.perf_counter())
+        self._cursor.close()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        count = 0
+        try:
+            for row in self._cursor:
+                count += 1
+                yield row
+        finally:
+            self._finish(count, started)
+
+
+class _TimedConnection:
+    """Connection proxy timing every execute/executemany; everything else passes through"""
+
+    def __init__(self, conn, timer, backend):
+        self._conn = conn
+        self._timer = timer
+        self._backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, params=(), **options):
+        started = time.perf_counter()
+        cursor = self._conn.execute(sql, params, **options)
+        elapsed = time.perf_counter() - started
+        if cursor.description is None:
+            self._timer.record(sql, params, elapsed, max(cursor.rowcount, 0), self._conn, self._backend)
+            return cursor
+        return _TimedCursor(cursor, self._timer, sql, params, elapsed, self._conn, self._backend)
+
+    def executemany(self, sql, rows):
+        started = time.perf_counter()
+        cursor = self._conn.executemany(sql, rows)
+        self._timer.record(sql, None, time.perf_counter() - started, max(cursor.rowcount, 0),
+                           self._conn, self._backend)
+        return cursor
+
+
+def _counted(body, times):
+    """Pass a streamed body through, adding up its size for the response size histogram
+
+    Streamed views use stream_with_context, whose teardown runs after the
+    last chunk, so the total is complete by the time it is observed.
+    """
+    times.size = 0
+    try:
+        for chunk in body:
+            times.size += len(chunk)
+            yield chunk
+    finally:
+        # A client that disconnects early must still release whatever the body holds
+        if hasattr(body, 'close'):
+            body.close()
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with encoding time charged to the "encode" phase"""
+
+    def dumps(self, obj, **kwargs):
+        with phase('encode'):
+            return super().dumps(obj, **kwargs)
+
+
+class APIMetrics:
+    """Request, phase and query instrumentation for the Flask app
+
+    Figures are per process: with several gunicorn workers each scrape sees
+    the worker that answered it, so graph rates and quantiles rather than
+    raw totals. Queries slower than slow_query_ms are logged with their plan,
+    at most once per slow_log_interval per statement.
+    """
+
+    def __init__(self, slow_query_ms=100.0, slow_log_interval=60.0, explain_slow=True):
+        self.slow_query_seconds = float(slow_query_ms) / 1000.0
+        self.slow_log_interval = float(slow_log_interval)
+        self.explain_slow = explain_slow
+        self._statements: Dict[str, str] = {}
+        self._slow_logged: Dict[str, float] = {}
+        self._slow_lock = threading.Lock()
+
+        self.registry = Registry()
+        self.request_seconds = self.registry.histogram(
+            'kidcheck_http_request_duration_seconds', 'Time to handle a request, by route',
+            ('method', 'route', 'status'))
+        self.phase_seconds = self.registry.histogram(
+            'kidcheck_http_request_phase_seconds',
+            'Request time split into sql, convert (rows to dicts), encode (JSON) and other',
+            ('route', 'phase'))
+        self.request_rows = self.registry.histogram(
+            'kidcheck_http_request_db_rows', 'Rows returned or changed by the statements a request ran',
+            ('route',), ROW_BUCKETS)
+        self.response_bytes = self.registry.histogram(
+            'kidcheck_http_response_size_bytes', 'Response body size, by route', ('route',), SIZE_BUCKETS)
+        self.query_seconds = self.registry.histogram(
+            'kidcheck_db_query_duration_seconds', 'Statement time including fetching its rows', ('backend', 'statement'))
+        self.query_rows = self.registry.histogram(
+            'kidcheck_db_query_rows', 'Rows returned or changed per statement', ('backend', 'statement'), ROW_BUCKETS)
+        self.slow_queries = self.registry.counter(
+            'kidcheck_db_slow_queries_total', 'Statements slower than the slow query threshold', ('backend', 'statement'))
+
+    # Flask
+
+    def install(self, app):
+        """Hook the app's request lifecycle and JSON encoding"""
+        app.json = _TimedJSONProvider(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        _active.request = _RequestTimes()
+
+    def _after_request(self, response):
+        times = getattr(_active, 'request', None)
+        if times is not None:
+            times.status = response.status_code
+            times.size = response.content_length
+            if times.size is None and response.is_streamed:
+                response.response = _counted(response.response, times)
+        return response
+
+    def _teardown_request(self, exc):
+        times = getattr(_active, 'request', None)
+        if times is None:
+            return
+        _active.request = None
+
+        elapsed = time.perf_counter() - times.started
+        rule = request.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        status = str(times.status or 500)
+        self.request_seconds.observe(elapsed, (request.method, route, status))
+        self.phase_seconds.observe(times.sql, (route, 'sql'))
+        self.phase_seconds.observe(times.convert, (route, 'convert'))
+        self.phase_seconds.observe(times.encode, (route, 'encode'))
+        self.phase_seconds.observe(max(0.0, elapsed - times.sql - times.convert - times.encode), (route, 'other'))
+        self.request_rows.observe(times.rows, (route,))
+        if times.size is not None:
+            self.response_bytes.observe(times.size, (route,))
+
+    # Queries
+
+    def wrap(self, conn, backend):
+        """Connection proxy whose statements are timed; used by Storage.connection()"""
+        return _TimedConnection(conn, self, backend)
+
+    def statement(self, sql) -> str:
+        label = self._statements.get(sql)
+        if label is None:
+            label = statement_label(sql)
+            if len(self._statements) < _MAX_STATEMENT_LABELS:
+                self._statements[sql] = label
+        return label
+
+    def record(self, sql, params, elapsed, rows, conn, backend):
+        label = self.statement(sql)
+        self.query_seconds.observe(elapsed, (backend, label))
+        self.query_rows.observe(rows, (backend, label))
+
+        times = getattr(_active, 'request', None)
+        if times is not None:
+            times.sql += elapsed
+            times.rows += rows
+
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc((backend, label))
+            self._log_slow(label, sql, params, elapsed, rows, conn, backend)
+
+    def _log_slow(self, label, sql, params, elapsed, rows, conn, backend):
+        now = time.monotonic()
+        with self._slow_lock:
+            if now - self._slow_logged.get(label, float('-inf')) < self.slow_log_interval:
+                return
+            self._slow_logged[label] = now
+
+        print(f"🐢 Slow query ({elapsed * 1000:.1f} ms, {rows} rows): {' '.join(sql.split())}")
+        # EXPLAIN never runs the statement, but only reads are worth a plan
+        if not self.explain_slow or params is None or label.split()[0] not in ('select', 'with'):
+            return
+        try:
+            for line in explain(conn, backend, sql, params):
+                print(f"    {line}")
+        except Exception as e:
+            print(f"    (no plan: {e})")
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def explain(conn, backend, sql, params=()) -> List[str]:
+    """Query plan lines for a statement, without running it"""
+    if backend == 'sqlite':
+        return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+    return [next(iter(row.values())) for row in conn.execute(f'EXPLAIN {sql}', params).fetchall()]
+
+
+def metrics_from_env() -> Optional[APIMetrics]:
+    """APIMetrics unless METRICS_ENABLED=false, in which case nothing is hooked or timed"""
+    if os.environ.get('METRICS_ENABLED', 'True').lower() != 'true':
+        return None
+    return APIMetrics(
+        slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+        slow_log_interval=float(os.environ.get('SLOW_QUERY_LOG_INTERVAL', 60)),
+        explain_slow=os.environ.get('SLOW_QUERY_EXPLAIN', 'True').lower() == 'true',
+    )
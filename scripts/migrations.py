@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+KidCheck Schema Migrations
+Numbered, idempotent schema migrations tracked in a schema_version table,
+plus a query-plan self-check for the API's hot queries
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from rollups import create_rollups, rebuild_rollups
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+class SchemaCheckError(RuntimeError):
+    """Raised when a hot query's plan regresses to a full table scan"""
+
+
+def migration(version, name):
+    """Register a migration; each one must be safe to re-run against any prior state"""
+    def register(fn):
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f'Duplicate migration version {version}')
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return fn
+    return register
+
+
+@migration(1, 'initial_schema')
+def initial_schema(cursor):
+    """Tables that init_db() used to create"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            user_type TEXT DEFAULT 'parent',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Children table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS children (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER,
+            name TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (parent_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Requests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER,
+            child_name TEXT NOT NULL,
+            child_grade TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            request_message TEXT,
+            status TEXT DEFAULT 'pending',
+            feedback TEXT,
+            response_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (parent_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Admin users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(2, 'change_tracking')
+def change_tracking(cursor):
+    """Version counter, tombstones and triggers used by delta polling"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(requests)')]
+    if 'version' not in columns:
+        cursor.execute('ALTER TABLE requests ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    
+    # Single-row counter bumped on every insert, update and delete of a request
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            pruned_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO change_counter (id, version) VALUES (1, 0)')
+    
+    # Rows written before change tracking existed become visible to ?since=0
+    cursor.execute('UPDATE requests SET version = 1 WHERE version = 0')
+    cursor.execute('''
+        UPDATE change_counter
+        SET version = MAX(version, (SELECT IFNULL(MAX(version), 0) FROM requests))
+        WHERE id = 1
+    ''')
+    
+    # Deleted requests, kept long enough for pollers to learn about the delete
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS request_tombstones (
+            request_id INTEGER PRIMARY KEY,
+            parent_id INTEGER,
+            version INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_track_insert AFTER INSERT ON requests
+        BEGIN
+            UPDATE change_counter SET version = version + 1 WHERE id = 1;
+            UPDATE requests SET version = (SELECT version FROM change_counter WHERE id = 1)
+            WHERE id = NEW.id;
+            DELETE FROM request_tombstones WHERE request_id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_track_update
+        AFTER UPDATE OF parent_id, child_name, child_grade, request_type, request_message,
+                        status, feedback, response_time, updated_at ON requests
+        BEGIN
+            UPDATE change_counter SET version = version + 1 WHERE id = 1;
+            UPDATE requests SET version = (SELECT version FROM change_counter WHERE id = 1)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_track_delete AFTER DELETE ON requests
+        BEGIN
+            UPDATE change_counter SET version = version + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO request_tombstones (request_id, parent_id, version, deleted_at)
+            VALUES (OLD.id, OLD.parent_id, (SELECT version FROM change_counter WHERE id = 1), CURRENT_TIMESTAMP);
+        END
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_version ON requests (version)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_parent_version ON requests (parent_id, version)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tombstones_version ON request_tombstones (version)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tombstones_parent_version ON request_tombstones (parent_id, version)')
+
+
+@migration(3, 'listing_indexes')
+def listing_indexes(cursor):
+    """Composite indexes serving the keyset-paginated, filtered request listing"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_created ON requests (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_parent_created ON requests (parent_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_status_created ON requests (status, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_type_created ON requests (request_type, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_grade_created ON requests (child_grade, created_at, id)')
+
+
+@migration(4, 'lookup_indexes')
+def lookup_indexes(cursor):
+    """Indexes for per-parent lookups, login by name and the analytics counts"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_children_parent ON children (parent_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_type ON users (user_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_admins_name ON admins (name)')
+
+
+@migration(5, 'request_rollups')
+def request_rollups(cursor):
+    """Trigger-maintained status/type and day/hour counters, backfilled from history"""
+    create_rollups(cursor)
+    rebuild_rollups(cursor)
+
+
+@migration(6, 'request_archive')
+def request_archive(cursor):
+    """Cold tier for resolved requests moved out of the live table by the archiver"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS request_archive (
+            id INTEGER PRIMARY KEY,
+            parent_id INTEGER,
+            child_name TEXT NOT NULL,
+            child_grade TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            request_message TEXT,
+            status TEXT,
+            feedback TEXT,
+            response_time TIMESTAMP,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_archive_created ON request_archive (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_archive_parent_created ON request_archive (parent_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_archive_version ON request_archive (version)')
+
+
+def applied_versions(conn):
+    """Versions recorded in schema_version, creating the table on first run"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return {row[0] for row in conn.execute('SELECT version FROM schema_version')}
+
+
+def run_migrations(conn: sqlite3.Connection) -> List[str]:
+    """Apply pending migrations in order, each in its own write transaction"""
+    applied = []
+    already_applied = applied_versions(conn)
+    for version, name, fn in MIGRATIONS:
+        if version in already_applied:
+            continue
+
+        # IMMEDIATE takes the write lock up front, so concurrent starters
+        # serialize here and the loser sees the version already recorded
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            fn(conn.cursor())
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(f'{version:04d}_{name}')
+    return applied
+
+
+def schema_version(conn) -> int:
+    """Highest applied migration version"""
+    return conn.execute('SELECT IFNULL(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+# Queries the API runs on every poll or login, with representative parameters
+HOT_QUERIES = [
+    ('login_by_email', 'SELECT id, password_hash FROM users WHERE email = ?', ('a@example.com',)),
+    ('admin_by_name', 'SELECT id, password_hash FROM admins WHERE name = ?', ('admin',)),
+    ('children_by_parent', 'SELECT id, name, grade FROM children WHERE parent_id = ?', (1,)),
+    ('parent_listing', '''
+        SELECT r.* FROM requests r WHERE r.parent_id = ?
+        ORDER BY r.created_at DESC, r.id DESC LIMIT 50
+    ''', (1,)),
+    ('admin_listing_page', '''
+        SELECT r.*, u.name FROM requests r JOIN users u ON r.parent_id = u.id
+        WHERE (r.created_at, r.id) < (?, ?)
+        ORDER BY r.created_at DESC, r.id DESC LIMIT 50
+    ''', ('9999-12-31', 0)),
+    ('pending_listing', '''
+        SELECT r.* FROM requests r WHERE r.status = ?
+        ORDER BY r.created_at DESC, r.id DESC LIMIT 50
+    ''', ('pending',)),
+    ('delta_poll', 'SELECT r.* FROM requests r WHERE r.parent_id = ? AND r.version > ?', (1, 0)),
+    # Dashboard totals scan request_counts, which holds one row per status and type;
+    # what has to stay indexed is the per-write trigger maintenance of both rollups
+    ('rollup_counts_update', '''
+        UPDATE request_counts SET count = count - 1 WHERE status = ? AND request_type = ?
+    ''', ('pending', 'checkin')),
+    ('rollup_volume_update', '''
+        UPDATE request_volume SET count = count - 1 WHERE day = ? AND hour = ?
+    ''', ('2000-01-01', 8)),
+    ('count_parents', "SELECT COUNT(*) FROM users WHERE user_type = 'parent'", ()),
+    ('archive_candidates', '''
+        SELECT id FROM requests
+        WHERE created_at < ? AND updated_at < ? AND status IS NOT NULL AND status <> 'pending'
+        ORDER BY created_at, id LIMIT 500
+    ''', ('2000-01-01', '2000-01-01')),
+    ('parent_archive_listing', '''
+        SELECT r.id FROM request_archive r WHERE r.parent_id = ?
+        ORDER BY r.created_at DESC, r.id DESC LIMIT 50
+    ''', (1,)),
+    ('recent_activity', '''
+        SELECT day, SUM(count) FROM request_volume
+        WHERE day >= ? GROUP BY day HAVING SUM(count) > 0 ORDER BY day
+    ''', ('2000-01-01',)),
+]
+
+
+def full_scans(conn, sql, params=()):
+    """Plan lines that read a whole table or a whole index rather than searching a range
+
+    SQLite reports an index walk with no range as SCAN ... USING [COVERING]
+    INDEX, which still touches every entry, so only SEARCH lines pass.
+    """
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[3] for row in plan if row[3].startswith('SCAN')]
+
+
+def check_query_plans(conn, queries=None):
+    """Fail loudly if any hot query would scan a whole table or index"""
+    failures = []
+    for name, sql, params in (queries or HOT_QUERIES):
+        scans = full_scans(conn, sql, params)
+        if scans:
+            failures.append(f"{name}: {'; '.join(scans)}")
+    if failures:
+        raise SchemaCheckError('Hot queries regressed to full scans:\n  ' + '\n  '.join(failures))
+
+
+if __name__ == '__main__':
+    import sys
+
+    database = sys.argv[1] if len(sys.argv) > 1 else 'kidcheck.db'
+    conn = sqlite3.connect(database)
+    for name in run_migrations(conn):
+        print(f"🗄️  Applied migration {name}")
+    check_query_plans(conn)
+    print(f"✅ {database} at schema version {schema_version(conn)}, hot query plans OK")
+    conn.close()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+KidCheck Password Hashing
+Versioned, salted KDF hashes computed on a bounded worker pool, with cost calibration
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+# Encoded formats, newest first:
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+#   <64 hex chars>                       legacy unsalted SHA-256, upgraded on login
+DEFAULT_PARAMS = {
+    'scrypt': {'n': 2 ** 14, 'r': 8, 'p': 1},
+    'pbkdf2_sha256': {'iterations': 600000},
+}
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already queued; callers should answer 503"""
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def derive(scheme, password, salt, params) -> bytes:
+    """Run the KDF itself; module-level so a process pool can pickle it"""
+    if scheme == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES,
+        )
+    if scheme == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['iterations'], dklen=KEY_BYTES)
+    raise ValueError(f'Unknown password hash scheme {scheme}')
+
+
+def encode_hash(scheme, params, salt, key) -> str:
+    if scheme == 'scrypt':
+        fields = [params['n'], params['r'], params['p']]
+    else:
+        fields = [params['iterations']]
+    return '$'.join([scheme] + [str(field) for field in fields] + [_b64(salt), _b64(key)])
+
+
+def decode_hash(encoded) -> Tuple[str, Dict, bytes, bytes]:
+    """Split a stored hash into (scheme, params, salt, key); legacy SHA-256 has no salt"""
+    parts = encoded.split('$')
+    if len(parts) == 1:
+        return 'sha256', {}, b'', bytes.fromhex(encoded)
+    scheme = parts[0]
+    if scheme == 'scrypt':
+        n, r, p, salt, key = parts[1:]
+        return scheme, {'n': int(n), 'r': int(r), 'p': int(p)}, _unb64(salt), _unb64(key)
+    if scheme == 'pbkdf2_sha256':
+        iterations, salt, key = parts[1:]
+        return scheme, {'iterations': int(iterations)}, _unb64(salt), _unb64(key)
+    raise ValueError(f'Unknown password hash scheme {scheme}')
+
+
+def _verify(password, encoded) -> bool:
+    try:
+        scheme, params, salt, key = decode_hash(encoded)
+    except ValueError:
+        return False
+    if scheme == 'sha256':
+        candidate = hashlib.sha256(password.encode()).digest()
+    else:
+        candidate = derive(scheme, password, salt, params)
+    return hmac.compare_digest(candidate, key)
+
+
+def _hash(scheme, params, password) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    return encode_hash(scheme, params, salt, derive(scheme, password, salt, params))
+
+
+def calibrate(scheme='scrypt', target_ms=100.0) -> Dict:
+    """Pick the cheapest cost parameters whose single hash takes at least target_ms here"""
+    salt = secrets.token_bytes(SALT_BYTES)
+
+    def timed(params):
+        started = time.perf_counter()
+        derive(scheme, 'calibration-password', salt, params)
+        return (time.perf_counter() - started) * 1000
+
+    if scheme == 'scrypt':
+        params = {'n': 2 ** 12, 'r': 8, 'p': 1}
+        # Doubling n doubles time and memory; stop at 2**20 (1 GiB at r=8)
+        while timed(params) < target_ms and params['n'] < 2 ** 20:
+            params['n'] *= 2
+        return params
+
+    params = {'iterations': 50000}
+    elapsed = timed(params)
+    params['iterations'] = max(50000, int(params['iterations'] * target_ms / max(elapsed, 0.01)))
+    return params
+
+
+# Live hashers, so a forked worker process can replace their executors
+_hashers = weakref.WeakSet()
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool
+
+    The calling request thread still waits for its hash. What the pool bounds is
+    how many hashes burn CPU at once (max_workers) and how many request threads
+    may wait on one (max_pending); past that, HasherBusy sheds the login with a
+    503 rather than letting logins tie up every thread. gunicorn.conf.py sizes
+    both against the worker's thread count.
+    """
+
+    def __init__(self, scheme='scrypt', params=None, max_workers=None, max_pending=64, executor='thread'):
+        if scheme not in DEFAULT_PARAMS:
+            raise ValueError(f'Unknown password hash scheme {scheme}')
+        self.scheme = scheme
+        self.params = dict(params or DEFAULT_PARAMS[scheme])
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        # hashlib's KDFs release the GIL, so threads give real parallelism;
+        # processes isolate the CPU burn further at the cost of pickling
+        self._pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        self._executor = self._pool_class(max_workers=self.max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._stats = {'hashes': 0, 'verifies': 0, 'rehashes': 0, 'rejected': 0, 'pending': 0, 'busy_ms': 0.0}
+        _hashers.add(self)
+
+    def _submit(self, fn, *args):
+        """Run fn on the pool and wait for it; raises HasherBusy when max_pending threads already wait"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HasherBusy('Password hashing queue is full')
+        started = time.perf_counter()
+        with self._lock:
+            self._stats['pending'] += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats['pending'] -= 1
+                self._stats['busy_ms'] += (time.perf_counter() - started) * 1000
+
+    def hash(self, password) -> str:
+        with self._lock:
+            self._stats['hashes'] += 1
+        return self._submit(_hash, self.scheme, self.params, password)
+
+    def needs_rehash(self, encoded) -> bool:
+        """True for legacy hashes, other schemes, or parameters below the current cost"""
+        scheme, params, _, _ = decode_hash(encoded)
+        if scheme != self.scheme:
+            return True
+        return any(params.get(name, 0) < value for name, value in self.params.items())
+
+    def verify(self, password, encoded) -> Tuple[bool, bool]:
+        """Return (matches, needs_rehash) for a stored hash"""
+        with self._lock:
+            self._stats['verifies'] += 1
+        matches = self._submit(_verify, password, encoded)
+        return matches, matches and self.needs_rehash(encoded)
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats['rehashes'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['busy_ms'] = round(snapshot['busy_ms'], 3)
+        snapshot.update(scheme=self.scheme, params=self.params,
+                        workers=self.max_workers, max_pending=self.max_pending)
+        return snapshot
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def reset_after_fork(self):
+        """Fresh workers and locks in a forked child; the parent's worker threads do not survive fork()"""
+        self._executor = self._pool_class(max_workers=self.max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._stats['pending'] = 0
+
+
+def _reset_hashers_after_fork():
+    for hasher in list(_hashers):
+        hasher.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_hashers_after_fork)
+
+
+def hasher_from_env() -> PasswordHasher:
+    """Build the hasher from KDF_* settings, calibrating when KDF_TARGET_MS is set"""
+    scheme = os.environ.get('KDF_SCHEME', 'scrypt')
+    params = dict(DEFAULT_PARAMS.get(scheme, {}))
+    if os.environ.get('KDF_TARGET_MS'):
+        params = calibrate(scheme, float(os.environ['KDF_TARGET_MS']))
+    else:
+        for name in params:
+            value = os.environ.get(f'KDF_{name.upper()}')
+            if value:
+                params[name] = int(value)
+
+    return PasswordHasher(
+        scheme=scheme,
+        params=params,
+        max_workers=int(os.environ['KDF_WORKERS']) if os.environ.get('KDF_WORKERS') else None,
+        max_pending=int(os.environ.get('KDF_MAX_PENDING', 64)),
+        executor=os.environ.get('KDF_EXECUTOR', 'thread'),
+    )
+
+
+if __name__ == '__main__':
+    import sys
+
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+    for scheme in ('scrypt', 'pbkdf2_sha256'):
+        params = calibrate(scheme, target_ms)
+        salt = secrets.token_bytes(SALT_BYTES)
+        started = time.perf_counter()
+        derive(scheme, 'calibration-password', salt, params)
+        elapsed = (time.perf_counter() - started) * 1000
+        settings = ' '.join(f'KDF_{name.upper()}={value}' for name, value in params.items())
+        print(f"⏱️  {scheme}: {elapsed:.1f} ms per hash with KDF_SCHEME={scheme} {settings}")
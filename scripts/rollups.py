@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+KidCheck Request Rollups
+Trigger-maintained counter tables for request totals, with rebuild and drift verification
+"""
+
+import sqlite3
+import sys
+from typing import Dict, List
+
+# Source-of-truth queries the rollup tables must agree with; {requests} is the live
+# table, or the live and archived requests together once the archive exists
+COUNTS_SOURCE = '''
+    SELECT IFNULL(status, '') AS status, request_type, COUNT(*) AS count
+    FROM {requests}
+    GROUP BY 1, 2
+'''
+VOLUME_SOURCE = '''
+    SELECT DATE(created_at) AS day, CAST(strftime('%H', created_at) AS INTEGER) AS hour, COUNT(*) AS count
+    FROM {requests}
+    GROUP BY 1, 2
+'''
+
+
+def create_rollups(cursor):
+    """Create the counter tables and the triggers that keep them in step with requests"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS request_counts (
+            status TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (status, request_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS request_volume (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_rollup_insert AFTER INSERT ON requests
+        BEGIN
+            INSERT INTO request_counts (status, request_type, count)
+            VALUES (IFNULL(NEW.status, ''), NEW.request_type, 1)
+            ON CONFLICT (status, request_type) DO UPDATE SET count = count + 1;
+            INSERT INTO request_volume (day, hour, count)
+            VALUES (DATE(NEW.created_at), CAST(strftime('%H', NEW.created_at) AS INTEGER), 1)
+            ON CONFLICT (day, hour) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_rollup_update_counts
+        AFTER UPDATE OF status, request_type ON requests
+        WHEN OLD.status IS NOT NEW.status OR OLD.request_type IS NOT NEW.request_type
+        BEGIN
+            UPDATE request_counts SET count = count - 1
+            WHERE status = IFNULL(OLD.status, '') AND request_type = OLD.request_type;
+            INSERT INTO request_counts (status, request_type, count)
+            VALUES (IFNULL(NEW.status, ''), NEW.request_type, 1)
+            ON CONFLICT (status, request_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_rollup_update_volume
+        AFTER UPDATE OF created_at ON requests
+        WHEN OLD.created_at IS NOT NEW.created_at
+        BEGIN
+            UPDATE request_volume SET count = count - 1
+            WHERE day = DATE(OLD.created_at) AND hour = CAST(strftime('%H', OLD.created_at) AS INTEGER);
+            INSERT INTO request_volume (day, hour, count)
+            VALUES (DATE(NEW.created_at), CAST(strftime('%H', NEW.created_at) AS INTEGER), 1)
+            ON CONFLICT (day, hour) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS requests_rollup_delete AFTER DELETE ON requests
+        BEGIN
+            UPDATE request_counts SET count = count - 1
+            WHERE status = IFNULL(OLD.status, '') AND request_type = OLD.request_type;
+            UPDATE request_volume SET count = count - 1
+            WHERE day = DATE(OLD.created_at) AND hour = CAST(strftime('%H', OLD.created_at) AS INTEGER);
+        END
+    ''')
+
+
+def counted_requests(cursor) -> str:
+    """FROM target covering every request the rollups count: archived ones are still requests"""
+    archived = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'request_archive'"
+    ).fetchone()
+    if not archived:
+        return 'requests'
+    return '''(
+        SELECT status, request_type, created_at FROM requests
+        UNION ALL
+        SELECT status, request_type, created_at FROM request_archive
+    )'''
+
+
+def rebuild_rollups(cursor):
+    """Recompute both counter tables from the live and archived requests"""
+    requests = counted_requests(cursor)
+    cursor.execute('DELETE FROM request_counts')
+    cursor.execute(f'INSERT INTO request_counts (status, request_type, count) {COUNTS_SOURCE.format(requests=requests)}')
+    cursor.execute('DELETE FROM request_volume')
+    cursor.execute(f'INSERT INTO request_volume (day, hour, count) {VOLUME_SOURCE.format(requests=requests)}')
+
+
+def _drift(conn, table, keys, source) -> List[Dict]:
+    join = ' AND '.join(f'r.{key} IS s.{key}' for key in keys)
+    positions = ', '.join(str(i + 1) for i in range(len(keys)))
+    # Full outer join emulated with two left joins; zero-count rollup rows match nothing
+    rows = conn.execute(f'''
+        WITH s AS ({source})
+        SELECT {', '.join(f's.{key} AS {key}' for key in keys)}, r.count AS rollup, s.count AS actual
+        FROM s LEFT JOIN {table} r ON {join}
+        WHERE r.count IS NOT s.count
+        UNION ALL
+        SELECT {', '.join(f'r.{key}' for key in keys)}, r.count, 0
+        FROM {table} r LEFT JOIN s ON {join}
+        WHERE s.count IS NULL AND r.count != 0
+        ORDER BY {positions}
+    ''').fetchall()
+    return [dict(zip(keys + ['rollup', 'actual'], row)) for row in rows]
+
+
+def verify_rollups(conn) -> Dict[str, List[Dict]]:
+    """Compare the counter tables with a fresh aggregate; empty lists mean no drift"""
+    requests = counted_requests(conn)
+    return {
+        'request_counts': _drift(conn, 'request_counts', ['status', 'request_type'],
+                                 COUNTS_SOURCE.format(requests=requests)),
+        'request_volume': _drift(conn, 'request_volume', ['day', 'hour'], VOLUME_SOURCE.format(requests=requests)),
+    }
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'verify'
+    database = argv[2] if len(argv) > 2 else 'kidcheck.db'
+    if command not in ('verify', 'rebuild'):
+        print(f"Usage: {argv[0]} [verify|rebuild] [database]")
+        return 2
+
+    conn = sqlite3.connect(database)
+    drift = verify_rollups(conn)
+    for table, rows in drift.items():
+        for row in rows:
+            print(f"⚠️  {table} drift: {row}")
+
+    if command == 'rebuild':
+        conn.execute('BEGIN IMMEDIATE')
+        rebuild_rollups(conn.cursor())
+        conn.commit()
+        print("🔁 Rollups rebuilt from requests and the archive")
+        drift = verify_rollups(conn)
+
+    conn.close()
+    if any(drift.values()):
+        return 1
+    print("✅ Rollups match the requests tables")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+KidCheck Sessions
+Server-side Flask sessions in SQLite or Redis, fronted by an in-process LRU/TTL cache
+"""
+
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from db_pool import get_pool
+from ttl_cache import TTLCache
+
+try:
+    import redis
+except ImportError:  # optional: only SESSION_STORE=redis needs it
+    redis = None
+
+# Session ids are opaque random tokens; everything else lives server-side
+SID_BYTES = 32
+
+serializer = TaggedJSONSerializer()
+
+
+class SessionStoreUnavailable(Exception):
+    """Raised when a session store is selected but its client library is not installed"""
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that tracks modification and remembers its id and server-side expiry"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move to a fresh session id, dropping the old one when the response is saved
+
+        Called whenever the session gains an identity, so an id planted in a
+        browser before sign-in is never upgraded to the signed-in user.
+        """
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(SID_BYTES)
+        self.new = True
+        self.modified = True
+
+
+class SessionStore:
+    """Where serialized sessions live between requests; expiry times are Unix seconds"""
+
+    name = 'abstract'
+
+    def load(self, sid) -> Optional[Tuple[str, float]]:
+        """(serialized data, expires_at) for a live session, or None"""
+        raise NotImplementedError
+
+    def save(self, sid, data, expires_at):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def purge_expired(self, limit) -> int:
+        """Delete up to limit expired sessions; returns how many were removed"""
+        return 0
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions table in a SQLite file shared by every worker process"""
+
+    name = 'sqlite'
+
+    def __init__(self, database):
+        self.database = str(database)
+        self.pool = get_pool(self.database)
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, sid):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?',
+                               (sid, time.time())).fetchone()
+        finally:
+            conn.close()
+        return (row['data'], row['expires_at']) if row else None
+
+    def save(self, sid, data, expires_at):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            ''', (sid, data, expires_at))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge_expired(self, limit) -> int:
+        conn = self.pool.acquire()
+        try:
+            # Bounded so a large backlog never holds the write lock for long
+            cursor = conn.execute('''
+                DELETE FROM sessions WHERE sid IN (
+                    SELECT sid FROM sessions WHERE expires_at <= ? ORDER BY expires_at LIMIT ?
+                )
+            ''', (time.time(), int(limit)))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions as Redis strings with server-side expiry, so there is nothing to purge
+
+    Any client with the redis-py get/set/delete API works, e.g. fakeredis as a
+    local stand-in; "fakeredis://" URLs select it in from_url().
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='kidcheck:session:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix='kidcheck:session:'):
+        if url.startswith('fakeredis://'):
+            try:
+                import fakeredis
+            except ImportError:
+                raise SessionStoreUnavailable('fakeredis is required for fakeredis:// session stores')
+            return cls(fakeredis.FakeRedis(), prefix)
+        if redis is None:
+            raise SessionStoreUnavailable('redis is required for SESSION_STORE=redis (pip install redis)')
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def load(self, sid):
+        key = self.prefix + sid
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.pttl(key)
+        data, ttl_ms = pipe.execute()
+        if data is None or ttl_ms is None or ttl_ms < 0:
+            return None
+        return (data.decode() if isinstance(data, bytes) else data), time.time() + ttl_ms / 1000.0
+
+    def save(self, sid, data, expires_at):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms <= 0:
+            self.delete(sid)
+            return
+        self.client.set(self.prefix + sid, data, px=ttl_ms)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface keeping only a random session id in the cookie
+
+    Reads go through a per-process TTLCache, so the 2-second pollers hit the
+    store about once per cache TTL rather than on every request. The catch is
+    that a logout seen by one worker takes up to that TTL to reach the others.
+    Records are rewritten only when the session changes or has used up half of
+    its lifetime, and expired rows are deleted in bounded batches at most once
+    per cleanup interval.
+    """
+
+    session_class = ServerSession
+
+    def __init__(self, store: SessionStore, cache_ttl=10.0, cache_size=10000,
+                 cleanup_interval=300.0, cleanup_batch=500):
+        self.store = store
+        self.cache = TTLCache(ttl=cache_ttl, max_entries=cache_size)
+        self.cleanup_interval = float(cleanup_interval)
+        self.cleanup_batch = int(cleanup_batch)
+        self._next_cleanup = time.monotonic() + self.cleanup_interval
+        self._cleanup_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'loads': 0, 'saves': 0, 'deletes': 0, 'purged': 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def lifetime(self, app) -> float:
+        return app.permanent_session_lifetime.total_seconds()
+
+    def load_data(self, sid) -> Optional[Tuple[Dict, float]]:
+        """Session contents and expiry for a session id, via the cache; None if unknown or expired"""
+        if not sid or len(sid) > 2 * SID_BYTES:
+            return None
+        cached = self.cache.get(sid)
+        if cached is not None:
+            data, expires_at = cached
+            return (data, expires_at) if expires_at > time.time() else None
+
+        self._count('loads')
+        stored = self.store.load(sid)
+        if stored is None:
+            return None
+        data, expires_at = serializer.loads(stored[0]), stored[1]
+        self.cache.set(sid, (data, expires_at))
+        return data, expires_at
+
+    def open_session(self, app, request):
+        self.maybe_cleanup()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        loaded = self.load_data(sid)
+        if loaded is None:
+            return self.session_class(sid=secrets.token_urlsafe(SID_BYTES), new=True)
+        data, expires_at = loaded
+        # Copy so a request mutating its session never alters the shared cache entry
+        return self.session_class(dict(data), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid is not None:
+            self.discard(session.previous_sid)
+            session.previous_sid = None
+
+        if not session:
+            if session.modified and not session.new:
+                self.discard(session.sid)
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        now = time.time()
+        lifetime = self.lifetime(app)
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or stale):
+            return
+
+        expires_at = now + lifetime
+        data = dict(session)
+        self.store.save(session.sid, serializer.dumps(data), expires_at)
+        self.cache.set(session.sid, (data, expires_at))
+        self._count('saves')
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add('Cookie')
+
+    def discard(self, sid):
+        """Delete a session record and evict it from this process's cache"""
+        self.store.delete(sid)
+        self.cache.invalidate(sid)
+        self._count('deletes')
+
+    def maybe_cleanup(self):
+        """Purge one batch of expired sessions if the cleanup interval has passed"""
+        if time.monotonic() < self._next_cleanup or not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_cleanup = time.monotonic() + self.cleanup_interval
+            self.cache.purge_expired()
+            purged = self.store.purge_expired(self.cleanup_batch)
+            self._count('purged', purged)
+            if purged >= self.cleanup_batch:
+                # More left over: come back on the next request instead of waiting a full interval
+                self._next_cleanup = time.monotonic()
+        finally:
+            self._cleanup_lock.release()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['store'] = self.store.name
+        snapshot['cache'] = self.cache.stats()
+        return snapshot
+
+
+def session_interface_from_env(default_database='kidcheck_sessions.db') -> Optional[ServerSessionInterface]:
+    """Server-side sessions per SESSION_STORE (sqlite by default, redis, or cookie for Flask's own)
+
+    SQLite sessions go to SESSION_DATABASE, or default_database when it is unset.
+    """
+    kind = os.environ.get('SESSION_STORE', 'sqlite').lower()
+    if kind == 'cookie':
+        return None
+    if kind == 'sqlite':
+        store = SQLiteSessionStore(os.environ.get('SESSION_DATABASE') or default_database)
+    elif kind == 'redis':
+        store = RedisSessionStore.from_url(os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+    else:
+        raise ValueError(f'Unknown SESSION_STORE {kind!r}; expected sqlite, redis or cookie')
+    return ServerSessionInterface(
+        store,
+        cache_ttl=float(os.environ.get('SESSION_CACHE_TTL', 10)),
+        cache_size=int(os.environ.get('SESSION_CACHE_SIZE', 10000)),
+        cleanup_interval=float(os.environ.get('SESSION_CLEANUP_INTERVAL', 300)),
+        cleanup_batch=int(os.environ.get('SESSION_CLEANUP_BATCH', 500)),
+    )
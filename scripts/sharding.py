@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+KidCheck Sharding
+One SQLite database per school, a directory that routes accounts to their school, and a split tool
+"""
+
+import csv
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from db_pool import get_pool
+from migrations import run_migrations
+from rollups import rebuild_rollups
+
+DIRECTORY_FILE = 'directory.sqlite'
+SHARD_SUFFIX = '.db'
+SLUG_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+# Copied per school in dependency order; version is left to the change-tracking triggers
+SPLIT_TABLES = [
+    ('users', 'id IN (SELECT user_id FROM temp.assigned)'),
+    ('children', 'parent_id IN (SELECT user_id FROM temp.assigned)'),
+    ('requests', 'parent_id IN (SELECT user_id FROM temp.assigned)'),
+    ('request_archive', 'parent_id IN (SELECT user_id FROM temp.assigned)'),
+    ('admins', '1'),
+]
+
+
+class UnknownSchool(Exception):
+    """Raised when a school slug has no shard, or no school could be resolved"""
+
+
+class ShardConflict(Exception):
+    """Raised when a split would overwrite rows already in a school's shard"""
+
+
+def normalize_school(slug) -> str:
+    slug = (slug or '').strip().lower()
+    if not SLUG_PATTERN.match(slug):
+        raise UnknownSchool(f'Invalid school id {slug!r}')
+    return slug
+
+
+class ShardRouter:
+    """Maps schools to their database files and parent/admin logins to schools
+
+    The directory is a small SQLite database next to the shards. Sessions
+    carry the school once logged in, so it is only consulted on login and
+    registration; school -> file lookups are served from memory.
+    """
+    
+    def __init__(self, shards_dir, directory=None):
+        self.shards_dir = Path(shards_dir)
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        self.directory = str(directory or self.shards_dir / DIRECTORY_FILE)
+        self._schools: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        
+        conn = get_pool(self.directory).acquire()
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS schools (
+                    slug TEXT PRIMARY KEY,
+                    name TEXT,
+                    database TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE TABLE IF NOT EXISTS accounts (
+                    kind TEXT NOT NULL,
+                    login TEXT NOT NULL,
+                    school TEXT NOT NULL REFERENCES schools (slug),
+                    PRIMARY KEY (kind, login)
+                ) WITHOUT ROWID;
+            ''')
+        finally:
+            conn.close()
+        self._load_schools()
+    
+    def _load_schools(self):
+        conn = get_pool(self.directory).acquire()
+        try:
+            rows = conn.execute('SELECT slug, database FROM schools').fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self._schools = {slug: database for slug, database in rows}
+    
+    def schools(self) -> Dict[str, str]:
+        """slug -> database path for every registered school"""
+        with self._lock:
+            return dict(self._schools)
+    
+    def add_school(self, slug, name=None) -> str:
+        """Register a school and bring its shard's schema up to date"""
+        slug = normalize_school(slug)
+        database = str(self.shards_dir / f'{slug}{SHARD_SUFFIX}')
+        shard = sqlite3.connect(database)
+        try:
+            run_migrations(shard)
+        finally:
+            shard.close()
+        
+        conn = get_pool(self.directory).acquire()
+        try:
+            conn.execute('''
+                INSERT INTO schools (slug, name, database) VALUES (?, ?, ?)
+                ON CONFLICT(slug) DO UPDATE SET name = IFNULL(excluded.name, schools.name)
+            ''', (slug, name, database))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._schools[slug] = database
+        return database
+    
+    def database_for(self, school) -> str:
+        school = normalize_school(school)
+        database = self._schools.get(school)
+        if database is None:
+            # Another worker process may have added it since we loaded
+            self._load_schools()
+            database = self._schools.get(school)
+        if database is None:
+            raise UnknownSchool(f'Unknown school {school!r}')
+        return database
+    
+    def school_for(self, kind, login) -> Optional[str]:
+        """School an account belongs to, or None if the directory has no entry"""
+        conn = get_pool(self.directory).acquire()
+        try:
+            row = conn.execute('SELECT school FROM accounts WHERE kind = ? AND login = ?', (kind, login)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+    
+    def claim(self, kind, login, school) -> bool:
+        """Reserve a login for a school; False if it is already taken anywhere in the district"""
+        conn = get_pool(self.directory).acquire()
+        try:
+            cursor = conn.execute('''
+                INSERT INTO accounts (kind, login, school) VALUES (?, ?, ?)
+                ON CONFLICT(kind, login) DO NOTHING
+            ''', (kind, login, normalize_school(school)))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+    
+    def claim_many(self, kind, logins: Iterable[str], school):
+        conn = get_pool(self.directory).acquire()
+        try:
+            conn.executemany('''
+                INSERT INTO accounts (kind, login, school) VALUES (?, ?, ?)
+                ON CONFLICT(kind, login) DO UPDATE SET school = excluded.school
+            ''', [(kind, login, school) for login in logins])
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def release(self, kind, login):
+        conn = get_pool(self.directory).acquire()
+        try:
+            conn.execute('DELETE FROM accounts WHERE kind = ? AND login = ?', (kind, login))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def router_from_env() -> Optional[ShardRouter]:
+    """ShardRouter when SHARDS_DIR is set, otherwise None (single-database mode)"""
+    shards_dir = os.environ.get('SHARDS_DIR')
+    if not shards_dir:
+        return None
+    return ShardRouter(shards_dir, os.environ.get('SHARD_DIRECTORY'))
+
+
+def _columns(conn, schema, table) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def read_assignments(path) -> Dict[str, str]:
+    """email,school rows from a CSV file (a header row is optional)"""
+    assignments = {}
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == 'email':
+                continue
+            assignments[row[0].strip().lower()] = normalize_school(row[1])
+    return assignments
+
+
+def split_database(source, router: ShardRouter, assignments: Dict[str, str], default_school=None) -> Dict[str, Dict]:
+    """Copy a monolithic database into per-school shards
+
+    Parents go to the school in assignments (by email), or default_school;
+    their children and requests, live and archived, follow them with ids
+    preserved and the shard's rollups are rebuilt to match. Every shard
+    gets a copy of the admins table. The source database is only read, and
+    a shard that already holds any of the copied ids raises ShardConflict
+    with nothing written to it.
+    """
+    source_conn = sqlite3.connect(f'file:{source}?mode=ro', uri=True)
+    try:
+        users = source_conn.execute('SELECT id, email FROM users').fetchall()
+    finally:
+        source_conn.close()
+    
+    by_school: Dict[str, List] = {}
+    unassigned = []
+    for user_id, email in users:
+        school = assignments.get((email or '').lower(), default_school)
+        if school is None:
+            unassigned.append(email)
+            continue
+        by_school.setdefault(normalize_school(school), []).append((user_id, email))
+    if unassigned:
+        raise UnknownSchool(f'{len(unassigned)} users have no school, e.g. {unassigned[0]}; '
+                            'add them to the assignments or pass a default school')
+    
+    summary = {}
+    for school, members in sorted(by_school.items()):
+        database = router.add_school(school)
+        conn = sqlite3.connect(database)
+        conn.execute('ATTACH DATABASE ? AS source', (str(source),))
+        try:
+            conn.execute('CREATE TEMP TABLE assigned (user_id INTEGER PRIMARY KEY)')
+            conn.executemany('INSERT INTO temp.assigned (user_id) VALUES (?)', [(user_id,) for user_id, _ in members])
+            conn.commit()
+            
+            counts = {}
+            conn.execute('BEGIN IMMEDIATE')
+            for table, condition in SPLIT_TABLES:
+                shared = [column for column in _columns(conn, 'source', table)
+                          if column in _columns(conn, 'main', table) and column != 'version']
+                if not shared:
+                    # A source from before this table's migration
+                    counts[table] = 0
+                    continue
+                column_list = ', '.join(shared)
+                try:
+                    cursor = conn.execute(f'''
+                        INSERT INTO main.{table} ({column_list})
+                        SELECT {column_list} FROM source.{table} WHERE {condition}
+                    ''')
+                except sqlite3.IntegrityError as e:
+                    raise ShardConflict(f'{school}: {table} rows already exist in {database} ({e}); '
+                                        'split into new, empty shards') from e
+                counts[table] = cursor.rowcount
+            # The insert triggers only counted live requests; the rollups cover archived ones too
+            rebuild_rollups(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE source')
+            conn.close()
+        
+        router.claim_many('parent', [email for _, email in members], school)
+        summary[school] = counts
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='KidCheck per-school shards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    split = commands.add_parser('split', help='split a monolithic database into per-school shards')
+    split.add_argument('source')
+    split.add_argument('shards_dir')
+    split.add_argument('--assignments', help='CSV of email,school for parents')
+    split.add_argument('--default-school', help='school for parents missing from the assignments')
+    
+    add = commands.add_parser('add-school', help='create an empty shard for a school')
+    add.add_argument('shards_dir')
+    add.add_argument('slug')
+    add.add_argument('--name')
+    
+    listing = commands.add_parser('list', help='list schools and their shard files')
+    listing.add_argument('shards_dir')
+    
+    args = parser.parse_args()
+    router = ShardRouter(args.shards_dir)
+    if args.command == 'split':
+        assignments = read_assignments(args.assignments) if args.assignments else {}
+        for school, counts in split_database(args.source, router, assignments, args.default_school).items():
+            copied = ', '.join(f'{count} {table}' for table, count in counts.items())
+            print(f"🏫 {school}: {copied}")
+    elif args.command == 'add-school':
+        print(f"🏫 {args.slug}: {router.add_school(args.slug, args.name)}")
+    else:
+        for school, database in sorted(router.schools().items()):
+            print(f"🏫 {school}: {database}")
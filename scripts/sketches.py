@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+KidCheck Quantile Sketches
+Mergeable, bounded-size quantile estimates for streaming and incremental analytics
+"""
+
+import math
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class QuantileSketch:
+    """Log-bucketed histogram (DDSketch-style) with a fixed relative error on quantiles
+
+    Values are non-negative durations; anything at or below MIN_VALUE lands in a
+    zero bucket. Two sketches built with the same accuracy merge by adding
+    bucket counts, so per-chunk or per-day sketches combine exactly.
+    """
+
+    MIN_VALUE = 1e-6
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Counter = Counter()
+        self.zero_count = 0
+        self.count = 0
+
+    def add_many(self, values, counts=None):
+        """Add values, each seen counts[i] times (default once), e.g. from a GROUP BY histogram"""
+        values = np.asarray(values, dtype='float64')
+        counts = np.ones(values.size, dtype='int64') if counts is None else np.asarray(counts, dtype='int64')
+        keep = ~np.isnan(values)
+        values, counts = values[keep], counts[keep]
+        if values.size == 0:
+            return
+        positive = values > self.MIN_VALUE
+        self.zero_count += int(counts[~positive].sum())
+        if positive.any():
+            keys = np.ceil(np.log(values[positive]) / self._log_gamma).astype('int64')
+            keys, inverse = np.unique(keys, return_inverse=True)
+            totals = np.bincount(inverse, weights=counts[positive]).astype('int64')
+            self.buckets.update(dict(zip(keys.tolist(), totals.tolist())))
+        self.count += int(counts.sum())
+
+    def add(self, value):
+        self.add_many([value])
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different accuracy')
+        self.buckets.update(other.buckets)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def _bucket_value(self, key):
+        # Midpoint of (gamma^(key-1), gamma^key] in the relative-error sense
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0 <= q <= 1); None for an empty sketch"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self.buckets))
+
+    def points(self) -> Tuple[List[float], List[int]]:
+        """Representative values and their counts, e.g. for a weighted histogram"""
+        values, weights = [], []
+        if self.zero_count:
+            values.append(0.0)
+            weights.append(self.zero_count)
+        for key in sorted(self.buckets):
+            values.append(self._bucket_value(key))
+            weights.append(self.buckets[key])
+        return values, weights
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'buckets': {str(key): value for key, value in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.buckets = Counter({int(key): value for key, value in data['buckets'].items()})
+        return sketch
@@ -0,0 +1,1080 @@
+#!/usr/bin/env python3
+"""
+KidCheck Storage
+Backend-neutral data access for the API: SQLite (pooled files, one per shard) or PostgreSQL
+"""
+
+import base64
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from db_pool import get_pool
+from migrations import check_query_plans, run_migrations, schema_version
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool as PostgresPool
+except ImportError:  # optional: only STORAGE_BACKEND=postgres needs it
+    psycopg = None
+    PostgresPool = None
+
+INSERT_REQUEST_SQL = '''
+    INSERT INTO requests (parent_id, child_name, child_grade, request_type, request_message)
+    VALUES (?, ?, ?, ?, ?)
+'''
+UPDATE_REQUEST_SQL = '''
+    UPDATE requests
+    SET status = ?, feedback = ?, response_time = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+PASSWORD_TABLES = ('users', 'admins')
+
+# Listing filters that are plain equality on an indexed requests column
+EQUALITY_FILTERS = ('parent_id', 'status', 'request_type', 'child_grade')
+
+# Columns a listing can be narrowed to; admins can also ask for the parent's details
+REQUEST_COLUMNS = ('id', 'parent_id', 'child_name', 'child_grade', 'request_type', 'request_message', 'status',
+                   'feedback', 'response_time', 'created_at', 'updated_at', 'version')
+PARENT_COLUMNS = {'parent_name': 'u.name', 'parent_email': 'u.email'}
+# Always selected, whatever was asked for: they identify a row and place the keyset cursor
+KEY_COLUMNS = ('id', 'created_at')
+
+# ?archive= on listings: the live table alone (default), live plus archived, or archived only
+ARCHIVE_MODES = ('include', 'only')
+
+
+class StorageUnavailable(Exception):
+    """Raised when a backend is selected but its driver is not installed"""
+
+
+def utc_timestamp(days_ago=0) -> str:
+    """UTC time in the 'YYYY-MM-DD HH:MM:SS' form both backends store and compare"""
+    moment = datetime.now(timezone.utc) - timedelta(days=days_ago)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def encode_page_cursor(row) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of the last row on a page"""
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_page_cursor(cursor) -> Tuple[str, int]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, request_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+    return created_at, int(request_id)
+
+
+class Storage:
+    """Everything the API reads and writes, as plain rows keyed by column name
+
+    The SQL here is written once in the subset both backends accept, with
+    ? placeholders; subclasses supply connections and the few statements
+    that differ (generated ids, write locks, IN lists, schema migrations).
+    Each method checks a connection out for its own duration and commits
+    before returning.
+    """
+
+    backend = 'abstract'
+    # True when only one connection can write at a time (SQLite); enables the write-behind queue
+    single_writer = False
+    # Process-wide statement timer (metrics.APIMetrics); None leaves connections unwrapped
+    query_observer = None
+
+    @contextmanager
+    def connection(self):
+        raise NotImplementedError
+
+    def observed(self, conn):
+        """conn, wrapped by the query observer when one is installed"""
+        observer = Storage.query_observer
+        return conn if observer is None else observer.wrap(conn, self.backend)
+
+    def migrate(self) -> List[str]:
+        """Bring the schema up to date; returns the names of the migrations applied"""
+        raise NotImplementedError
+
+    def schema_version(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # Dialect hooks
+
+    def begin_write(self, conn):
+        """Start a transaction that will write"""
+
+    def insert_id(self, conn, sql, params) -> int:
+        raise NotImplementedError
+
+    def insert_ids(self, conn, sql, rows) -> List[int]:
+        raise NotImplementedError
+
+    def begin_archive(self, conn):
+        """Start an archive batch's transaction, excluding any other archiver until it commits"""
+        self.begin_write(conn)
+
+    def analyze_archive(self, conn):
+        """Refresh the planner's statistics for request_archive after rows were moved into it"""
+
+    # request_volume's (day, hour) bucket for a created_at value, as SQL expressions
+    volume_day_sql = 'DATE(created_at)'
+    volume_hour_sql = "CAST(strftime('%H', created_at) AS INTEGER)"
+
+    def stream_cursor(self, conn, sql, params):
+        """Cursor for stream_rows whose fetchmany() reads from the database rather than a buffer"""
+        return conn.execute(sql, params)
+
+    def execute_composed(self, conn, sql, params):
+        """Run SQL assembled per call from filters and fields, whose text varies too much to prepare"""
+        return conn.execute(sql, params)
+
+    def in_clause(self, values) -> Tuple[str, List]:
+        """SQL fragment and params testing membership in a list of values"""
+        values = list(values)
+        return f"IN ({', '.join('?' * len(values))})", values
+
+    # Accounts
+
+    def find_user(self, email):
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT id, email, name, password_hash, user_type
+                FROM users WHERE email = ?
+            ''', (email,)).fetchone()
+
+    def create_parent(self, email, name, password_hash, child_name=None) -> int:
+        """Insert a parent, and their first child if named, in one transaction"""
+        with self.connection() as conn:
+            try:
+                user_id = self.insert_id(conn, '''
+                    INSERT INTO users (email, name, password_hash, user_type)
+                    VALUES (?, ?, ?, ?)
+                ''', (email, name, password_hash, 'parent'))
+                if child_name:
+                    conn.execute('''
+                        INSERT INTO children (parent_id, name, grade)
+                        VALUES (?, ?, ?)
+                    ''', (user_id, child_name, 'Not specified'))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return user_id
+
+    def find_admin(self, name):
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT id, name, password_hash
+                FROM admins WHERE name = ?
+            ''', (name,)).fetchone()
+
+    def create_admin(self, name, password_hash) -> int:
+        with self.connection() as conn:
+            admin_id = self.insert_id(conn, 'INSERT INTO admins (name, password_hash) VALUES (?, ?)',
+                                      (name, password_hash))
+            conn.commit()
+        return admin_id
+
+    def update_password_hash(self, table, account_id, password_hash):
+        if table not in PASSWORD_TABLES:
+            raise ValueError(f'No password column on {table}')
+        with self.connection() as conn:
+            conn.execute(f'UPDATE {table} SET password_hash = ? WHERE id = ?', (password_hash, account_id))
+            conn.commit()
+
+    # Children
+
+    def list_children(self, parent_id):
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT id, name, grade FROM children WHERE parent_id = ?
+            ''', (parent_id,)).fetchall()
+
+    def add_child(self, parent_id, name, grade) -> int:
+        with self.connection() as conn:
+            child_id = self.insert_id(conn, '''
+                INSERT INTO children (parent_id, name, grade)
+                VALUES (?, ?, ?)
+            ''', (parent_id, name, grade))
+            conn.commit()
+        return child_id
+
+    # Request writes
+
+    def create_request(self, row: Sequence) -> int:
+        """Insert one (parent_id, child_name, child_grade, request_type, request_message) row"""
+        with self.connection() as conn:
+            request_id = self.insert_id(conn, INSERT_REQUEST_SQL, row)
+            conn.commit()
+        return request_id
+
+    def create_requests(self, rows: List[Sequence]) -> List[int]:
+        """Insert several request rows in one transaction; ids come back in row order"""
+        with self.connection() as conn:
+            self.begin_write(conn)
+            try:
+                request_ids = self.insert_ids(conn, INSERT_REQUEST_SQL, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return request_ids
+
+    def update_request(self, request_id, status, feedback) -> bool:
+        """Respond to a live request; False if there is no such request in the live table"""
+        with self.connection() as conn:
+            cursor = conn.execute(UPDATE_REQUEST_SQL, (status, feedback, request_id))
+            conn.commit()
+        return cursor.rowcount > 0
+
+    def update_requests(self, updates: List[Tuple]) -> set:
+        """Apply (id, status, feedback) updates in one transaction; returns the ids that existed"""
+        with self.connection() as conn:
+            self.begin_write(conn)
+            try:
+                membership, params = self.in_clause(sorted({request_id for request_id, _, _ in updates}))
+                existing = {row['id'] for row in conn.execute(
+                    f'SELECT id FROM requests WHERE id {membership}', params
+                ).fetchall()}
+                conn.executemany(UPDATE_REQUEST_SQL, [
+                    (status, feedback, request_id)
+                    for request_id, status, feedback in updates if request_id in existing
+                ])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return existing
+
+    def delete_request(self, request_id, parent_id=None) -> bool:
+        """Delete a request, only if it belongs to parent_id when one is given"""
+        with self.connection() as conn:
+            if parent_id is None:
+                cursor = conn.execute('DELETE FROM requests WHERE id = ?', (request_id,))
+            else:
+                cursor = conn.execute('DELETE FROM requests WHERE id = ? AND parent_id = ?', (request_id, parent_id))
+            conn.commit()
+        return cursor.rowcount > 0
+
+    def archived_ids(self, request_ids: Sequence[int], parent_id=None) -> set:
+        """Which of request_ids were moved to request_archive, and so can no longer be changed"""
+        if not request_ids:
+            return set()
+        membership, params = self.in_clause(sorted(set(request_ids)))
+        sql = f'SELECT id FROM request_archive WHERE id {membership}'
+        if parent_id is not None:
+            sql += ' AND parent_id = ?'
+            params = [*params, parent_id]
+        with self.connection() as conn:
+            return {row['id'] for row in conn.execute(sql, params).fetchall()}
+
+    # Request reads
+
+    def view_version(self, user_type, user_id) -> int:
+        """Newest change version visible to the caller, used as the listing ETag"""
+        with self.connection() as conn:
+            if user_type == 'admin':
+                return conn.execute('SELECT version FROM change_counter WHERE id = 1').fetchone()['version']
+            return conn.execute('''
+                SELECT COALESCE(MAX(version), 0) AS version FROM (
+                    SELECT MAX(version) AS version FROM requests WHERE parent_id = ?
+                    UNION ALL
+                    SELECT MAX(version) FROM request_tombstones WHERE parent_id = ?
+                ) AS visible
+            ''', (user_id, user_id)).fetchone()['version']
+
+    def parse_since(self, since, retention_days):
+        """Classify a ?since= cursor as ('version', n) or ('timestamp', ts), or None if too old
+
+        Raises ValueError for anything that is neither a version nor an ISO 8601 time.
+        """
+        if since.isdigit():
+            with self.connection() as conn:
+                pruned_version = conn.execute(
+                    'SELECT pruned_version FROM change_counter WHERE id = 1'
+                ).fetchone()['pruned_version']
+            version = int(since)
+            return None if version < pruned_version else ('version', version)
+
+        moment = datetime.fromisoformat(since[:-1] + '+00:00' if since.endswith('Z') else since)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        timestamp = moment.strftime('%Y-%m-%d %H:%M:%S')
+        return None if timestamp < utc_timestamp(retention_days) else ('timestamp', timestamp)
+
+    def request_filters(self, user_type, user_id, filters: Dict) -> Tuple[List[str], List]:
+        """WHERE clauses on requests r for the caller and their listing filters
+
+        Every filter is the leading column of a (column, created_at, id) index, so a
+        filtered page is a range scan in created_at order rather than a sort.
+        """
+        clauses, params = [], []
+        filters = dict(filters)
+        if user_type != 'admin':
+            filters['parent_id'] = user_id
+        for column in EQUALITY_FILTERS:
+            if filters.get(column) is not None:
+                clauses.append(f'r.{column} = ?')
+                params.append(filters[column])
+        if filters.get('created_from'):
+            clauses.append('r.created_at >= ?')
+            params.append(filters['created_from'])
+        if filters.get('created_to'):
+            clauses.append('r.created_at < ?')
+            params.append(filters['created_to'])
+        return clauses, params
+
+    def request_select(self, user_type, fields=None, table='requests') -> str:
+        """SELECT ... FROM prefix for the caller's listing, with parent details for admins
+
+        fields narrows the column list (KEY_COLUMNS are always included), and
+        the users join is only made when a parent column was asked for. table
+        is requests or request_archive, which share the listing columns.
+        """
+        if fields is None and table == 'requests':
+            if user_type == 'admin':
+                return '''
+                    SELECT r.*, u.name as parent_name, u.email as parent_email
+                    FROM requests r
+                    JOIN users u ON r.parent_id = u.id
+                '''
+            return 'SELECT r.* FROM requests r'
+
+        if fields is None:
+            fields = REQUEST_COLUMNS + tuple(PARENT_COLUMNS)
+        # Aliased so a UNION ALL of the two tables can be ordered by column name
+        columns = [f'r.{column} AS {column}' for column in REQUEST_COLUMNS
+                   if column in fields or column in KEY_COLUMNS]
+        if user_type == 'admin':
+            parent = [f'{source} as {name}' for name, source in PARENT_COLUMNS.items() if name in fields]
+            if parent:
+                return f"SELECT {', '.join(columns + parent)} FROM {table} r JOIN users u ON r.parent_id = u.id"
+        return f"SELECT {', '.join(columns)} FROM {table} r"
+
+    def listing_query(self, user_type, user_id, filters: Dict, page_cursor=None, fields=None,
+                      archive=None) -> Tuple[str, List]:
+        """SQL and params for the caller's listing in (created_at, id) DESC order, after page_cursor
+
+        archive='include' merges in archived requests and archive='only' lists
+        just those; by default only the live table is read.
+        """
+        clauses, params = self.request_filters(user_type, user_id, filters)
+        if page_cursor:
+            clauses.append('(r.created_at, r.id) < (?, ?)')
+            params.extend(decode_page_cursor(page_cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        if archive is None:
+            return f'{self.request_select(user_type, fields)} {where} ORDER BY r.created_at DESC, r.id DESC', params
+        archived = f"{self.request_select(user_type, fields, 'request_archive')} {where}"
+        if archive == 'only':
+            return f'{archived} ORDER BY r.created_at DESC, r.id DESC', params
+
+        # Both arms list the same explicit columns; each is an ordered index range the union merges
+        live = f"{self.request_select(user_type, fields or REQUEST_COLUMNS + tuple(PARENT_COLUMNS))} {where}"
+        return f'{live} UNION ALL {archived} ORDER BY created_at DESC, id DESC', params + params
+
+    def list_requests(self, user_type, user_id, filters: Dict, page_cursor=None, limit=None, fields=None,
+                      archive=None):
+        """Fetch one page in (created_at, id) DESC order; returns (rows, next_cursor)"""
+        sql, params = self.listing_query(user_type, user_id, filters, page_cursor, fields, archive)
+        with self.connection() as conn:
+            if limit is None:
+                return self.execute_composed(conn, sql, params).fetchall(), None
+
+            # Fetch one extra row to learn whether another page exists
+            rows = self.execute_composed(conn, f'{sql} LIMIT ?', params + [limit + 1]).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_page_cursor(rows[-1])
+        return rows, None
+
+    def changes_query(self, user_type, user_id, filters: Dict, cursor_kind, cursor_value,
+                      fields=None) -> Tuple[str, List]:
+        """SQL and params for rows changed after a version or updated_at cursor, in version order"""
+        if cursor_kind == 'version':
+            row_filter = 'r.version > ?'
+        else:
+            # updated_at has one-second resolution, so include the boundary second
+            row_filter = 'r.updated_at >= ?'
+
+        clauses, params = self.request_filters(user_type, user_id, filters)
+        where = ' AND '.join(clauses + [row_filter])
+        sql = f'{self.request_select(user_type, fields)} WHERE {where} ORDER BY r.version'
+        return sql, params + [cursor_value]
+
+    def deleted_since(self, user_type, user_id, cursor_kind, cursor_value) -> List[int]:
+        """Ids of the caller's requests deleted after a version or updated_at cursor"""
+        tomb_filter = 'version > ?' if cursor_kind == 'version' else 'deleted_at >= ?'
+        with self.connection() as conn:
+            if user_type == 'admin':
+                deleted = conn.execute(f'''
+                    SELECT request_id FROM request_tombstones WHERE {tomb_filter}
+                ''', (cursor_value,)).fetchall()
+            else:
+                deleted = conn.execute(f'''
+                    SELECT request_id FROM request_tombstones WHERE parent_id = ? AND {tomb_filter}
+                ''', (user_id, cursor_value)).fetchall()
+        return [row['request_id'] for row in deleted]
+
+    def request_changes(self, user_type, user_id, filters: Dict, cursor_kind, cursor_value, fields=None):
+        """Rows changed and ids deleted after a version or updated_at cursor"""
+        sql, params = self.changes_query(user_type, user_id, filters, cursor_kind, cursor_value, fields)
+        with self.connection() as conn:
+            rows = self.execute_composed(conn, sql, params).fetchall()
+        return rows, self.deleted_since(user_type, user_id, cursor_kind, cursor_value)
+
+    def stream_rows(self, sql, params, batch_size=500) -> Iterator[List]:
+        """Yield a query's rows in batches of up to batch_size, reading them as they are sent
+
+        One connection stays checked out until the rows run out or the
+        generator is closed, so callers should drain it promptly; a slow reader
+        holds a pool slot (and, on SQLite, an open read snapshot) meanwhile.
+        """
+        with self.connection() as conn:
+            cursor = self.stream_cursor(conn, sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield rows
+            finally:
+                cursor.close()
+                conn.rollback()
+
+    def requests_by_ids(self, request_ids: Iterable[int]):
+        membership, params = self.in_clause(request_ids)
+        with self.connection() as conn:
+            return conn.execute(f'SELECT * FROM requests WHERE id {membership}', params).fetchall()
+
+    def tombstones_by_ids(self, request_ids: Iterable[int]):
+        membership, params = self.in_clause(request_ids)
+        with self.connection() as conn:
+            return conn.execute(f'''
+                SELECT request_id, parent_id, version FROM request_tombstones
+                WHERE request_id {membership}
+            ''', params).fetchall()
+
+    def prune_tombstones(self, retention_days) -> int:
+        """Drop old tombstones and remember the newest version that was discarded"""
+        with self.connection() as conn:
+            horizon = conn.execute('''
+                SELECT MAX(version) AS horizon FROM request_tombstones WHERE deleted_at < ?
+            ''', (utc_timestamp(int(retention_days)),)).fetchone()['horizon']
+            if horizon is None:
+                return 0
+
+            conn.execute('DELETE FROM request_tombstones WHERE version <= ?', (horizon,))
+            conn.execute('''
+                UPDATE change_counter SET pruned_version = ? WHERE id = 1 AND pruned_version < ?
+            ''', (horizon, horizon))
+            conn.commit()
+        return horizon
+
+    # Archive
+
+    def archive_batch(self, cutoff, batch_size) -> int:
+        """Move up to batch_size resolved requests untouched since cutoff into request_archive
+
+        One transaction per batch, oldest first. The delete leaves a tombstone
+        per request, so ?since= pollers drop them from the live listing like any
+        delete. The rollups count both tiers, so the counts the delete trigger
+        takes off are added back first. Returns the number moved.
+        """
+        columns = ', '.join(REQUEST_COLUMNS)
+        with self.connection() as conn:
+            try:
+                self.begin_archive(conn)
+                request_ids = [row['id'] for row in conn.execute('''
+                    SELECT id FROM requests
+                    WHERE created_at < ? AND updated_at < ? AND status IS NOT NULL AND status <> 'pending'
+                    ORDER BY created_at, id
+                    LIMIT ?
+                ''', (cutoff, cutoff, batch_size)).fetchall()]
+                if not request_ids:
+                    conn.rollback()
+                    return 0
+
+                membership, params = self.in_clause(request_ids)
+                conn.execute(f'''
+                    INSERT INTO request_archive ({columns})
+                    SELECT {columns} FROM requests WHERE id {membership}
+                ''', params)
+                conn.execute(f'''
+                    INSERT INTO request_counts (status, request_type, count)
+                    SELECT COALESCE(status, ''), request_type, COUNT(*) FROM requests
+                    WHERE id {membership}
+                    GROUP BY 1, 2
+                    ON CONFLICT (status, request_type) DO UPDATE SET count = request_counts.count + excluded.count
+                ''', params)
+                conn.execute(f'''
+                    INSERT INTO request_volume (day, hour, count)
+                    SELECT {self.volume_day_sql}, {self.volume_hour_sql}, COUNT(*) FROM requests
+                    WHERE id {membership}
+                    GROUP BY 1, 2
+                    ON CONFLICT (day, hour) DO UPDATE SET count = request_volume.count + excluded.count
+                ''', params)
+                conn.execute(f'DELETE FROM requests WHERE id {membership}', params)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return len(request_ids)
+
+    def archive_requests(self, after_days, batch_size=500, max_batches=None) -> int:
+        """Archive resolved requests older than after_days in batches until none are left"""
+        cutoff = utc_timestamp(after_days)
+        moved = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.archive_batch(cutoff, batch_size)
+            moved += count
+            batches += 1
+            if count < batch_size:
+                break
+        if moved:
+            with self.connection() as conn:
+                self.analyze_archive(conn)
+                conn.commit()
+        return moved
+
+    def archive_stats(self) -> Dict:
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM requests) AS live,
+                    (SELECT COUNT(*) FROM request_archive) AS archived,
+                    (SELECT MAX(archived_at) FROM request_archive) AS last_archived_at
+            ''').fetchone()
+        return dict(row)
+
+    # Analytics
+
+    def analytics(self) -> Dict:
+        """Dashboard totals read from the trigger-maintained rollup tables"""
+        with self.connection() as conn:
+            totals = conn.execute('''
+                SELECT
+                    CAST(COALESCE(SUM(count), 0) AS BIGINT) AS requests,
+                    CAST(COALESCE(SUM(CASE WHEN status = 'pending' THEN count END), 0) AS BIGINT) AS pending,
+                    CAST(COALESCE(SUM(CASE WHEN status = 'approved' THEN count END), 0) AS BIGINT) AS approved,
+                    CAST(COALESCE(SUM(CASE WHEN request_type = 'checkin' THEN count END), 0) AS BIGINT) AS checkin,
+                    CAST(COALESCE(SUM(CASE WHEN request_type = 'checkout' THEN count END), 0) AS BIGINT) AS checkout,
+                    (SELECT COUNT(*) FROM users WHERE user_type = 'parent') AS parents
+                FROM request_counts
+            ''').fetchone()
+
+            # Recent activity (last 7 days)
+            recent_requests = conn.execute('''
+                SELECT day as date, CAST(SUM(count) AS BIGINT) as count
+                FROM request_volume
+                WHERE day >= ?
+                GROUP BY day
+                HAVING SUM(count) > 0
+                ORDER BY day
+            ''', (utc_timestamp(7)[:10],)).fetchall()
+
+        return {
+            'totals': {
+                'requests': totals['requests'],
+                'parents': totals['parents'],
+                'pending': totals['pending'],
+                'approved': totals['approved']
+            },
+            'by_type': {
+                'checkin': totals['checkin'],
+                'checkout': totals['checkout']
+            },
+            'recent_activity': [dict(row) for row in recent_requests]
+        }
+
+
+class SQLiteStorage(Storage):
+    """One SQLite database file behind the shared connection pool"""
+
+    backend = 'sqlite'
+    single_writer = True
+
+    def __init__(self, database):
+        self.database = str(database)
+        self.pool = get_pool(self.database)
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.acquire()
+        try:
+            yield self.observed(conn)
+        finally:
+            conn.close()
+
+    def migrate(self) -> List[str]:
+        conn = sqlite3.connect(self.database)
+        try:
+            applied = run_migrations(conn)
+            check_query_plans(conn)
+        finally:
+            conn.close()
+        return applied
+
+    def schema_version(self) -> int:
+        with self.connection() as conn:
+            return schema_version(conn)
+
+    def stats(self) -> Dict:
+        return self.pool.stats()
+
+    def begin_write(self, conn):
+        # Take the write lock up front so the batch cannot fail halfway on SQLITE_BUSY
+        conn.execute('BEGIN IMMEDIATE')
+
+    def insert_id(self, conn, sql, params) -> int:
+        return conn.execute(sql, params).lastrowid
+
+    def analyze_archive(self, conn):
+        # Without statistics next to the live table's, the planner scans users for archive joins;
+        # a sampled ANALYZE keeps this cheap however large the archive grows
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE request_archive')
+
+    def insert_ids(self, conn, sql, rows) -> List[int]:
+        conn.executemany(sql, rows)
+        # Holding the write lock, AUTOINCREMENT ids in one statement are consecutive
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+_sqlite_storages: Dict[str, SQLiteStorage] = {}
+_sqlite_storages_lock = threading.Lock()
+
+
+def sqlite_storage(database) -> SQLiteStorage:
+    """Process-wide storage for a database file, created on first use"""
+    storage = _sqlite_storages.get(database)
+    if storage is None:
+        with _sqlite_storages_lock:
+            storage = _sqlite_storages.get(database)
+            if storage is None:
+                storage = SQLiteStorage(database)
+                _sqlite_storages[database] = storage
+    return storage
+
+
+# PostgreSQL schema, numbered to match migrations.py so /api/health reports the same version.
+# Timestamps are second-resolution UTC like SQLite's CURRENT_TIMESTAMP, which keeps
+# keyset cursors and ?since= timestamps interchangeable between the backends.
+POSTGRES_MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'initial_schema', ['''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGSERIAL PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            user_type TEXT DEFAULT 'parent',
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS children (
+            id BIGSERIAL PRIMARY KEY,
+            parent_id BIGINT REFERENCES users (id),
+            name TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS requests (
+            id BIGSERIAL PRIMARY KEY,
+            parent_id BIGINT REFERENCES users (id),
+            child_name TEXT NOT NULL,
+            child_grade TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            request_message TEXT,
+            status TEXT DEFAULT 'pending',
+            feedback TEXT,
+            response_time TIMESTAMP(0),
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0),
+            updated_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+    ''', '''
+        CREATE TABLE IF NOT EXISTS admins (
+            id BIGSERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+    ''']),
+    (2, 'change_tracking', [
+        'ALTER TABLE requests ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0',
+        '''
+        CREATE TABLE IF NOT EXISTS change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version BIGINT NOT NULL DEFAULT 0,
+            pruned_version BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        'INSERT INTO change_counter (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING',
+        '''
+        CREATE TABLE IF NOT EXISTS request_tombstones (
+            request_id BIGINT PRIMARY KEY,
+            parent_id BIGINT,
+            version BIGINT NOT NULL,
+            deleted_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+        ''',
+        # The counter row is locked until commit, so versions become visible in commit
+        # order and a ?since= poller can never skip a change that commits late. The cost
+        # is that every request write in the database serializes on this row; a sequence
+        # would remove the queue but hand out versions out of commit order
+        '''
+        CREATE OR REPLACE FUNCTION requests_track_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE change_counter SET version = version + 1 WHERE id = 1 RETURNING version INTO NEW.version;
+            IF TG_OP = 'INSERT' THEN
+                DELETE FROM request_tombstones WHERE request_id = NEW.id;
+            END IF;
+            RETURN NEW;
+        END
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION requests_track_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            next_version BIGINT;
+        BEGIN
+            UPDATE change_counter SET version = version + 1 WHERE id = 1 RETURNING version INTO next_version;
+            INSERT INTO request_tombstones (request_id, parent_id, version, deleted_at)
+            VALUES (OLD.id, OLD.parent_id, next_version, LOCALTIMESTAMP(0))
+            ON CONFLICT (request_id) DO UPDATE
+            SET parent_id = excluded.parent_id, version = excluded.version, deleted_at = excluded.deleted_at;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        'DROP TRIGGER IF EXISTS requests_track_insert ON requests',
+        '''
+        CREATE TRIGGER requests_track_insert BEFORE INSERT ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_track_change()
+        ''',
+        'DROP TRIGGER IF EXISTS requests_track_update ON requests',
+        '''
+        CREATE TRIGGER requests_track_update
+        BEFORE UPDATE OF parent_id, child_name, child_grade, request_type, request_message,
+                         status, feedback, response_time, updated_at ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_track_change()
+        ''',
+        'DROP TRIGGER IF EXISTS requests_track_delete ON requests',
+        '''
+        CREATE TRIGGER requests_track_delete AFTER DELETE ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_track_delete()
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_requests_version ON requests (version)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_parent_version ON requests (parent_id, version)',
+        'CREATE INDEX IF NOT EXISTS idx_tombstones_version ON request_tombstones (version)',
+        'CREATE INDEX IF NOT EXISTS idx_tombstones_parent_version ON request_tombstones (parent_id, version)',
+    ]),
+    (3, 'listing_indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_requests_created ON requests (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_parent_created ON requests (parent_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_status_created ON requests (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_type_created ON requests (request_type, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_grade_created ON requests (child_grade, created_at, id)',
+    ]),
+    (4, 'lookup_indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_children_parent ON children (parent_id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_type ON users (user_type)',
+        'CREATE INDEX IF NOT EXISTS idx_admins_name ON admins (name)',
+    ]),
+    (5, 'request_rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS request_counts (
+            status TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (status, request_type)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS request_volume (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour)
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION requests_rollup() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE request_counts SET count = count - 1
+                WHERE status = COALESCE(OLD.status, '') AND request_type = OLD.request_type;
+                UPDATE request_volume SET count = count - 1
+                WHERE day = to_char(OLD.created_at, 'YYYY-MM-DD') AND hour = EXTRACT(HOUR FROM OLD.created_at);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO request_counts (status, request_type, count)
+                VALUES (COALESCE(NEW.status, ''), NEW.request_type, 1)
+                ON CONFLICT (status, request_type) DO UPDATE SET count = request_counts.count + 1;
+                INSERT INTO request_volume (day, hour, count)
+                VALUES (to_char(NEW.created_at, 'YYYY-MM-DD'), EXTRACT(HOUR FROM NEW.created_at), 1)
+                ON CONFLICT (day, hour) DO UPDATE SET count = request_volume.count + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        'DROP TRIGGER IF EXISTS requests_rollup_change ON requests',
+        '''
+        CREATE TRIGGER requests_rollup_change AFTER INSERT OR DELETE ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_rollup()
+        ''',
+        'DROP TRIGGER IF EXISTS requests_rollup_update ON requests',
+        '''
+        CREATE TRIGGER requests_rollup_update AFTER UPDATE OF status, request_type, created_at ON requests
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.request_type IS DISTINCT FROM NEW.request_type
+              OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+        EXECUTE FUNCTION requests_rollup()
+        ''',
+        'DELETE FROM request_counts',
+        '''
+        INSERT INTO request_counts (status, request_type, count)
+        SELECT COALESCE(status, ''), request_type, COUNT(*) FROM requests GROUP BY 1, 2
+        ''',
+        'DELETE FROM request_volume',
+        '''
+        INSERT INTO request_volume (day, hour, count)
+        SELECT to_char(created_at, 'YYYY-MM-DD'), EXTRACT(HOUR FROM created_at), COUNT(*) FROM requests GROUP BY 1, 2
+        ''',
+    ]),
+    (6, 'request_archive', ['''
+        CREATE TABLE IF NOT EXISTS request_archive (
+            id BIGINT PRIMARY KEY,
+            parent_id BIGINT,
+            child_name TEXT NOT NULL,
+            child_grade TEXT NOT NULL,
+            request_type TEXT NOT NULL,
+            request_message TEXT,
+            status TEXT,
+            feedback TEXT,
+            response_time TIMESTAMP(0),
+            created_at TIMESTAMP(0),
+            updated_at TIMESTAMP(0),
+            version BIGINT NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_archive_created ON request_archive (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_archive_parent_created ON request_archive (parent_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_archive_version ON request_archive (version)',
+    ]),
+]
+
+# pg_advisory_xact_lock keys serializing concurrent migrators and archivers
+# (the SQLite side uses BEGIN IMMEDIATE for both)
+MIGRATION_LOCK_KEY = 0x4b696443
+ARCHIVE_LOCK_KEY = 0x4b696441
+
+
+def _sqlite_style_rows(cursor):
+    """psycopg row factory: dicts, with timestamps rendered the way SQLite returns them"""
+    names = [column.name for column in cursor.description] if cursor.description else []
+
+    def make_row(values):
+        return {name: value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+                for name, value in zip(names, values)}
+    return make_row
+
+
+class _PostgresConnection:
+    """Runs the shared ?-placeholder SQL on a psycopg connection as server-side prepared statements
+
+    Only fixed-text statements are prepared and have their translation cached;
+    composed ones (prepare=False) would just churn both caches.
+    """
+
+    _translated: Dict[str, str] = {}
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    @classmethod
+    def translate(cls, sql, cache=True):
+        translated = cls._translated.get(sql)
+        if translated is None:
+            translated = sql.replace('%', '%%').replace('?', '%s')
+            if cache:
+                cls._translated[sql] = translated
+        return translated
+
+    def execute(self, sql, params=(), server_side=False, prepare=True):
+        if server_side:
+            # A named cursor fetches from the server in fetchmany()-sized steps instead of
+            # buffering the whole result client-side; it lives until the transaction ends
+            cursor = self._conn.cursor(name='kidcheck_stream')
+            cursor.execute(self.translate(sql, cache=False), params)
+            return cursor
+        return self._conn.execute(self.translate(sql, cache=prepare), params, prepare=prepare)
+
+    def executemany(self, sql, rows):
+        cursor = self._conn.cursor()
+        cursor.executemany(self.translate(sql), rows)
+        return cursor
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL behind a psycopg connection pool
+
+    Fixed-text statements are prepared server-side on first use and reused
+    for the life of each pooled connection; listings composed from filters
+    and fields run unprepared (execute_composed).
+
+    There is no database-wide write lock, so there is no write-behind queue
+    either, but request writes are not independent:
+    each one locks the change_counter row and the request_counts row it
+    touches until commit, so writers queue there and throughput stays flat or
+    drops as writers are added. scripts/write_benchmark.py measures it; on one
+    CPU with PostgreSQL 16 and synchronous commit, inserts ran at about 1,400/s
+    with 1 writer, 1,100/s with 4 and 700-900/s with 16.
+    """
+
+    backend = 'postgres'
+
+    def __init__(self, dsn, min_size=None, max_size=None, timeout=None):
+        if psycopg is None or PostgresPool is None:
+            raise StorageUnavailable('psycopg and psycopg_pool are required for PostgreSQL '
+                                     '(pip install "psycopg[binary,pool]")')
+        self.dsn = dsn
+        self.min_size = int(min_size or os.environ.get('PG_POOL_MIN_SIZE', 2))
+        self.max_size = int(max_size or os.environ.get('PG_POOL_SIZE', os.environ.get('DB_POOL_SIZE', 8)))
+        self.timeout = float(timeout or os.environ.get('DB_POOL_TIMEOUT', 5.0))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        _postgres_storages.add(self)
+
+    @property
+    def pool(self):
+        """The process's connection pool, opened on first use (and again after a fork)"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = PostgresPool(
+                        self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        timeout=self.timeout,
+                        # UTC sessions make CURRENT_TIMESTAMP match SQLite's
+                        kwargs={'row_factory': _sqlite_style_rows, 'options': self.session_options()},
+                        open=True,
+                    )
+        return self._pool
+
+    def session_options(self) -> str:
+        """Server options for each connection: the DSN's own (e.g. a search_path) plus UTC"""
+        options = psycopg.conninfo.conninfo_to_dict(self.dsn).get('options')
+        return f'{options} -c TimeZone=UTC' if options else '-c TimeZone=UTC'
+
+    def reset_after_fork(self):
+        # The parent's pool threads are gone and its sockets must not be shared
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self.pool.connection() as conn:
+            yield self.observed(_PostgresConnection(conn))
+
+    def migrate(self) -> List[str]:
+        applied = []
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP(0) DEFAULT LOCALTIMESTAMP(0)
+                )
+            ''')
+            conn.commit()
+            for version, name, statements in POSTGRES_MIGRATIONS:
+                with conn.transaction():
+                    conn.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_KEY,))
+                    if conn.execute('SELECT 1 FROM schema_version WHERE version = %s', (version,)).fetchone():
+                        continue
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute('INSERT INTO schema_version (version, name) VALUES (%s, %s)', (version, name))
+                applied.append(f'{version:04d}_{name}')
+        return applied
+
+    def schema_version(self) -> int:
+        with self.connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version').fetchone()['version']
+
+    def stats(self) -> Dict:
+        return self.pool.get_stats()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def insert_id(self, conn, sql, params) -> int:
+        return conn.execute(f'{sql} RETURNING id', params).fetchone()['id']
+
+    def insert_ids(self, conn, sql, rows) -> List[int]:
+        # One round trip per row on the prepared statement, all inside the caller's transaction
+        return [self.insert_id(conn, sql, row) for row in rows]
+
+    def begin_archive(self, conn):
+        conn.execute('SELECT pg_advisory_xact_lock(?)', (ARCHIVE_LOCK_KEY,))
+
+    volume_day_sql = "to_char(created_at, 'YYYY-MM-DD')"
+    volume_hour_sql = 'EXTRACT(HOUR FROM created_at)'
+
+    def stream_cursor(self, conn, sql, params):
+        return conn.execute(sql, params, server_side=True)
+
+    def execute_composed(self, conn, sql, params):
+        return conn.execute(sql, params, prepare=False)
+
+    def in_clause(self, values) -> Tuple[str, List]:
+        # One prepared statement regardless of how many ids are passed
+        return '= ANY(?)', [list(values)]
+
+
+_postgres_storages = weakref.WeakSet()
+
+
+def _reset_storages_after_fork():
+    for storage in list(_postgres_storages):
+        storage.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_storages_after_fork)
+
+
+def storage_from_env() -> Optional[Storage]:
+    """PostgresStorage when STORAGE_BACKEND=postgres, otherwise None (SQLite files per database)"""
+    backend = os.environ.get('STORAGE_BACKEND', 'sqlite').lower()
+    if backend == 'sqlite':
+        return None
+    if backend != 'postgres':
+        raise ValueError(f'Unknown STORAGE_BACKEND {backend!r}; expected sqlite or postgres')
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        raise ValueError('STORAGE_BACKEND=postgres needs DATABASE_URL')
+    return PostgresStorage(dsn)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+KidCheck Synthetic Data
+Realistic users/children/requests at any scale, bulk-loaded into a fresh SQLite database
+
+    python scripts/synthetic_data.py bench.db 1m --days 180 --seed 7
+"""
+
+import datetime
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from migrations import run_migrations
+from rollups import rebuild_rollups
+
+GRADES = ['K', '1', '2', '3', '4', '5', '6', '7', '8']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Noah', 'Emma', 'Liam', 'Olivia', 'Ava', 'Mia', 'Lucas', 'Amara', 'Thabo', 'Lerato']
+LAST_NAMES = ['Smith', 'Nkosi', 'Garcia', 'Dlamini', 'Brown', 'Naidoo', 'Jones', 'Botha', 'Patel', 'Khumalo',
+              'Miller', 'Mokoena', 'Davis', 'van Wyk', 'Wilson', 'Pillay']
+MESSAGES = ['', '', '', 'Has my child arrived?', 'Running late today', 'Grandma is collecting',
+            'Please confirm pickup', 'Doctor appointment at 10']
+FEEDBACK = ['Confirmed', 'Checked in at the gate', 'Collected by parent', 'In class', 'Seen by the office']
+
+# Share of each request type in the morning drop-off and afternoon dismissal windows
+DROP_OFF = (7.75, 0.4)     # mean hour, standard deviation in hours
+DISMISSAL = (15.0, 0.5)
+WINDOW_SHARES = (0.45, 0.45, 0.10)  # drop-off, dismissal, uniform through the school day
+WEEKEND_WEIGHT = 0.03
+
+# Response delays in seconds: lognormal with a median of about four minutes
+RESPONSE_MEDIAN_S = 240
+RESPONSE_SIGMA = 0.9
+RESPONSE_CAP_S = 8 * 3600
+
+BATCH_ROWS = 50000
+
+SCALE_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+
+def parse_scale(text) -> int:
+    """'10k', '1m', '10m' or a plain integer row count"""
+    text = str(text).strip().lower().replace('_', '')
+    if text and text[-1] in SCALE_SUFFIXES:
+        return int(float(text[:-1]) * SCALE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def format_scale(rows) -> str:
+    for suffix, factor in sorted(SCALE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if rows >= factor and rows % factor == 0:
+            return f'{rows // factor}{suffix}'
+    return str(rows)
+
+
+def timestamps(epoch_seconds) -> List[str]:
+    """Epoch seconds to SQLite's 'YYYY-MM-DD HH:MM:SS' text, vectorized"""
+    text = np.datetime_as_string(np.asarray(epoch_seconds, dtype='datetime64[s]'), unit='s')
+    return np.char.replace(text, 'T', ' ').tolist()
+
+
+@contextmanager
+def bulk_load(conn, table):
+    """Drop a table's indexes and insert triggers for a bulk load, recreating them afterwards
+
+    Building an index over the loaded rows once is far cheaper than maintaining
+    it row by row; the caller takes over whatever the insert triggers did.
+    """
+    saved = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND sql IS NOT NULL
+          AND (type = 'index' OR (type = 'trigger' AND sql LIKE '%AFTER INSERT%'))
+    ''', (table,)).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    yield
+    for _, _, sql in saved:
+        conn.execute(sql)
+
+
+def school_days(days, end=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Midnight epoch seconds for the `days` days up to yesterday and their relative activity"""
+    end = end or datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=1)
+    dates = [end - datetime.timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    starts = np.array([int(datetime.datetime(d.year, d.month, d.day, tzinfo=datetime.timezone.utc).timestamp())
+                       for d in dates], dtype=np.int64)
+    weights = np.array([WEEKEND_WEIGHT if d.weekday() >= 5 else 1.0 for d in dates])
+    return starts, weights / weights.sum()
+
+
+def request_hours(rng, n) -> Tuple[np.ndarray, np.ndarray]:
+    """Seconds after midnight and request type (True for checkin) following the school-day peaks"""
+    window = rng.choice(3, size=n, p=WINDOW_SHARES)
+    hours = np.empty(n)
+    for index, (mean, sd) in enumerate((DROP_OFF, DISMISSAL)):
+        mask = window == index
+        hours[mask] = rng.normal(mean, sd, mask.sum())
+    mask = window == 2
+    hours[mask] = rng.uniform(8.5, 14.5, mask.sum())
+    seconds = np.clip(hours * 3600, 6 * 3600, 18 * 3600 - 1).astype(np.int64)
+
+    # Mornings are mostly check-ins, afternoons mostly check-outs
+    checkin_odds = np.where(seconds < 12 * 3600, 0.85, 0.15)
+    return seconds, rng.random(n) < checkin_odds
+
+
+def generate(database, requests, parents=None, days=180, seed=1, password_hash='!synthetic') -> Dict:
+    """Fill a fresh database with `requests` requests and proportionate users and children
+
+    Requests are inserted in created_at order, so ids follow time as they do
+    in production. Returns row counts and the load time.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    parents = parents or max(10, requests // 200)
+
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        run_migrations(conn)
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        conn.execute('BEGIN')
+
+        day_starts, day_weights = school_days(days)
+        first_day = int(day_starts[0])
+
+        # Parents signed up before the period; a few are far more active than the rest
+        first = rng.integers(0, len(FIRST_NAMES), parents)
+        last = rng.integers(0, len(LAST_NAMES), parents)
+        joined = timestamps(first_day - rng.integers(0, 365 * 86400, parents))
+        conn.executemany('INSERT INTO users (email, name, password_hash, user_type, created_at) VALUES (?, ?, ?, ?, ?)', (
+            (f'parent{i}@example.com', f'{FIRST_NAMES[first[i]]} {LAST_NAMES[last[i]]}', password_hash, 'parent',
+             joined[i]) for i in range(parents)))
+        parent_ids = np.array([row[0] for row in conn.execute(
+            "SELECT id FROM users WHERE user_type = 'parent' ORDER BY id")], dtype=np.int64)[-parents:]
+        activity = rng.lognormal(0, 1, parents)
+        activity /= activity.sum()
+
+        # One to three children each
+        child_counts = rng.choice([1, 2, 3], size=parents, p=[0.5, 0.35, 0.15])
+        child_parent = np.repeat(np.arange(parents), child_counts)
+        child_names = [f'{FIRST_NAMES[k]} {LAST_NAMES[last[p]]}'
+                       for p, k in zip(child_parent, rng.integers(0, len(FIRST_NAMES), len(child_parent)))]
+        child_grades = [GRADES[g] for g in rng.integers(0, len(GRADES), len(child_parent))]
+        conn.executemany('INSERT INTO children (parent_id, name, grade, created_at) VALUES (?, ?, ?, ?)', (
+            (int(parent_ids[p]), child_names[i], child_grades[i], joined[p]) for i, p in enumerate(child_parent)))
+        child_offsets = np.concatenate([[0], np.cumsum(child_counts)[:-1]])
+
+        with bulk_load(conn, 'requests'):
+            per_day = rng.multinomial(requests, day_weights)
+            now = time.time()
+            pending_after = now - 86400
+            batch: List[Tuple] = []
+            for day_start, count in zip(day_starts, per_day):
+                if not count:
+                    continue
+                seconds, checkin = request_hours(rng, count)
+                order = np.argsort(seconds, kind='stable')
+                created = int(day_start) + seconds[order]
+                checkin = checkin[order]
+
+                parent_index = rng.choice(parents, size=count, p=activity)
+                child_index = child_offsets[parent_index] + (rng.random(count) * child_counts[parent_index]).astype(int)
+                delay = np.minimum(rng.lognormal(np.log(RESPONSE_MEDIAN_S), RESPONSE_SIGMA, count), RESPONSE_CAP_S)
+                responded_at = created + delay.astype(np.int64)
+
+                # Old requests are nearly all answered; the last day still has a queue
+                answered = np.where(created < pending_after, rng.random(count) < 0.97, rng.random(count) < 0.6)
+                answered &= responded_at < now
+                approved = rng.random(count) < 0.88
+
+                created_text = timestamps(created)
+                responded_text = timestamps(responded_at)
+                messages = rng.integers(0, len(MESSAGES), count)
+                feedback = rng.integers(0, len(FEEDBACK), count)
+                for i in range(count):
+                    child = child_index[i]
+                    if answered[i]:
+                        status = 'approved' if approved[i] else 'rejected'
+                        response, note, updated = responded_text[i], FEEDBACK[feedback[i]], responded_text[i]
+                    else:
+                        status, response, note, updated = 'pending', None, None, created_text[i]
+                    batch.append((int(parent_ids[parent_index[i]]), child_names[child], child_grades[child],
+                                  'checkin' if checkin[i] else 'checkout', MESSAGES[messages[i]], status, note,
+                                  response, created_text[i], updated))
+                if len(batch) >= BATCH_ROWS:
+                    insert_requests(conn, batch)
+                    batch = []
+            insert_requests(conn, batch)
+
+            # What the insert triggers would have done: a version for ?since= and the rollups
+            conn.execute('UPDATE change_counter SET version = MAX(version, 1) WHERE id = 1')
+            rebuild_rollups(conn.cursor())
+        conn.execute('COMMIT')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+    return {
+        'parents': parents,
+        'children': int(child_counts.sum()),
+        'requests': int(per_day.sum()),
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def insert_requests(conn, rows: Iterable[Tuple]):
+    conn.executemany('''
+        INSERT INTO requests (parent_id, child_name, child_grade, request_type, request_message,
+                              status, feedback, response_time, created_at, updated_at, version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ''', rows)
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic KidCheck database')
+    parser.add_argument('database')
+    parser.add_argument('requests', help='number of requests, e.g. 10k, 1m, 10m')
+    parser.add_argument('--parents', type=int, help='default: one per 200 requests')
+    parser.add_argument('--days', type=int, default=180, help='days of history, ending yesterday')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists; synthetic data is only written to a new database')
+    counts = generate(args.database, parse_scale(args.requests), args.parents, args.days, args.seed)
+    print(f"🌱 {counts['requests']} requests, {counts['parents']} parents, {counts['children']} children "
+          f"in {args.database} ({counts['seconds']}s)")
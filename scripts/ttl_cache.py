@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+KidCheck TTL Cache
+Small thread-safe in-process LRU cache whose entries expire after a fixed time-to-live
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU mapping with per-entry expiry; ttl <= 0 disables caching entirely"""
+
+    def __init__(self, ttl=5.0, max_entries=1024):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'stale_sets': 0}
+        self._generation = 0
+
+    def get(self, key, default=None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every invalidate(); take it before computing a value to set"""
+        return self._generation
+
+    def set(self, key, value, generation=None):
+        """Store value; skipped when an invalidate() ran since generation was read"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._stats['stale_sets'] += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key, or every entry when no key is given"""
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def purge_expired(self) -> int:
+        """Remove expired entries in one pass; returns how many were dropped"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires, _) in self._entries.items() if expires <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._entries)
+        return snapshot
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+KidCheck Write Benchmark
+Measures request inserts and status updates per second as concurrent writers are added
+
+Every request write bumps the single change_counter row and one request_counts
+rollup row, and holds both row locks until commit, so on PostgreSQL writers
+queue behind each other there rather than scaling with connections. This shows
+where that ceiling sits on a given server.
+
+    python scripts/write_benchmark.py --writers 1,4,16
+    DATABASE_URL=postgresql://localhost/kidcheck python scripts/write_benchmark.py
+
+PostgreSQL runs in a throwaway schema that is dropped afterwards; without
+DATABASE_URL a temporary SQLite file is used. Nothing else is touched.
+"""
+
+import argparse
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from storage import PostgresStorage, SQLiteStorage
+
+try:
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+except ImportError:  # optional: only needed for PostgreSQL
+    psycopg = None
+
+
+@contextmanager
+def scratch_storage(dsn=None, pool_size=None):
+    """A migrated, empty storage that is thrown away on exit"""
+    if not dsn:
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(Path(directory) / 'kidcheck.db')
+            storage.migrate()
+            try:
+                yield storage
+            finally:
+                storage.pool.close_all()
+        return
+
+    if psycopg is None:
+        raise RuntimeError('psycopg is required for PostgreSQL (pip install "psycopg[binary,pool]")')
+    schema = f'kidcheck_bench_{secrets.token_hex(4)}'
+    with psycopg.connect(dsn, autocommit=True) as admin:
+        admin.execute(f'CREATE SCHEMA {schema}')
+    storage = None
+    try:
+        storage = PostgresStorage(make_conninfo(dsn, options=f'-c search_path={schema}'), max_size=pool_size)
+        storage.migrate()
+        yield storage
+    finally:
+        if storage is not None:
+            storage.close()
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+def run(writers, seconds, operation) -> float:
+    """Call operation(writer) in a loop on each writer thread; returns calls per second"""
+    stop = time.monotonic() + seconds
+    counts = [0] * writers
+
+    def work(writer):
+        while time.monotonic() < stop:
+            operation(writer)
+            counts[writer] += 1
+
+    threads = [threading.Thread(target=work, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent write throughput of the request storage')
+    parser.add_argument('--writers', default='1,4,16', help='comma-separated writer thread counts')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each run')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'),
+                        help='PostgreSQL database to benchmark in a scratch schema (default: DATABASE_URL)')
+    args = parser.parse_args(argv)
+    writer_counts = [int(n) for n in args.writers.split(',')]
+
+    with scratch_storage(args.dsn, pool_size=max(writer_counts)) as storage:
+        parent_id = storage.create_parent('bench@example.com', 'Bench', 'x', child_name='Kid')
+        # One request per writer to flip back and forth, so updates never touch the same requests row
+        targets = storage.create_requests([(parent_id, 'Kid', '1', 'checkin', '')] * max(writer_counts))
+        flips = [0] * len(targets)
+
+        def insert(writer):
+            storage.create_request((parent_id, 'Kid', '1', 'checkin', ''))
+
+        def update(writer):
+            flips[writer] += 1
+            storage.update_request(targets[writer], 'approved' if flips[writer] % 2 else 'rejected', '')
+
+        print(f"⏱️  Benchmarking {storage.backend} writes, {args.seconds:g}s per run...")
+        print(f"{'writers':>8}{'inserts/s':>12}{'updates/s':>12}")
+        for writers in writer_counts:
+            print(f'{writers:>8}{run(writers, args.seconds, insert):>12.0f}{run(writers, args.seconds, update):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
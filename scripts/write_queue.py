@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+KidCheck Write Queue
+Write-behind insert queue drained by a single writer thread in group-committed batches
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_STOP = object()
+
+
+class InsertQueue:
+    """Coalesces single-row INSERTs from many request threads into one transaction per batch
+
+    Each submit() returns a Future resolved with the new row id once its batch
+    has committed, so callers still answer with the id synchronously. A
+    Future cancelled before the writer picks it up is never written.
+    on_commit(conn, row_ids) runs on the writer after the Futures resolve;
+    its errors are logged, never raised to callers.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], sql: str,
+                 max_batch=64, max_delay_ms=5.0, on_commit: Optional[Callable] = None):
+        self.connect = connect
+        self.sql = sql
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.on_commit = on_commit
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'batches': 0,
+            'batched_rows': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+
+    def _ensure_started(self):
+        # Started lazily so forked worker processes each get their own writer
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='kidcheck-insert-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, params: Sequence) -> Future:
+        """Queue one row of INSERT parameters"""
+        self._ensure_started()
+        future: Future = Future()
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+        self._queue.put((tuple(params), future))
+        return future
+
+    def insert(self, params: Sequence, timeout=10.0) -> int:
+        """Queue a row and wait for its committed row id
+
+        Raises TimeoutError only when the row was withdrawn unwritten, so the
+        caller can safely retry; a row the writer already took is waited for.
+        """
+        future = self.submit(params)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise TimeoutError(f'Insert not written within {timeout:g}s; it was withdrawn') from None
+            return future.result()
+
+    def _claim(self, item, batch):
+        _, future = item
+        # False when the caller gave up first: the row is dropped unwritten
+        if future.set_running_or_notify_cancel():
+            batch.append(item)
+        else:
+            with self._stats_lock:
+                self._stats['cancelled'] += 1
+
+    def _collect(self, first) -> List[Tuple[tuple, Future]]:
+        batch: List[Tuple[tuple, Future]] = []
+        self._claim(first, batch)
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            self._claim(item, batch)
+        return batch
+
+    def _write_batch(self, conn, batch):
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(self.sql, [params for params, _ in batch])
+            # The writer holds the lock, so AUTOINCREMENT ids in the batch are consecutive
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            conn.commit()
+            ids = list(range(last_id - len(batch) + 1, last_id + 1))
+        except sqlite3.Error:
+            conn.rollback()
+            ids = self._write_individually(conn, batch)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        committed = [row_id for row_id in ids if row_id is not None]
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['batched_rows'] += len(batch)
+            self._stats['committed'] += len(committed)
+            self._stats['last_batch_size'] = len(batch)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['last_commit_ms'] = elapsed_ms
+            self._stats['max_commit_ms'] = max(self._stats['max_commit_ms'], elapsed_ms)
+            self._stats['total_commit_ms'] += elapsed_ms
+
+        # Callers only wait for their commit, not for whatever the hook does after it
+        for (_, future), row_id in zip(batch, ids):
+            if row_id is not None:
+                future.set_result(row_id)
+
+        if committed and self.on_commit is not None:
+            try:
+                self.on_commit(conn, committed)
+            except Exception as e:
+                print(f"⚠️  Insert queue commit hook failed: {e}")
+
+    def _write_individually(self, conn, batch) -> List[Optional[int]]:
+        """Fallback after a failed batch: isolate the bad rows, commit the rest"""
+        ids: List[Optional[int]] = []
+        conn.execute('BEGIN IMMEDIATE')
+        for params, future in batch:
+            conn.execute('SAVEPOINT row')
+            try:
+                ids.append(conn.execute(self.sql, params).lastrowid)
+                conn.execute('RELEASE row')
+            except sqlite3.Error as e:
+                conn.execute('ROLLBACK TO row')
+                conn.execute('RELEASE row')
+                ids.append(None)
+                future.set_exception(e)
+                with self._stats_lock:
+                    self._stats['failed'] += 1
+        conn.commit()
+        return ids
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch = self._collect(first)
+                if not batch:
+                    continue
+                try:
+                    self._write_batch(conn, batch)
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    with self._stats_lock:
+                        self._stats['failed'] += len(batch)
+        finally:
+            conn.close()
+
+    def stop(self, timeout=5.0):
+        """Drain what is queued, then stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        batches = snapshot['batches']
+        snapshot['queue_depth'] = self._queue.qsize()
+        snapshot['avg_batch_size'] = round(snapshot['batched_rows'] / batches, 2) if batches else 0
+        snapshot['avg_commit_ms'] = round(snapshot['total_commit_ms'] / batches, 3) if batches else 0
+        for key in ('last_commit_ms', 'max_commit_ms', 'total_commit_ms'):
+            snapshot[key] = round(snapshot[key], 3)
+        snapshot['max_batch'] = self.max_batch
+        snapshot['max_delay_ms'] = self.max_delay * 1000
+        return snapshot
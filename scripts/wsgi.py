@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+KidCheck WSGI Entry Point
+The API as a WSGI application for production servers; run it with gunicorn -c scripts/gunicorn.conf.py
+"""
+
+from backend_api import app, init_db, shared_storage
+
+# gunicorn.conf.py preloads this module in the master, so the schema migrations,
+# default admin and tombstone pruning run once before any worker forks. Workers
+# inherit the initialized app; db_pool, passwords and storage reset their
+# connections and threads after fork.
+init_db()
+if shared_storage is not None:
+    # Workers open their own PostgreSQL pools; the master keeps no connections
+    shared_storage.close()
+
+application = app
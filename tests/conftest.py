@@ -0,0 +1,74 @@
+"""
+Fixtures shared by the backend tests
+
+Storage tests run once per backend: SQLite in a temporary file, and
+PostgreSQL in a throwaway schema of the database at DATABASE_URL (skipped
+when it is unset). Nothing outside the temporary file or schema is touched.
+
+    DATABASE_URL=postgresql://localhost/kidcheck_test python -m pytest tests
+"""
+
+import os
+import secrets
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+from storage import PostgresStorage, SQLiteStorage, StorageUnavailable  # noqa: E402
+
+try:
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+except ImportError:  # optional: without it the PostgreSQL cases are skipped
+    psycopg = None
+
+
+def sqlite_backend(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'kidcheck.db')
+    storage.migrate()
+    try:
+        yield storage
+    finally:
+        storage.pool.close_all()
+
+
+def postgres_backend():
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        pytest.skip('DATABASE_URL is not set')
+    if psycopg is None:
+        pytest.skip('psycopg is not installed')
+
+    schema = f'kidcheck_test_{secrets.token_hex(4)}'
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f'CREATE SCHEMA {schema}')
+    storage = None
+    try:
+        try:
+            storage = PostgresStorage(make_conninfo(url, options=f'-c search_path={schema}'))
+        except StorageUnavailable as e:
+            pytest.skip(str(e))
+        storage.migrate()
+        yield storage
+    finally:
+        if storage is not None:
+            storage.close()
+        with psycopg.connect(url, autocommit=True) as admin:
+            admin.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def storage(request, tmp_path):
+    """A migrated, empty storage on each backend"""
+    if request.param == 'sqlite':
+        yield from sqlite_backend(tmp_path)
+    else:
+        yield from postgres_backend()
+
+
+@pytest.fixture
+def parent_id(storage):
+    return storage.create_parent('parent@example.com', 'Test Parent', 'hash', child_name='Kid')
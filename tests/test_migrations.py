@@ -0,0 +1,27 @@
+"""SQLite migrations and the hot query plan check"""
+
+import sqlite3
+
+import pytest
+
+from migrations import SchemaCheckError, check_query_plans, full_scans, run_migrations
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    run_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_search_an_index(conn):
+    check_query_plans(conn)
+
+
+def test_index_scans_count_as_full_scans(conn):
+    # Ordered by an index but with no range on it: every entry is read
+    assert full_scans(conn, 'SELECT id FROM requests ORDER BY created_at LIMIT 5') != []
+    assert full_scans(conn, 'SELECT COUNT(*) FROM requests') != []
+    with pytest.raises(SchemaCheckError, match='unfiltered'):
+        check_query_plans(conn, [('unfiltered', 'SELECT * FROM requests', ())])
@@ -0,0 +1,42 @@
+"""Splitting one SQLite database into per-school shards"""
+
+import sqlite3
+
+import pytest
+
+from sharding import ShardConflict, ShardRouter, split_database
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def source(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'kidcheck.db')
+    storage.migrate()
+    storage.create_admin('admin', 'hash')
+    for email in ('a@example.com', 'b@example.com'):
+        parent_id = storage.create_parent(email, 'Parent', 'hash', child_name='Kid')
+        storage.create_requests([(parent_id, 'Kid', '1', 'checkin', '')] * 2)
+    storage.pool.close_all()
+    return tmp_path / 'kidcheck.db'
+
+
+def test_split_copies_each_school(source, tmp_path):
+    router = ShardRouter(tmp_path / 'shards')
+    summary = split_database(source, router, {'a@example.com': 'north'}, default_school='south')
+    assert summary['north']['users'] == 1 and summary['north']['requests'] == 2
+    assert summary['south']['users'] == 1 and summary['south']['admins'] == 1
+    assert router.school_for('parent', 'b@example.com') == 'south'
+
+
+def test_split_refuses_to_overwrite_a_shard(source, tmp_path):
+    router = ShardRouter(tmp_path / 'shards')
+    split_database(source, router, {}, default_school='north')
+    with pytest.raises(ShardConflict, match='north'):
+        split_database(source, router, {}, default_school='north')
+
+    conn = sqlite3.connect(router.database_for('north'))
+    try:
+        assert conn.execute('SELECT COUNT(*) FROM requests').fetchone()[0] == 4
+        assert conn.execute('SELECT SUM(count) FROM request_counts').fetchone()[0] == 4
+    finally:
+        conn.close()
@@ -0,0 +1,224 @@
+"""Storage behaviour both backends must share; every test runs on SQLite and PostgreSQL"""
+
+import pytest
+
+from migrations import MIGRATIONS
+from storage import POSTGRES_MIGRATIONS, utc_timestamp
+
+
+def make_requests(storage, parent_id, count=3):
+    return storage.create_requests([(parent_id, 'Kid', '1', 'checkin', f'note {n}') for n in range(count)])
+
+
+def backdate(storage, request_ids, moment='2000-01-01 08:00:00'):
+    """Move requests into the past, as if created and answered long ago"""
+    with storage.connection() as conn:
+        for request_id in request_ids:
+            conn.execute('UPDATE requests SET created_at = ?, updated_at = ? WHERE id = ?',
+                         (moment, moment, request_id))
+        conn.commit()
+
+
+def test_migrations_match_between_backends(storage):
+    assert [version for version, _, _ in POSTGRES_MIGRATIONS] == [version for version, _, _ in MIGRATIONS]
+    assert storage.schema_version() == MIGRATIONS[-1][0]
+    assert storage.migrate() == []
+
+
+def test_accounts(storage):
+    user_id = storage.create_parent('a@example.com', 'A', 'x', child_name='Kid')
+    user = storage.find_user('a@example.com')
+    assert user['id'] == user_id and user['user_type'] == 'parent'
+    storage.update_password_hash('users', user_id, 'y')
+    assert storage.find_user('a@example.com')['password_hash'] == 'y'
+    with pytest.raises(ValueError):
+        storage.update_password_hash('requests', user_id, 'y')
+
+    admin_id = storage.create_admin('office', 'z')
+    assert storage.find_admin('office')['id'] == admin_id
+
+
+def test_children(storage, parent_id):
+    storage.add_child(parent_id, 'Kid Two', '3')
+    assert sorted(child['name'] for child in storage.list_children(parent_id)) == ['Kid', 'Kid Two']
+
+
+def test_create_requests(storage, parent_id):
+    first = storage.create_request((parent_id, 'Kid', '1', 'checkin', ''))
+    batch = make_requests(storage, parent_id, 2)
+    assert len(set(batch + [first])) == 3
+    rows = storage.requests_by_ids(batch)
+    assert {row['id'] for row in rows} == set(batch)
+    assert all(row['status'] == 'pending' and row['version'] > 0 for row in rows)
+
+
+def test_keyset_pages_and_filters(storage, parent_id):
+    request_ids = make_requests(storage, parent_id, 3)
+    storage.update_request(request_ids[0], 'approved', 'ok')
+
+    page, next_cursor = storage.list_requests('parent', parent_id, {}, limit=2)
+    rest, last_cursor = storage.list_requests('parent', parent_id, {}, next_cursor, 2)
+    assert len(page) == 2 and len(rest) == 1 and last_cursor is None
+    assert [row['id'] for row in page + rest] == sorted(request_ids, reverse=True)
+
+    approved, _ = storage.list_requests('parent', parent_id, {'status': 'approved'})
+    assert [row['id'] for row in approved] == [request_ids[0]]
+    other = storage.create_parent('b@example.com', 'B', 'x')
+    assert storage.list_requests('parent', other, {})[0] == []
+    assert len(storage.list_requests('admin', None, {})[0]) == 3
+
+
+def test_admin_listing_has_parent_details(storage, parent_id):
+    make_requests(storage, parent_id, 1)
+    rows, _ = storage.list_requests('admin', None, {})
+    assert rows[0]['parent_name'] == 'Test Parent' and rows[0]['parent_email'] == 'parent@example.com'
+
+
+def test_stream_rows_matches_listing(storage, parent_id):
+    make_requests(storage, parent_id, 5)
+    sql, params = storage.listing_query('parent', parent_id, {})
+    batches = list(storage.stream_rows(sql, params, 2))
+    assert [len(rows) for rows in batches] == [2, 2, 1]
+    listed, _ = storage.list_requests('parent', parent_id, {})
+    assert [row['id'] for rows in batches for row in rows] == [row['id'] for row in listed]
+
+
+def test_fields(storage, parent_id):
+    make_requests(storage, parent_id, 1)
+    narrow, _ = storage.list_requests('parent', parent_id, {}, fields=['status'])
+    assert set(narrow[0].keys()) == {'id', 'created_at', 'status'}
+    admin, _ = storage.list_requests('admin', None, {}, fields=['parent_name'])
+    assert set(admin[0].keys()) == {'id', 'created_at', 'parent_name'}
+
+
+def test_updates_and_deletes(storage, parent_id):
+    request_ids = make_requests(storage, parent_id, 3)
+    assert storage.update_request(request_ids[0], 'approved', 'ok')
+    assert not storage.update_request(-1, 'approved', 'ok')
+    assert storage.update_requests([(request_ids[1], 'rejected', ''), (-1, 'rejected', '')]) == {request_ids[1]}
+
+    other = storage.create_parent('b@example.com', 'B', 'x')
+    assert not storage.delete_request(request_ids[2], other)
+    assert storage.delete_request(request_ids[2], parent_id)
+    assert not storage.delete_request(request_ids[2], parent_id)
+    assert [row['request_id'] for row in storage.tombstones_by_ids([request_ids[2]])] == [request_ids[2]]
+
+
+def test_changes_since_version(storage, parent_id):
+    unchanged, updated, deleted = make_requests(storage, parent_id, 3)
+    version = storage.view_version('parent', parent_id)
+    created = storage.create_request((parent_id, 'Kid', '1', 'checkout', ''))
+    storage.update_request(updated, 'approved', 'ok')
+    storage.delete_request(deleted)
+
+    rows, deleted_ids = storage.request_changes('parent', parent_id, {}, 'version', version)
+    assert {row['id'] for row in rows} == {created, updated}
+    assert deleted_ids == [deleted]
+    assert storage.view_version('parent', parent_id) > version
+    assert storage.view_version('admin', None) >= storage.view_version('parent', parent_id)
+
+    latest = storage.view_version('parent', parent_id)
+    assert storage.request_changes('parent', parent_id, {}, 'version', latest) == ([], [])
+
+
+def test_parse_since(storage, parent_id):
+    make_requests(storage, parent_id, 1)
+    version = storage.view_version('parent', parent_id)
+    assert storage.parse_since(str(version), 7) == ('version', version)
+    assert storage.parse_since('2000-01-01T00:00:00Z', 7) is None
+    assert storage.parse_since('2999-01-01T02:00:00+02:00', 7) == ('timestamp', '2999-01-01 00:00:00')
+    for invalid in ('abc', '2024-13-01', '12:00'):
+        with pytest.raises(ValueError):
+            storage.parse_since(invalid, 7)
+
+
+def test_changes_since_timestamp(storage, parent_id):
+    request_ids = make_requests(storage, parent_id, 2)
+    backdate(storage, request_ids[:1])
+    rows, deleted = storage.request_changes('parent', parent_id, {}, 'timestamp', utc_timestamp(1))
+    assert [row['id'] for row in rows] == request_ids[1:] and deleted == []
+
+
+def test_prune_tombstones(storage, parent_id):
+    request_ids = make_requests(storage, parent_id, 2)
+    version = storage.view_version('parent', parent_id)
+    storage.delete_request(request_ids[0])
+    assert storage.prune_tombstones(7) == 0
+    with storage.connection() as conn:
+        conn.execute("UPDATE request_tombstones SET deleted_at = '2000-01-01 00:00:00'")
+        conn.commit()
+    assert storage.prune_tombstones(7) > version
+    assert storage.tombstones_by_ids([request_ids[0]]) == []
+    # A cursor from before the pruned deletes can no longer be answered with a delta
+    assert storage.parse_since(str(version), 7) is None
+
+
+def test_analytics(storage, parent_id):
+    request_ids = make_requests(storage, parent_id, 3)
+    storage.update_request(request_ids[0], 'approved', 'ok')
+    storage.delete_request(request_ids[2])
+    analytics = storage.analytics()
+    assert analytics['totals'] == {'requests': 2, 'parents': 1, 'pending': 1, 'approved': 1}
+    assert analytics['by_type'] == {'checkin': 2, 'checkout': 0}
+    assert [day['count'] for day in analytics['recent_activity']] == [2]
+
+
+def test_archive(storage, parent_id):
+    old_resolved, old_pending, recent = make_requests(storage, parent_id, 3)
+    storage.update_request(old_resolved, 'approved', 'ok')
+    backdate(storage, [old_resolved, old_pending])
+    before = storage.analytics()
+    version = storage.view_version('parent', parent_id)
+
+    assert storage.archive_requests(30) == 1
+    assert storage.archive_requests(30) == 0
+    assert storage.archive_stats()['live'] == 2 and storage.archive_stats()['archived'] == 1
+    assert storage.analytics()['totals'] == before['totals']
+
+    live, _ = storage.list_requests('parent', parent_id, {})
+    both, _ = storage.list_requests('parent', parent_id, {}, archive='include')
+    archived, _ = storage.list_requests('parent', parent_id, {}, archive='only')
+    assert [row['id'] for row in live] == [recent, old_pending]
+    assert [row['id'] for row in both] == [recent, old_pending, old_resolved]
+    assert [row['id'] for row in archived] == [old_resolved]
+    page, cursor = storage.list_requests('admin', None, {}, limit=2, archive='include')
+    rest, _ = storage.list_requests('admin', None, {}, cursor, 2, archive='include')
+    assert [row['id'] for row in page + rest] == [row['id'] for row in both]
+
+    # Pollers see the move as a delete; writes to the archived id change nothing
+    assert storage.request_changes('parent', parent_id, {}, 'version', version)[1] == [old_resolved]
+    assert storage.archived_ids([old_resolved, recent]) == {old_resolved}
+    assert storage.archived_ids([old_resolved], parent_id=-1) == set()
+    assert not storage.update_request(old_resolved, 'rejected', '')
+
+
+def test_rollups_survive_concurrent_writers(storage, parent_id):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def write(n):
+        request_id = storage.create_request((parent_id, 'Kid', '1', 'checkin', str(n)))
+        storage.update_request(request_id, 'approved' if n % 2 else 'rejected', '')
+        return request_id
+
+    version = storage.view_version('admin', None)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        request_ids = list(pool.map(write, range(40)))
+    totals = storage.analytics()['totals']
+    assert totals['requests'] == 40 and totals['approved'] == 20 and totals['pending'] == 0
+    rows, _ = storage.request_changes('admin', None, {}, 'version', version)
+    assert sorted(row['id'] for row in rows) == sorted(request_ids)
+
+
+
+def test_composed_listings_are_not_prepared(storage, parent_id):
+    if storage.backend != 'postgres':
+        pytest.skip('prepared statements are PostgreSQL only')
+    make_requests(storage, parent_id, 2)
+    with storage.connection() as conn:
+        for fields in (['status'], ['status', 'feedback'], ['request_type'], None):
+            sql, params = storage.listing_query('parent', parent_id, {}, fields=fields)
+            storage.execute_composed(conn, sql, params).fetchall()
+        conn.execute('SELECT id FROM requests WHERE parent_id = ?', (parent_id,)).fetchall()
+        prepared = [row['statement'] for row in conn.execute('SELECT statement FROM pg_prepared_statements')]
+    assert any('WHERE parent_id = $1' in statement for statement in prepared)
+    assert not any('ORDER BY' in statement for statement in prepared)
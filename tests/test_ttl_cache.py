@@ -0,0 +1,24 @@
+"""The in-process TTL cache"""
+
+from ttl_cache import TTLCache
+
+
+def test_set_after_invalidate_is_skipped():
+    cache = TTLCache(ttl=60)
+    generation = cache.generation
+    cache.invalidate('key')
+    cache.set('key', 'computed before the write', generation)
+    assert cache.get('key') is None and cache.stats()['stale_sets'] == 1
+
+    cache.set('key', 'fresh', cache.generation)
+    assert cache.get('key') == 'fresh'
+
+
+def test_expiry_and_eviction():
+    cache = TTLCache(ttl=60, max_entries=2)
+    for key in 'abc':
+        cache.set(key, key)
+    assert cache.get('a') is None and cache.get('c') == 'c'
+    cache.ttl = 0
+    cache.set('d', 'd')
+    assert cache.get('d') is None